@@ -0,0 +1,350 @@
+"""Application settings, loaded and validated once per process.
+
+The repo-root .env file is read a single time; variables already present in
+the process environment take precedence over it. Services call
+``get_settings()`` instead of reading ``os.getenv`` on every request.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Mapping
+
+from dotenv import load_dotenv
+
+ENV_PATH = Path(__file__).resolve().parents[1] / ".env"
+
+VECTOR_STORE_BACKENDS = ("pinecone", "memory")
+QUANTIZATION_MODES = ("none", "int8")
+EMBED_ENCODING_FORMATS = ("base64", "float")
+LLM_PRIORITY_CLASSES = ("interactive", "batch", "ingest")
+_TRUE_VALUES = {"1", "true", "yes", "on"}
+_FALSE_VALUES = {"0", "false", "no", "off"}
+
+
+def _clean(env: Mapping[str, str], name: str) -> str | None:
+    value = env.get(name)
+    if value is None:
+        return None
+    value = value.strip()
+    return value or None
+
+
+def _str(env: Mapping[str, str], name: str, default: str) -> str:
+    return _clean(env, name) or default
+
+
+def _choice(env: Mapping[str, str], name: str, default: str, allowed: tuple[str, ...]) -> str:
+    value = _str(env, name, default).lower()
+    if value not in allowed:
+        raise ValueError(f"{name} must be one of: {', '.join(allowed)}.")
+    return value
+
+
+def _int(env: Mapping[str, str], name: str, default: int | None, minimum: int = 1) -> int | None:
+    raw = _clean(env, name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError as exc:
+        raise ValueError(f"{name} must be an integer.") from exc
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}.")
+    return value
+
+
+def _float(
+    env: Mapping[str, str],
+    name: str,
+    default: float,
+    minimum: float | None = None,
+    maximum: float | None = None,
+) -> float:
+    raw = _clean(env, name)
+    if raw is None:
+        return default
+    try:
+        value = float(raw)
+    except ValueError as exc:
+        raise ValueError(f"{name} must be a number.") from exc
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise ValueError(f"{name} must be between {minimum} and {maximum}.")
+    return value
+
+
+def _optional_float(
+    env: Mapping[str, str], name: str, minimum: float, maximum: float
+) -> float | None:
+    if _clean(env, name) is None:
+        return None
+    return _float(env, name, 0.0, minimum, maximum)
+
+
+def _bool(env: Mapping[str, str], name: str, default: bool) -> bool:
+    raw = _clean(env, name)
+    if raw is None:
+        return default
+    if raw.lower() in _TRUE_VALUES:
+        return True
+    if raw.lower() in _FALSE_VALUES:
+        return False
+    raise ValueError(f"{name} must be true or false.")
+
+
+def _class_limits(
+    env: Mapping[str, str], name: str, default: tuple[tuple[str, int], ...]
+) -> tuple[tuple[str, int], ...]:
+    """Parse ``class=limit`` pairs, e.g. ``interactive=8,batch=2,ingest=2``."""
+    raw = _clean(env, name)
+    if raw is None:
+        return default
+    limits: dict[str, int] = dict(default)
+    for part in raw.split(","):
+        key, sep, value = part.partition("=")
+        key = key.strip().lower()
+        if not sep or key not in LLM_PRIORITY_CLASSES:
+            raise ValueError(f"{name} must be comma-separated class=limit pairs for: {', '.join(LLM_PRIORITY_CLASSES)}.")
+        try:
+            limits[key] = int(value)
+        except ValueError as exc:
+            raise ValueError(f"{name} limits must be integers.") from exc
+        if limits[key] < 1:
+            raise ValueError(f"{name} limits must be at least 1.")
+    return tuple(limits.items())
+
+
+def _shards(env: Mapping[str, str], name: str) -> tuple[tuple[str, str | None], ...]:
+    """Parse ``name`` or ``name=index`` entries, e.g. ``eu=legal-eu,us=legal-us``."""
+    raw = _clean(env, name)
+    if raw is None:
+        return ()
+    shards: dict[str, str | None] = {}
+    for part in raw.split(","):
+        shard, _, target = part.partition("=")
+        shard = shard.strip()
+        if not shard or shard in shards:
+            raise ValueError(f"{name} must list unique shard names, optionally as name=index.")
+        shards[shard] = target.strip() or None
+    return tuple(shards.items())
+
+
+def _path(env: Mapping[str, str], name: str) -> Path | None:
+    raw = _clean(env, name)
+    return Path(raw) if raw else None
+
+
+@dataclass(frozen=True)
+class Settings:
+    # OpenAI-compatible LLM + embeddings
+    openai_api_key: str | None = None
+    openai_model: str = "gpt-4o-mini"
+    openai_api_base: str = "https://api.openai.com/v1/chat/completions"
+    openai_embed_api_base: str = "https://api.openai.com/v1/embeddings"
+    openai_embed_model: str = "text-embedding-3-small"
+    openai_embed_encoding_format: str = "base64"
+    embedding_dim: int | None = None
+
+    # Model routing: small/large tiers (no large model = route everything small)
+    llm_small_model: str | None = None
+    llm_large_model: str | None = None
+    router_large_prompt_chars: int = 12_000
+    router_max_error_rate: float = 0.5
+
+    # Vector store
+    vector_store_backend: str = "pinecone"
+    vector_quantization: str = "none"
+    memory_index_seed_dir: Path | None = None
+    memory_index_snapshot: Path | None = None
+    pinecone_api_key: str | None = None
+    pinecone_index: str | None = None
+    pinecone_host: str | None = None
+    vector_shards: tuple[tuple[str, str | None], ...] = ()
+    shard_timeout_seconds: float = 2.0
+
+    # Ingest deduplication (DEDUP_DB_PATH=":memory:" keeps the registry per process)
+    dedup_enabled: bool = True
+    dedup_db_path: str = ":memory:"
+    # Near-duplicate merging is opt-in: one changed word can flip a legal clause.
+    dedup_near_enabled: bool = False
+    dedup_min_similarity: float = 0.95
+
+    # Retrieval
+    min_relevance_score: float = 0.35
+    min_match_score: float | None = None
+    max_score_gap: float = 0.15
+    score_cluster_spread: float = 0.05
+    retrieval_max_top_k: int = 10
+    hierarchical_top_docs: int = 0
+    rag_doc_root: Path | None = None
+    chunk_store_path: Path | None = None
+    chunk_store_max_bytes: int = 64 * 1024 * 1024
+    chunk_window_max: int = 5
+
+    # Request coalescing and caching
+    single_flight_enabled: bool = True
+    retrieval_cache_size: int = 1000
+    retrieval_cache_db: str | None = None
+    retrieval_cache_db_max_entries: int = 10_000
+    rewrite_cache_size: int = 5000
+
+    # LLM scheduling and admission control (0 disables a rate limit)
+    llm_max_concurrency: int = 8
+    llm_class_limits: tuple[tuple[str, int], ...] = (("interactive", 8), ("batch", 2), ("ingest", 2))
+    llm_requests_per_minute: int = 500
+    llm_tokens_per_minute: int = 200_000
+    llm_max_queue_depth: int = 64
+    llm_queue_timeout_seconds: float = 30.0
+    threadpool_size: int = 0
+
+    # Deadlines, retries, hedging and circuit breaking for upstream calls
+    request_deadline_seconds: float = 20.0
+    rewrite_deadline_seconds: float = 120.0
+    llm_timeout_seconds: float = 15.0
+    embed_timeout_seconds: float = 30.0
+    upstream_max_attempts: int = 3
+    hedge_requests: bool = False
+    hedge_percentile: float = 95.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30.0
+
+    # Process pool for CPU-bound DOCX work (workers: None = min(4, cores / web workers), 0 = inline)
+    cpu_pool_workers: int | None = None
+    # Web worker processes on this host; set by gunicorn.conf.py so per-worker pools share the cores.
+    web_concurrency: int = 1
+    cpu_pool_max_queue: int = 16
+    cpu_pool_max_tasks_per_child: int = 200
+    cpu_pool_min_bytes: int = 256 * 1024
+
+    # Session-scoped Q&A over uploaded documents (in process memory only)
+    session_ttl_seconds: float = 1800.0
+    session_max_sessions: int = 100
+    session_max_bytes: int = 256 * 1024 * 1024
+    session_max_chunks: int = 2000
+    session_store_path: Path | None = None
+
+    # Batch rewrite (POST /api/rewrite/batch); concurrency is shared by all batches
+    batch_rewrite_concurrency: int = 2
+    batch_rewrite_max_files: int = 50
+    batch_rewrite_max_bytes: int = 100 * 1024 * 1024
+
+    # Profiling and admin endpoints (admin endpoints are disabled without a token)
+    admin_token: str | None = None
+    profile_sample_rate: float = 0.0
+    profile_dir: Path | None = None
+    profile_interval_ms: int = 5
+    profile_max_concurrent: int = 2
+    profile_max_artifacts: int = 50
+    tracemalloc_frames: int = 1
+
+    # Startup
+    warmup_on_startup: bool = True
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> "Settings":
+        """Build settings from a mapping; raises ValueError on invalid values."""
+        return cls(
+            openai_api_key=_clean(env, "OPENAI_API_KEY"),
+            openai_model=_str(env, "OPENAI_MODEL", cls.openai_model),
+            openai_api_base=_str(env, "OPENAI_API_BASE", cls.openai_api_base),
+            openai_embed_api_base=_str(env, "OPENAI_EMBED_API_BASE", cls.openai_embed_api_base),
+            openai_embed_model=_str(env, "OPENAI_EMBED_MODEL", cls.openai_embed_model),
+            openai_embed_encoding_format=_choice(
+                env, "OPENAI_EMBED_ENCODING_FORMAT", cls.openai_embed_encoding_format, EMBED_ENCODING_FORMATS
+            ),
+            embedding_dim=_int(env, "EMBEDDING_DIM", None),
+            llm_small_model=_clean(env, "LLM_SMALL_MODEL"),
+            llm_large_model=_clean(env, "LLM_LARGE_MODEL"),
+            router_large_prompt_chars=_int(env, "ROUTER_LARGE_PROMPT_CHARS", cls.router_large_prompt_chars),
+            router_max_error_rate=_float(env, "ROUTER_MAX_ERROR_RATE", cls.router_max_error_rate, 0.0, 1.0),
+            vector_store_backend=_choice(
+                env, "VECTOR_STORE_BACKEND", cls.vector_store_backend, VECTOR_STORE_BACKENDS
+            ),
+            vector_quantization=_choice(env, "VECTOR_QUANTIZATION", cls.vector_quantization, QUANTIZATION_MODES),
+            memory_index_seed_dir=_path(env, "MEMORY_INDEX_SEED_DIR"),
+            memory_index_snapshot=_path(env, "MEMORY_INDEX_SNAPSHOT"),
+            pinecone_api_key=_clean(env, "PINECONE_API_KEY"),
+            pinecone_index=_clean(env, "PINECONE_INDEX"),
+            pinecone_host=_clean(env, "PINECONE_HOST"),
+            vector_shards=_shards(env, "VECTOR_SHARDS"),
+            shard_timeout_seconds=_float(env, "SHARD_TIMEOUT_SECONDS", cls.shard_timeout_seconds, 0.01, 600.0),
+            dedup_enabled=_bool(env, "DEDUP_ENABLED", cls.dedup_enabled),
+            dedup_db_path=_str(env, "DEDUP_DB_PATH", cls.dedup_db_path),
+            dedup_near_enabled=_bool(env, "DEDUP_NEAR_ENABLED", cls.dedup_near_enabled),
+            dedup_min_similarity=_float(env, "DEDUP_MIN_SIMILARITY", cls.dedup_min_similarity, 0.5, 1.0),
+            min_relevance_score=_float(env, "MIN_RELEVANCE_SCORE", cls.min_relevance_score, 0.0, 1.0),
+            min_match_score=_optional_float(env, "MIN_MATCH_SCORE", 0.0, 1.0),
+            max_score_gap=_float(env, "MAX_SCORE_GAP", cls.max_score_gap, 0.0, 2.0),
+            score_cluster_spread=_float(env, "SCORE_CLUSTER_SPREAD", cls.score_cluster_spread, 0.0, 2.0),
+            retrieval_max_top_k=_int(env, "RETRIEVAL_MAX_TOP_K", cls.retrieval_max_top_k),
+            hierarchical_top_docs=_int(env, "HIERARCHICAL_TOP_DOCS", cls.hierarchical_top_docs, minimum=0),
+            rag_doc_root=_path(env, "RAG_DOC_ROOT"),
+            chunk_store_path=_path(env, "CHUNK_STORE_PATH"),
+            chunk_store_max_bytes=_int(env, "CHUNK_STORE_MAX_BYTES", cls.chunk_store_max_bytes),
+            chunk_window_max=_int(env, "CHUNK_WINDOW_MAX", cls.chunk_window_max, minimum=0),
+            single_flight_enabled=_bool(env, "SINGLE_FLIGHT_ENABLED", cls.single_flight_enabled),
+            retrieval_cache_size=_int(env, "RETRIEVAL_CACHE_SIZE", cls.retrieval_cache_size, minimum=0),
+            retrieval_cache_db=_clean(env, "RETRIEVAL_CACHE_DB"),
+            retrieval_cache_db_max_entries=_int(
+                env, "RETRIEVAL_CACHE_DB_MAX_ENTRIES", cls.retrieval_cache_db_max_entries
+            ),
+            rewrite_cache_size=_int(env, "REWRITE_CACHE_SIZE", cls.rewrite_cache_size, minimum=0),
+            llm_max_concurrency=_int(env, "LLM_MAX_CONCURRENCY", cls.llm_max_concurrency),
+            llm_class_limits=_class_limits(env, "LLM_CLASS_LIMITS", cls.llm_class_limits),
+            llm_requests_per_minute=_int(env, "LLM_RPM", cls.llm_requests_per_minute, minimum=0),
+            llm_tokens_per_minute=_int(env, "LLM_TPM", cls.llm_tokens_per_minute, minimum=0),
+            llm_max_queue_depth=_int(env, "LLM_MAX_QUEUE_DEPTH", cls.llm_max_queue_depth, minimum=0),
+            llm_queue_timeout_seconds=_float(env, "LLM_QUEUE_TIMEOUT_SECONDS", cls.llm_queue_timeout_seconds, 0.1, 600.0),
+            threadpool_size=_int(env, "THREADPOOL_SIZE", cls.threadpool_size, minimum=0),
+            request_deadline_seconds=_float(
+                env, "REQUEST_DEADLINE_SECONDS", cls.request_deadline_seconds, 0.1, 3600.0
+            ),
+            rewrite_deadline_seconds=_float(
+                env, "REWRITE_DEADLINE_SECONDS", cls.rewrite_deadline_seconds, 0.1, 3600.0
+            ),
+            llm_timeout_seconds=_float(env, "LLM_TIMEOUT_SECONDS", cls.llm_timeout_seconds, 0.1, 600.0),
+            embed_timeout_seconds=_float(env, "EMBED_TIMEOUT_SECONDS", cls.embed_timeout_seconds, 0.1, 600.0),
+            upstream_max_attempts=_int(env, "UPSTREAM_MAX_ATTEMPTS", cls.upstream_max_attempts),
+            hedge_requests=_bool(env, "HEDGE_REQUESTS", cls.hedge_requests),
+            hedge_percentile=_float(env, "HEDGE_PERCENTILE", cls.hedge_percentile, 50.0, 99.9),
+            circuit_failure_threshold=_int(env, "CIRCUIT_FAILURE_THRESHOLD", cls.circuit_failure_threshold),
+            circuit_reset_seconds=_float(env, "CIRCUIT_RESET_SECONDS", cls.circuit_reset_seconds, 0.1, 3600.0),
+            cpu_pool_workers=_int(env, "CPU_POOL_WORKERS", None, minimum=0),
+            web_concurrency=_int(env, "WEB_CONCURRENCY", cls.web_concurrency),
+            cpu_pool_max_queue=_int(env, "CPU_POOL_MAX_QUEUE", cls.cpu_pool_max_queue, minimum=0),
+            cpu_pool_max_tasks_per_child=_int(
+                env, "CPU_POOL_MAX_TASKS_PER_CHILD", cls.cpu_pool_max_tasks_per_child
+            ),
+            cpu_pool_min_bytes=_int(env, "CPU_POOL_MIN_BYTES", cls.cpu_pool_min_bytes, minimum=0),
+            session_ttl_seconds=_float(env, "SESSION_TTL_SECONDS", cls.session_ttl_seconds, 1.0, 86400.0),
+            session_max_sessions=_int(env, "SESSION_MAX_SESSIONS", cls.session_max_sessions),
+            session_max_bytes=_int(env, "SESSION_MAX_BYTES", cls.session_max_bytes),
+            session_max_chunks=_int(env, "SESSION_MAX_CHUNKS", cls.session_max_chunks),
+            session_store_path=_path(env, "SESSION_STORE_PATH"),
+            batch_rewrite_concurrency=_int(env, "BATCH_REWRITE_CONCURRENCY", cls.batch_rewrite_concurrency),
+            batch_rewrite_max_files=_int(env, "BATCH_REWRITE_MAX_FILES", cls.batch_rewrite_max_files),
+            batch_rewrite_max_bytes=_int(env, "BATCH_REWRITE_MAX_BYTES", cls.batch_rewrite_max_bytes),
+            admin_token=_clean(env, "ADMIN_TOKEN"),
+            profile_sample_rate=_float(env, "PROFILE_SAMPLE_RATE", cls.profile_sample_rate, 0.0, 1.0),
+            profile_dir=_path(env, "PROFILE_DIR"),
+            profile_interval_ms=_int(env, "PROFILE_INTERVAL_MS", cls.profile_interval_ms),
+            profile_max_concurrent=_int(env, "PROFILE_MAX_CONCURRENT", cls.profile_max_concurrent, minimum=0),
+            profile_max_artifacts=_int(env, "PROFILE_MAX_ARTIFACTS", cls.profile_max_artifacts),
+            tracemalloc_frames=_int(env, "TRACEMALLOC_FRAMES", cls.tracemalloc_frames),
+            warmup_on_startup=_bool(env, "WARMUP_ON_STARTUP", cls.warmup_on_startup),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings once; later calls return the cached instance."""
+    load_dotenv(ENV_PATH)
+    return Settings.from_env(os.environ)
+
+
+def reload_settings() -> Settings:
+    """Drop the cached settings and read the environment again."""
+    get_settings.cache_clear()
+    return get_settings()
@@ -1,22 +1,171 @@
 from __future__ import annotations
 
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
 
 import re
-import tempfile
 
-from fastapi import BackgroundTasks, FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse
+import anyio.to_thread
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.services import document_parser, doc_qa_service, docx_writer, file_store, qa_service, rewrite_service
+from app.config import get_settings
+from app.services import (
+    batch_rewrite,
+    chunk_store,
+    cpu_pool,
+    doc_qa_service,
+    file_store,
+    http_client,
+    ingest_service,
+    llm_scheduler,
+    metrics,
+    profiler,
+    qa_service,
+    resilience,
+    rewrite_service,
+    session_store,
+    vector_store,
+)
+from app.services.cpu_pool import CPUPoolBusyError
+from app.services.llm_gateway import LLMCallFailedError
+from app.services.llm_scheduler import SchedulerOverloadedError
+from app.services.resilience import CircuitOpenError, DeadlineExceeded
 
 from uuid import uuid4
 
-app = FastAPI(title="legal-rewrite-qa")
+logger = logging.getLogger(__name__)
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# Client-supplied request IDs are reused only when they are safe as file names.
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+_PROFILE_FORMATS = {"svg": "image/svg+xml", "folded": "text/plain"}
+
+
+def _warm_up() -> None:
+    """Import heavy SDKs and pre-create clients before the first request."""
+    started = time.perf_counter()
+    http_client.get_session()
+    importlib.import_module("docx")
+    if vector_store.is_configured():
+        try:
+            vector_store.get_index()
+        except Exception as exc:  # Startup must not fail on an unreachable vector store
+            logger.warning("Vector store warm-up failed: %s", exc)
+    logger.info("Warm-up finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def _purge_sessions() -> None:
+    # Shared session rows hold uploaded document text; do not leave expired ones on disk.
+    try:
+        session_store.get_store().purge_expired()
+    except Exception as exc:  # A failed sweep is retried on the next tick
+        logger.warning("Session purge failed: %s", exc)
+
+
+async def _purge_sessions_periodically() -> None:
+    while True:
+        await asyncio.sleep(session_store.PURGE_INTERVAL_SECONDS)
+        await run_in_threadpool(_purge_sessions)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Validates configuration once, so bad settings fail at boot, not per request.
+    settings = get_settings()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = llm_scheduler.threadpool_size(settings)
+    if settings.warmup_on_startup:
+        await run_in_threadpool(_warm_up)
+    sweeper = asyncio.create_task(_purge_sessions_periodically())
+    yield
+    sweeper.cancel()
+    await run_in_threadpool(_purge_sessions)
+    cpu_pool.shutdown()
+
+
+app = FastAPI(title="legal-rewrite-qa", lifespan=lifespan)
 app_state = {"mode": "normal"}
 
+
+# Raised by the LLM/embedding path; mapped to status codes below rather than
+# being reported as generic service failures.
+UPSTREAM_ERRORS = (SchedulerOverloadedError, CircuitOpenError, CPUPoolBusyError, DeadlineExceeded, LLMCallFailedError)
+
+
+@app.exception_handler(SchedulerOverloadedError)
+@app.exception_handler(CircuitOpenError)
+@app.exception_handler(CPUPoolBusyError)
+async def upstream_unavailable(
+    _request: Request, exc: SchedulerOverloadedError | CircuitOpenError | CPUPoolBusyError
+):
+    # Shed load instead of queueing without bound; clients back off and retry.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(LLMCallFailedError)
+async def llm_call_failed(_request: Request, exc: LLMCallFailedError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(_request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Tag every request with an ID and profile the sampled or flagged ones."""
+    incoming = request.headers.get("X-Request-ID", "")
+    request_id = incoming if _REQUEST_ID_RE.match(incoming) else uuid4().hex
+    profiler.set_request_id(request_id)
+    requested = bool(request.headers.get("X-Profile")) and profiler.admin_authorized(
+        request.headers.get("X-Admin-Token")
+    )
+    profile = profiler.start(request_id) if profiler.should_profile(requested) else None
+    try:
+        response = await call_next(request)
+    finally:
+        if profile is not None:
+            await run_in_threadpool(profiler.finish, profile)
+    response.headers["X-Request-ID"] = request_id
+    if profile is not None:
+        response.headers["X-Profile-Id"] = request_id
+    return response
+
+
+async def _run_with_deadline(seconds: float, fn, /, *args, **kwargs):
+    """Run a blocking service call in the threadpool under a request deadline."""
+    profile = profiler.current_profile()
+
+    def call():
+        with resilience.deadline_scope(seconds), profiler.attach(profile):
+            return fn(*args, **kwargs)
+
+    return await run_in_threadpool(call)
+
+
+def _require_admin(request: Request) -> None:
+    if not get_settings().admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.admin_authorized(request.headers.get("X-Admin-Token")):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
 @app.post("/api/mode/{new_mode}")
 async def set_mode(new_mode: str):
     app_state["mode"] = new_mode
@@ -34,6 +183,34 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/api/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+
+@app.get("/api/admin/profiles/{request_id}")
+async def get_profile(request_id: str, request: Request, format: str = "svg"):
+    _require_admin(request)
+    if format not in _PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(_PROFILE_FORMATS)}.")
+    path = profiler.artifact_path(request_id, format) if _REQUEST_ID_RE.match(request_id) else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="No profile for this request ID.")
+    return FileResponse(path, media_type=_PROFILE_FORMATS[format])
+
+
+@app.post("/api/admin/memory/snapshot")
+async def memory_snapshot(request: Request, limit: int = 25):
+    _require_admin(request)
+    return await run_in_threadpool(profiler.memory_snapshot, max(1, min(limit, 200)))
+
+
+@app.delete("/api/admin/memory/snapshot")
+async def stop_memory_tracing(request: Request):
+    _require_admin(request)
+    return await run_in_threadpool(profiler.stop_memory_tracing)
+
+
 @app.post("/api/document")
 async def create_document():
     document_id = str(uuid4())
@@ -54,60 +231,187 @@ async def ask_question(payload: QARequest):
     if not payload.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
-    answer = qa_service.answer_question(payload.question.strip())
+    # Service calls block on network I/O, so they run in the threadpool; this
+    # also lets concurrent duplicates overlap and be coalesced.
+    answer = await _run_with_deadline(
+        get_settings().request_deadline_seconds, qa_service.answer_question, payload.question.strip()
+    )
     return {"answer": answer}
 
 
+class DocQARequest(QARequest):
+    session_id: Optional[str] = Field(None, max_length=64)
+
+
 @app.post("/api/doc_qa")
-async def doc_qa(payload: QARequest):
+async def doc_qa(payload: DocQARequest):
     if not payload.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
     try:
-        result = doc_qa_service.answer_question(payload.question.strip())
+        result = await _run_with_deadline(
+            get_settings().request_deadline_seconds,
+            doc_qa_service.answer_question,
+            payload.question.strip(),
+            session_id=payload.session_id,
+        )
         return result
+    except session_store.SessionNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Doc Q&A failed: {exc}")
 
 
+@app.post("/api/sessions")
+async def create_session(file: UploadFile = File(...)):
+    """Upload a DOCX for session-scoped Q&A; nothing is written to the shared index."""
+    try:
+        data = await run_in_threadpool(file_store.read_upload_bytes, file)
+        # Embedding a whole document takes longer than a question, so it gets
+        # the document-sized deadline.
+        session = await _run_with_deadline(
+            get_settings().rewrite_deadline_seconds, session_store.create_session, file.filename, data
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {
+        "session_id": session.session_id,
+        "filename": session.filename,
+        "chunk_count": len(session.chunks),
+        "ttl_seconds": get_settings().session_ttl_seconds,
+    }
+
+
+@app.delete("/api/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    if not session_store.get_store().delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {part.strip().removeprefix("W/") for part in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+@app.get("/api/chunks/{chunk_id}")
+async def get_chunk(chunk_id: str, request: Request, window: int = 0):
+    """A stored chunk plus `window` neighbours on each side, revalidated by ETag."""
+    max_window = get_settings().chunk_window_max
+    if not 0 <= window <= max_window:
+        raise HTTPException(status_code=400, detail=f"window must be between 0 and {max_window}.")
+    headers = {"Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("If-None-Match")
+    try:
+        etag = await run_in_threadpool(chunk_store.current_etag, chunk_id, window)
+        if etag and _etag_matches(if_none_match, etag):
+            metrics.incr("chunks.not_modified")
+            return Response(status_code=304, headers={**headers, "ETag": etag})
+        found = await _run_with_deadline(
+            get_settings().request_deadline_seconds, chunk_store.get_window, chunk_id, window
+        )
+    except ValueError:
+        found = None
+    if found is None:
+        raise HTTPException(status_code=404, detail="Chunk not found.")
+    body, etag = found
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    return JSONResponse(body, headers={**headers, "ETag": etag})
+
+
+@app.delete("/api/admin/documents/{doc_id}")
+async def delete_document(doc_id: str, request: Request):
+    """Remove an ingested document's vectors and stored chunk text."""
+    _require_admin(request)
+    deleted = await _run_with_deadline(
+        get_settings().request_deadline_seconds, ingest_service.delete_document, doc_id
+    )
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return deleted
+
+
+def _iter_bytes(data: bytes, chunk_size: int = 64 * 1024):
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start : start + chunk_size]
+
+
+def _parse_goals(goals: Optional[str]) -> list[str]:
+    return [part for part in re.split(r"[,\n]", goals or "") if part.strip()]
+
+
 @app.post("/api/rewrite")
 async def rewrite_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     notes: Optional[str] = Form(None),
     goals: Optional[str] = Form(None),
 ):
-    # Accept only DOCX, with size/type validation and temp cleanup.
-    tmp_path: Optional[Path] = None
+    # Accept only DOCX, with size/type validation; the upload and the
+    # rewritten package stay in memory, so there are no temp files to clean up.
     try:
-        tmp_path = file_store.save_upload_to_temp(file)
-        extracted_text = document_parser.extract_text_from_docx(tmp_path)
-        if not extracted_text.strip():
-            raise HTTPException(status_code=400, detail="No text found in the document.")
-        document_id = "demo-doc-1"
-        parsed_goals = [part for part in re.split(r"[,\n]", goals or "") if part.strip()]
-        rewritten_text = rewrite_service.rewrite_document(
-            document_id=document_id,
-            text=extracted_text,
-            goals=parsed_goals,
+        data = await run_in_threadpool(file_store.read_upload_bytes, file)
+        rewrite = await _run_with_deadline(
+            get_settings().rewrite_deadline_seconds,
+            rewrite_service.rewrite_docx,
+            document_id=rewrite_service.document_id_for(data),
+            data=data,
+            goals=_parse_goals(goals),
             notes=notes,
         )
-        output_file = tempfile.NamedTemporaryFile(delete=False, suffix=".docx")
-        output_path = Path(output_file.name)
-        output_file.close()
-        docx_writer.write_docx(rewritten_text, output_path)
-        background_tasks.add_task(output_path.unlink, missing_ok=True)
-        return FileResponse(
-            output_path,
-            media_type=(
-                "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            ),
-            filename="rewritten.docx",
-        )
+    except rewrite_service.RewriteInProgressError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    finally:
-        # Always delete temp file, regardless of success or failure.
-        if tmp_path and tmp_path.exists():
-            tmp_path.unlink(missing_ok=True)
+    return StreamingResponse(
+        _iter_bytes(rewrite.data),
+        media_type=DOCX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": 'attachment; filename="rewritten.docx"',
+            "Content-Length": str(len(rewrite.data)),
+            "X-Rewrite-Cache-Hits": str(rewrite.cache_hits),
+            "X-Rewrite-Cache-Misses": str(rewrite.cache_misses),
+            # Paragraphs the model did not return; they keep their original text.
+            "X-Rewrite-Unchanged": str(rewrite.unchanged),
+        },
+    )
+
+
+@app.post("/api/rewrite/batch")
+async def rewrite_batch(
+    files: list[UploadFile] = File(...),
+    notes: Optional[str] = Form(None),
+    goals: Optional[str] = Form(None),
+):
+    """Rewrite many DOCX files (or zips of them) and stream back a zip with a manifest."""
+    settings = get_settings()
+    try:
+        parsed_goals, cleaned_notes = rewrite_service.validate_options(_parse_goals(goals), notes)
+        uploads = []
+        # One byte budget for the whole request, not per upload.
+        budget = settings.batch_rewrite_max_bytes
+        for upload in files:
+            if budget <= 0:
+                raise ValueError(batch_rewrite.BATCH_TOO_LARGE)
+            max_bytes = budget if file_store.is_archive(upload.filename) else file_store.DEFAULT_MAX_BYTES
+            data = await run_in_threadpool(file_store.read_upload_bytes, upload, max_bytes, True)
+            budget -= len(data)
+            if budget < 0:
+                raise ValueError(batch_rewrite.BATCH_TOO_LARGE)
+            uploads.append((upload.filename, data))
+        batch = await run_in_threadpool(batch_rewrite.prepare, uploads)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return StreamingResponse(
+        batch_rewrite.stream_zip(batch, parsed_goals, cleaned_notes),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": 'attachment; filename="rewritten.zip"',
+            "X-Batch-Documents": str(len(batch.files)),
+        },
+    )
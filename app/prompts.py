@@ -7,6 +7,10 @@ PERSONA_PROMPT = (
     "documents; respond only to the user's question."
 )
 
+# Bump whenever REWRITE_PROMPT or the rewrite prompt layout changes, so
+# cached paragraph rewrites produced by the old wording are not reused.
+REWRITE_PROMPT_VERSION = "1"
+
 REWRITE_PROMPT = (
     "You are a careful legal drafting assistant. Rewrite the provided text to improve "
     "clarity, grammar, and structure while preserving meaning. Do not invent facts, "
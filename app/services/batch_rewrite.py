@@ -0,0 +1,296 @@
+"""Batch rewrite: many DOCX files (or a zip of them) in, one streamed zip out.
+
+Each document is locked under its content-derived ID and the requested goals,
+so unrelated documents never wait on each other while two identical rewrites
+still conflict; byte-identical files within one batch are rewritten once.
+Documents run in parallel on a pool shared by every batch
+(BATCH_REWRITE_CONCURRENCY), and each rewritten file is written to the
+response as soon as it finishes, so a folder takes about as long as its
+slowest document. The archive ends with manifest.json: one entry per input
+file with its status and, for failures or skipped files, the error; rewritten
+files also report how many paragraphs the model left unchanged.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+from typing import Any, AsyncIterator
+
+from app.config import get_settings
+from app.services import file_store, metrics, resilience, rewrite_service
+from app.services.cpu_pool import CPUPoolBusyError
+from app.services.llm_gateway import LLMCallFailedError
+from app.services.llm_scheduler import SchedulerOverloadedError
+from app.services.resilience import CircuitOpenError, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+STATUS_REWRITTEN = "rewritten"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+BATCH_TOO_LARGE = "Batch too large; split the documents across several requests."
+# Errors worth showing the client verbatim; anything else is logged and reported generically.
+_REPORTED_ERRORS = (
+    ValueError,
+    DeadlineExceeded,
+    SchedulerOverloadedError,
+    CircuitOpenError,
+    CPUPoolBusyError,
+    LLMCallFailedError,
+)
+
+
+@dataclass(frozen=True)
+class BatchFile:
+    name: str
+    data: bytes
+
+
+@dataclass(frozen=True)
+class Batch:
+    files: list[BatchFile]
+    skipped: list[dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    name: str
+    document_id: str
+    data: bytes | None = None
+    error: str | None = None
+    cache_hits: int = 0
+    cache_misses: int = 0
+    unchanged: int = 0
+    seconds: float = 0.0
+
+    def manifest_entry(self) -> dict[str, Any]:
+        entry: dict[str, Any] = {"name": self.name, "document_id": self.document_id}
+        if self.error is None:
+            entry.update(
+                status=STATUS_REWRITTEN,
+                cache_hits=self.cache_hits,
+                cache_misses=self.cache_misses,
+                unchanged=self.unchanged,
+            )
+        else:
+            entry.update(status=STATUS_FAILED, error=self.error)
+        entry["seconds"] = round(self.seconds, 3)
+        return entry
+
+
+@lru_cache(maxsize=1)
+def get_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=get_settings().batch_rewrite_concurrency, thread_name_prefix="batch-rewrite"
+    )
+
+
+def _skipped(name: str, error: str) -> dict[str, Any]:
+    return {"name": name, "status": STATUS_SKIPPED, "error": error}
+
+
+def _unique_name(name: str, taken: set[str]) -> str:
+    candidate, number = name, 1
+    while candidate.lower() in taken:
+        number += 1
+        candidate = f"{Path(name).stem} ({number}){Path(name).suffix}"
+    taken.add(candidate.lower())
+    return candidate
+
+
+def _too_many(max_files: int) -> ValueError:
+    return ValueError(f"Too many files; a batch may hold at most {max_files}.")
+
+
+def _expand_archive(
+    data: bytes, max_files: int, max_bytes: int
+) -> tuple[list[tuple[str, bytes]], list[dict[str, Any]]]:
+    """DOCX entries of a zip; other entries are reported as skipped.
+
+    `max_files` and `max_bytes` are what is left of the batch caps. They are
+    enforced while expanding, so a zip bomb fails after at most `max_bytes`
+    of decompressed data instead of being inflated in full first.
+    """
+    try:
+        archive = zipfile.ZipFile(BytesIO(data))
+    except zipfile.BadZipFile as exc:
+        raise ValueError("Invalid zip archive.") from exc
+    entries: list[tuple[str, bytes]] = []
+    skipped: list[dict[str, Any]] = []
+    limit = file_store.DEFAULT_MAX_BYTES
+    too_large = f"File too large; max allowed is {limit / (1024 * 1024):g} MB."
+    remaining = max_bytes
+    with archive:
+        for info in archive.infolist():
+            # Keep only the base name: entry paths are never used on disk.
+            name = PurePosixPath(info.filename).name
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or name.startswith("."):
+                continue
+            if Path(name).suffix.lower() not in file_store.ALLOWED_EXTENSIONS:
+                skipped.append(_skipped(name, "Unsupported file type; only .docx files are rewritten."))
+                continue
+            if info.file_size > limit:
+                skipped.append(_skipped(name, too_large))
+                continue
+            if len(entries) >= max_files:
+                raise _too_many(get_settings().batch_rewrite_max_files)
+            if info.file_size > remaining:
+                raise ValueError(BATCH_TOO_LARGE)
+            # Declared sizes can lie; read at most one byte past whichever cap is lower.
+            with archive.open(info) as handle:
+                content = handle.read(min(limit, remaining) + 1)
+            if len(content) > limit:
+                skipped.append(_skipped(name, too_large))
+                continue
+            if len(content) > remaining:
+                raise ValueError(BATCH_TOO_LARGE)
+            remaining -= len(content)
+            entries.append((name, content))
+    return entries, skipped
+
+
+def prepare(uploads: list[tuple[str, bytes]]) -> Batch:
+    """Expand zips, give every file a unique output name and enforce the batch caps.
+
+    Raises ValueError for problems with the batch as a whole (bad zip, no DOCX
+    files, too many files or bytes); per-file problems are reported as skipped.
+    """
+    settings = get_settings()
+    entries: list[tuple[str, bytes]] = []
+    skipped: list[dict[str, Any]] = []
+    total = 0
+    for filename, data in uploads:
+        if file_store.is_archive(filename):
+            expanded, rejected = _expand_archive(
+                data,
+                settings.batch_rewrite_max_files - len(entries),
+                settings.batch_rewrite_max_bytes - total,
+            )
+            skipped.extend(rejected)
+        else:
+            expanded = [(PurePosixPath(filename).name, data)]
+        entries.extend(expanded)
+        total += sum(len(content) for _, content in expanded)
+        if len(entries) > settings.batch_rewrite_max_files:
+            raise _too_many(settings.batch_rewrite_max_files)
+        if total > settings.batch_rewrite_max_bytes:
+            raise ValueError(BATCH_TOO_LARGE)
+
+    if not entries:
+        raise ValueError("No .docx files found in the upload.")
+
+    taken: set[str] = {MANIFEST_NAME}
+    files = [BatchFile(_unique_name(name, taken), data) for name, data in entries]
+    return Batch(files=files, skipped=skipped)
+
+
+def rewrite_file(file: BatchFile, goals: list[str], notes: str | None) -> BatchResult:
+    """Rewrite one document under its own lock and deadline; never raises."""
+    started = time.perf_counter()
+    document_id = rewrite_service.document_id_for(file.data)
+    try:
+        with resilience.deadline_scope(get_settings().rewrite_deadline_seconds):
+            rewrite = rewrite_service.rewrite_docx(document_id, file.data, goals=goals, notes=notes)
+    except _REPORTED_ERRORS as exc:
+        error = str(exc)
+    except Exception:
+        logger.exception("Batch rewrite failed for %s", file.name)
+        error = "Rewrite failed."
+    else:
+        metrics.incr("batch_rewrite.rewritten")
+        return BatchResult(
+            name=file.name,
+            document_id=document_id,
+            data=rewrite.data,
+            cache_hits=rewrite.cache_hits,
+            cache_misses=rewrite.cache_misses,
+            unchanged=rewrite.unchanged,
+            seconds=time.perf_counter() - started,
+        )
+    metrics.incr("batch_rewrite.failed")
+    return BatchResult(file.name, document_id, error=error, seconds=time.perf_counter() - started)
+
+
+class _Sink:
+    """Write-only buffer for zipfile; without tell() zipfile streams entries with data descriptors."""
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ZipStream:
+    """Builds a zip incrementally, handing back the bytes of each entry as it is added."""
+
+    def __init__(self) -> None:
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w")
+
+    def add(self, name: str, data: bytes, compress: bool = False) -> bytes:
+        # DOCX files are zip packages already; deflating them again only costs CPU.
+        compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip.writestr(name, data, compress_type=compress_type)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+async def stream_zip(batch: Batch, goals: list[str], notes: str | None) -> AsyncIterator[bytes]:
+    """Yield the output zip, one rewritten document at a time in completion order."""
+    pool = get_pool()
+    # Byte-identical files share a rewrite lock, so they are rewritten once and
+    # the result is copied to every name instead of the copies failing as "in progress".
+    groups: dict[str, list[BatchFile]] = {}
+    for file in batch.files:
+        groups.setdefault(rewrite_service.document_id_for(file.data), []).append(file)
+    copies = {first.name: rest for first, *rest in groups.values()}
+    futures: list[Future] = [pool.submit(rewrite_file, files[0], goals, notes) for files in groups.values()]
+    metrics.incr("batch_rewrite.documents", len(batch.files))
+    metrics.incr("batch_rewrite.duplicates", len(batch.files) - len(futures))
+    metrics.incr("batch_rewrite.skipped", len(batch.skipped))
+    archive = ZipStream()
+    results: list[BatchResult] = []
+    try:
+        for finished in asyncio.as_completed([asyncio.wrap_future(future) for future in futures]):
+            first = await finished
+            for result in [first, *(replace(first, name=file.name) for file in copies[first.name])]:
+                results.append(result)
+                if result.data is not None:
+                    yield archive.add(result.name, result.data)
+        order = {file.name: position for position, file in enumerate(batch.files)}
+        documents = [result.manifest_entry() for result in sorted(results, key=lambda item: order[item.name])]
+        documents.extend(batch.skipped)
+        manifest = {
+            "documents": documents,
+            STATUS_REWRITTEN: sum(1 for result in results if result.error is None),
+            STATUS_FAILED: sum(1 for result in results if result.error is not None),
+            STATUS_SKIPPED: len(batch.skipped),
+        }
+        yield archive.add(MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"), compress=True)
+        yield archive.close()
+    finally:
+        # Client gone or stream aborted: drop documents that have not started yet.
+        for future in futures:
+            future.cancel()
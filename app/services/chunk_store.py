@@ -0,0 +1,217 @@
+"""Indexed store of chunk text, keyed by document and chunk position.
+
+Ingest writes every document's chunks here, so excerpts for search and doc
+Q&A are a primary-key lookup instead of re-parsing the source DOCX, and
+``GET /api/chunks/{id}?window=N`` can return a chunk with its neighbours for
+clients that want more context than the default excerpt.
+
+The store is SQLite: a file (CHUNK_STORE_PATH, set in the image) that
+survives restarts and is shared by every worker and the ingest CLI, or else
+process memory, capped at CHUNK_STORE_MAX_BYTES of chunk text with the least
+recently read documents dropped first. Documents indexed before the store
+existed, restored from a vector snapshot, ingested by another process or
+dropped from memory are backfilled from RAG_DOC_ROOT the first time they are
+read. Ingest removes a document's rows if it fails, and
+ingest_service.delete_document removes them with the document.
+
+Each document keeps a digest of its chunks; chunk responses carry an ETag
+built from it, so an unchanged window is revalidated without reading any
+chunk text.
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from app.config import get_settings
+from app.services import chunker, cpu_pool, metrics, vector_store
+
+
+class ChunkStore:
+    def __init__(self, db_path: str | Path | None = None, max_bytes: int | None = None) -> None:
+        self._lock = Lock()
+        # Only the in-memory store is bounded; doc_id -> text bytes, least recently used first.
+        self._max_bytes = None if db_path else max_bytes
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(db_path) if db_path else ":memory:", timeout=5.0, check_same_thread=False, isolation_level=None
+        )
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, source_filename TEXT NOT NULL, chunk_count INTEGER NOT NULL, digest TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "doc_id TEXT NOT NULL, chunk_index INTEGER NOT NULL, text TEXT NOT NULL, "
+            "PRIMARY KEY (doc_id, chunk_index)) WITHOUT ROWID"
+        )
+
+    def put_document(self, doc_id: str, filename: str, chunks: list[str]) -> None:
+        digest = hashlib.sha256("\0".join([filename, *chunks]).encode("utf-8")).hexdigest()[:32]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                self._conn.executemany(
+                    "INSERT INTO chunks (doc_id, chunk_index, text) VALUES (?, ?, ?)",
+                    [(doc_id, idx, text) for idx, text in enumerate(chunks)],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (doc_id, source_filename, chunk_count, digest) VALUES (?, ?, ?, ?)",
+                    (doc_id, filename, len(chunks), digest),
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            if self._max_bytes is not None:
+                size = sum(len(text.encode("utf-8")) for text in chunks)
+                self._bytes += size - self._sizes.pop(doc_id, 0)
+                self._sizes[doc_id] = size
+                while self._bytes > self._max_bytes and len(self._sizes) > 1:
+                    self._delete_locked(next(iter(self._sizes)))
+                    metrics.incr("chunk_store.evicted")
+
+    def delete_document(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._delete_locked(doc_id)
+
+    def _delete_locked(self, doc_id: str) -> bool:
+        self._bytes -= self._sizes.pop(doc_id, 0)
+        self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+        return self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount > 0
+
+    def _touch_locked(self, doc_id: str) -> None:
+        if doc_id in self._sizes:
+            self._sizes.move_to_end(doc_id)
+
+    def document(self, doc_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source_filename, chunk_count, digest FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"doc_id": doc_id, "source": row[0], "chunk_count": row[1], "digest": row[2]}
+
+    def get_chunk(self, doc_id: str, chunk_index: int) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM chunks WHERE doc_id = ? AND chunk_index = ?", (doc_id, chunk_index)
+            ).fetchone()
+            self._touch_locked(doc_id)
+        return row[0] if row else None
+
+    def get_range(self, doc_id: str, first: int, last: int) -> list[tuple[int, str]]:
+        with self._lock:
+            self._touch_locked(doc_id)
+            return self._conn.execute(
+                "SELECT chunk_index, text FROM chunks WHERE doc_id = ? AND chunk_index BETWEEN ? AND ? "
+                "ORDER BY chunk_index",
+                (doc_id, first, last),
+            ).fetchall()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+@lru_cache(maxsize=1)
+def get_store() -> ChunkStore:
+    settings = get_settings()
+    return ChunkStore(settings.chunk_store_path, max_bytes=settings.chunk_store_max_bytes)
+
+
+def parse_chunk_id(chunk_id: str) -> tuple[str, int]:
+    """Split a chunk (vector) ID of the form "<doc_id>-<chunk_index>"; raises ValueError."""
+    doc_id, _, raw_index = chunk_id.rpartition("-")
+    if not doc_id or not raw_index.isdigit():
+        raise ValueError("Invalid chunk ID.")
+    return doc_id, int(raw_index)
+
+
+def etag(digest: str, chunk_index: int, window: int) -> str:
+    return f'"{digest}-{chunk_index}-{window}"'
+
+
+def _chunk_source(filename: str) -> list[str]:
+    root = get_settings().rag_doc_root
+    if root is None:
+        raise ValueError("RAG_DOC_ROOT is required to load source excerpts.")
+    path = root / filename
+    if not path.exists():
+        raise ValueError(f"Source document not found: {path}")
+    return cpu_pool.run(chunker.chunk_docx, path, chunker.CHUNK_CHARS, size_hint=path.stat().st_size)
+
+
+def _backfill(doc_id: str, filename: str) -> list[str]:
+    chunks = _chunk_source(filename)
+    get_store().put_document(doc_id, filename, chunks)
+    metrics.incr("chunk_store.backfilled")
+    return chunks
+
+
+def load_excerpt(doc_id: str | None, filename: str, chunk_index: int) -> str:
+    """Text of one chunk, from the store or (once per document) from the source DOCX."""
+    if doc_id:
+        text = get_store().get_chunk(doc_id, chunk_index)
+        if text is not None:
+            metrics.incr("chunk_store.hits")
+            return text
+    chunks = _backfill(doc_id, filename) if doc_id else _chunk_source(filename)
+    if chunk_index < 0 or chunk_index >= len(chunks):
+        raise ValueError("Chunk index out of range for source document.")
+    return chunks[chunk_index]
+
+
+def current_etag(chunk_id: str, window: int) -> str | None:
+    """ETag of a stored window without reading chunk text; None when not stored yet."""
+    doc_id, chunk_index = parse_chunk_id(chunk_id)
+    document = get_store().document(doc_id)
+    if document is None or chunk_index >= document["chunk_count"]:
+        return None
+    return etag(document["digest"], chunk_index, window)
+
+
+def get_window(chunk_id: str, window: int) -> tuple[dict[str, Any], str] | None:
+    """A chunk and up to `window` neighbours on each side, with its ETag; None for unknown chunks."""
+    doc_id, chunk_index = parse_chunk_id(chunk_id)
+    store = get_store()
+    document = store.document(doc_id)
+    if document is None:
+        # Indexed before the store existed: the vector's metadata names the source file.
+        # A shared vector kept after its document was deleted is attributed to another
+        # document, so only a vector that still belongs to `doc_id` is trusted.
+        metadata = (vector_store.fetch_vectors(vector_store.get_index(), [chunk_id]).get(chunk_id) or {}).get(
+            "metadata", {}
+        )
+        filename = metadata.get("source_filename")
+        if not filename or metadata.get("doc_id") != doc_id:
+            return None
+        _backfill(doc_id, filename)
+        document = store.document(doc_id)
+    if document is None or chunk_index >= document["chunk_count"]:
+        return None
+
+    first = max(0, chunk_index - window)
+    last = min(document["chunk_count"] - 1, chunk_index + window)
+    body = {
+        "id": chunk_id,
+        "doc_id": doc_id,
+        "source": document["source"],
+        "chunk_index": chunk_index,
+        "chunk_count": document["chunk_count"],
+        "window": window,
+        "chunks": [{"chunk_index": idx, "text": text} for idx, text in store.get_range(doc_id, first, last)],
+    }
+    return body, etag(document["digest"], chunk_index, window)
@@ -1,12 +1,25 @@
 """Text normalization and chunking helpers."""
 from __future__ import annotations
 
+from pathlib import Path
+
+from app.services import document_parser
+
+# Chunk size used at ingest; stored and session chunks are cut the same way.
+CHUNK_CHARS = 200
+
 
 def normalize_text(text: str) -> str:
     return " ".join(text.split())
 
 
-def chunk_text(text: str, max_chars: int = 800) -> list[str]:
+def chunk_text(text: str, max_chars: int = 800, overlap: int = 0) -> list[str]:
+    """Split on word boundaries into chunks of at most max_chars.
+
+    With overlap > 0, each chunk starts with the trailing words (up to overlap
+    characters) of the previous one, so a clause cut at a boundary still
+    appears whole in one of the two chunks.
+    """
     if not text:
         return []
     words = text.split()
@@ -18,12 +31,35 @@ def chunk_text(text: str, max_chars: int = 800) -> list[str]:
         extra = len(word) + (1 if current else 0)
         if current and current_len + extra > max_chars:
             chunks.append(" ".join(current))
-            current = [word]
-            current_len = len(word)
-            continue
+            current = _tail(current, min(overlap, max_chars - len(word) - 1))
+            current_len = len(" ".join(current))
+            extra = len(word) + (1 if current else 0)
         current.append(word)
         current_len += extra
 
     if current:
         chunks.append(" ".join(current))
     return chunks
+
+
+def _tail(words: list[str], max_chars: int) -> list[str]:
+    """The longest run of trailing words that fits in max_chars."""
+    taken = 0
+    length = -1
+    for word in reversed(words):
+        if length + 1 + len(word) > max_chars:
+            break
+        length += 1 + len(word)
+        taken += 1
+    return words[len(words) - taken:] if taken else []
+
+
+def chunk_docx(path: Path, max_chars: int = 800) -> list[str]:
+    """Parse, normalize and chunk a DOCX file (module-level so the CPU pool can run it)."""
+    return chunk_text(normalize_text(document_parser.extract_text_from_docx(path)), max_chars=max_chars)
+
+
+def chunk_docx_bytes(data: bytes, max_chars: int = 800) -> list[str]:
+    """Chunk an in-memory DOCX package (uploads that are never written to disk)."""
+    paragraphs = document_parser.extract_paragraphs_from_docx_bytes(data)
+    return chunk_text(normalize_text("\n".join(paragraphs)), max_chars=max_chars)
@@ -0,0 +1,126 @@
+"""Process pool for CPU-bound document work (DOCX parsing, chunking, writing).
+
+Pure-Python XML work holds the GIL, so running it in request threads
+serializes every upload in the worker. Large payloads are sent to a pool of
+spawned processes instead:
+
+- inputs smaller than CPU_POOL_MIN_BYTES run inline, where pickling and IPC
+  would cost more than the work itself;
+- at most workers + CPU_POOL_MAX_QUEUE tasks are admitted at once; beyond
+  that CPUPoolBusyError is raised and the API answers 503 with Retry-After;
+- each child is recycled after CPU_POOL_MAX_TASKS_PER_CHILD tasks to contain
+  memory growth from large documents;
+- waits are bounded by the request deadline.
+
+The pool is created lazily, so it is never forked along with a preloaded
+server master process. CPU_POOL_WORKERS=0 runs everything inline. Each web
+worker has its own pool, so by default the cores are divided between the
+WEB_CONCURRENCY workers (at least one process each, at most four).
+"""
+from __future__ import annotations
+
+import importlib
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, TypeVar
+
+from app.config import get_settings
+from app.services import metrics, resilience
+
+T = TypeVar("T")
+
+# Imported once per child so the first task does not pay for them.
+_PRELOAD_MODULES = ("lxml.etree", "docx", "app.services.document_parser", "app.services.docx_writer")
+
+_POOL: ProcessPoolExecutor | None = None
+_SLOTS: BoundedSemaphore | None = None
+_LOCK = Lock()
+
+
+class CPUPoolBusyError(RuntimeError):
+    """Too many document tasks are queued; callers should retry shortly."""
+
+    def __init__(self, retry_after: float = 1.0) -> None:
+        super().__init__("Document processing is busy; please retry shortly.")
+        self.retry_after = retry_after
+
+
+def _preload() -> None:
+    for name in _PRELOAD_MODULES:
+        importlib.import_module(name)
+
+
+def worker_count() -> int:
+    settings = get_settings()
+    if settings.cpu_pool_workers is not None:
+        return settings.cpu_pool_workers
+    return min(4, max(1, (os.cpu_count() or 1) // settings.web_concurrency))
+
+
+def _get_pool() -> tuple[ProcessPoolExecutor, BoundedSemaphore]:
+    global _POOL, _SLOTS
+    with _LOCK:
+        if _POOL is None:
+            settings = get_settings()
+            workers = worker_count()
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_preload,
+                max_tasks_per_child=settings.cpu_pool_max_tasks_per_child,
+            )
+            _SLOTS = BoundedSemaphore(workers + settings.cpu_pool_max_queue)
+        return _POOL, _SLOTS
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _POOL, _SLOTS
+    with _LOCK:
+        if _POOL is pool:
+            _POOL, _SLOTS = None, None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run(fn: Callable[..., T], *args: Any, size_hint: int = 0) -> T:
+    """Run fn(*args) in the pool (or inline for small inputs) and return its result.
+
+    fn and its arguments must be picklable: module-level functions and plain
+    data such as bytes, paths and dicts.
+    """
+    settings = get_settings()
+    if worker_count() == 0 or size_hint < settings.cpu_pool_min_bytes:
+        return fn(*args)
+
+    resilience.check_deadline("cpu_pool")
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        metrics.incr("cpu_pool.rejected")
+        raise CPUPoolBusyError()
+    try:
+        future: Future[T] = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _discard_pool(pool)
+        raise RuntimeError("Document worker pool crashed; please retry.")
+    future.add_done_callback(lambda _future: slots.release())
+    metrics.incr("cpu_pool.submitted")
+    try:
+        return future.result(timeout=resilience.remaining())
+    except FutureTimeoutError:
+        future.cancel()
+        raise resilience.DeadlineExceeded("cpu_pool")
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise RuntimeError("Document worker pool crashed; please retry.")
+
+
+def shutdown() -> None:
+    global _POOL, _SLOTS
+    with _LOCK:
+        pool, _POOL, _SLOTS = _POOL, None, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
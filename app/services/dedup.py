@@ -0,0 +1,196 @@
+"""Exact and near-duplicate chunk detection for ingest.
+
+Every stored chunk is registered with its text, its content hash (sha256 of
+the whitespace- and case-normalized text) and a MinHash signature over word
+bigrams. A new chunk is an exact duplicate when its normalized text matches a
+registered chunk's. Near-duplicate merging is off by default
+(DEDUP_NEAR_ENABLED): legal clauses that differ by one word ("shall" vs "shall
+not", an amount, a party) must not collapse into one stored text. When it is
+on, a chunk is a near duplicate when its word-bigram Jaccard similarity with a
+registered chunk is at least DEDUP_MIN_SIMILARITY (0.95 by default); the
+MinHash estimate only selects candidates, and the exact Jaccard decides.
+MinHash rather than SimHash because ingest chunks are short (~200
+characters): a single changed word moves a SimHash by many bits, while the
+Jaccard estimate degrades gracefully.
+
+Lookups use LSH banding (16 bands of 4 rows), so only chunks sharing a whole
+band are compared. Each occurrence keeps its own document and chunk index, so
+citations still point at the real text.
+
+The registry is SQLite; the default ``:memory:`` database lives for the
+process, while a file path (DEDUP_DB_PATH) keeps it in step with a persistent
+index across runs.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+from functools import lru_cache
+from threading import Event, Lock, RLock
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.single_flight import normalize_text
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 2
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_HASH_MAX = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+# Fixed seed: signatures must be comparable across processes and runs.
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+
+DUPLICATE_EXACT = "exact"
+DUPLICATE_NEAR = "near"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _shingles(text: str) -> set[str]:
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {" ".join(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    """NUM_PERM-value uint32 MinHash signature of the text's word bigrams."""
+    shingles = _shingles(text)
+    if not shingles:
+        return np.full(NUM_PERM, _HASH_MAX, dtype=np.uint32)
+    values = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    hashed = (values[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME & _HASH_MAX
+    return hashed.min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def jaccard(a: str, b: str) -> float:
+    """Exact Jaccard similarity of two texts' word bigrams."""
+    left, right = _shingles(a), _shingles(b)
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+def _band_keys(signature: np.ndarray) -> list[str]:
+    return [
+        hashlib.blake2b(signature[band * ROWS : (band + 1) * ROWS].tobytes(), digest_size=8).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+class DedupRegistry:
+    def __init__(self, path: str = ":memory:", min_similarity: float = 0.95, near: bool = False) -> None:
+        self.min_similarity = min_similarity
+        self.near = near
+        # Guards registry reads and writes only: ingest registers new chunks
+        # under it, then embeds and upserts without it. Chunks registered but
+        # not yet upserted are pending; other ingests wait for them to settle.
+        self.lock = RLock()
+        # Serializes read-modify-write of a stored vector's occurrence list.
+        self.merge_lock = Lock()
+        self._pending: dict[str, Event] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "vector_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, signature BLOB NOT NULL, text TEXT)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+            if "text" not in columns:
+                # Registries written before texts were kept; their rows match by hash only.
+                self._conn.execute("ALTER TABLE chunks ADD COLUMN text TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (content_hash)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER, key TEXT, vector_id TEXT)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, key)")
+
+    def find(self, digest: str, signature: np.ndarray, text: str) -> tuple[str, str] | None:
+        """(vector_id, "exact" | "near") for a registered duplicate, else None."""
+        normalized = normalize_text(text)
+        with self.lock:
+            rows = self._conn.execute(
+                "SELECT vector_id, text FROM chunks WHERE content_hash = ?", (digest,)
+            ).fetchall()
+            for vector_id, stored in rows:
+                if stored is None or normalize_text(stored) == normalized:
+                    return vector_id, DUPLICATE_EXACT
+            if not self.near:
+                return None
+            clauses = " OR ".join("(b.band = ? AND b.key = ?)" for _ in range(BANDS))
+            params = [item for band, key in enumerate(_band_keys(signature)) for item in (band, key)]
+            candidates = self._conn.execute(
+                f"SELECT DISTINCT c.vector_id, c.signature, c.text FROM bands b JOIN chunks c "
+                f"ON c.vector_id = b.vector_id WHERE {clauses}",
+                params,
+            ).fetchall()
+        best: tuple[float, str] | None = None
+        for vector_id, stored, stored_text in candidates:
+            # The estimate only shortlists; merging needs the exact similarity.
+            estimate = similarity(signature, np.frombuffer(stored, dtype=np.uint32))
+            if stored_text is None or estimate < self.min_similarity:
+                continue
+            score = jaccard(text, stored_text)
+            if score >= self.min_similarity and (best is None or score > best[0]):
+                best = (score, vector_id)
+        return (best[1], DUPLICATE_NEAR) if best else None
+
+    def add(self, vector_id: str, digest: str, signature: np.ndarray, text: str) -> None:
+        """Register a chunk; it stays pending until settle() (or remove()) is called for it."""
+        with self.lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (vector_id, content_hash, signature, text) VALUES (?, ?, ?, ?)",
+                (vector_id, digest, signature.astype(np.uint32).tobytes(), text),
+            )
+            self._conn.execute("DELETE FROM bands WHERE vector_id = ?", (vector_id,))
+            self._conn.executemany(
+                "INSERT INTO bands (band, key, vector_id) VALUES (?, ?, ?)",
+                [(band, key, vector_id) for band, key in enumerate(_band_keys(signature))],
+            )
+            self._pending[vector_id] = Event()
+
+    def settle(self, vector_ids: list[str]) -> None:
+        """Mark registered chunks as upserted (or abandoned), releasing waiters."""
+        with self.lock:
+            events = [self._pending.pop(vector_id, None) for vector_id in vector_ids]
+        for event in events:
+            if event is not None:
+                event.set()
+
+    def wait_settled(self, vector_ids: list[str], timeout: float | None = None) -> bool:
+        """Wait until none of `vector_ids` is pending; False if `timeout` ran out first."""
+        with self.lock:
+            events = [self._pending[vector_id] for vector_id in vector_ids if vector_id in self._pending]
+        return all(event.wait(timeout) for event in events)
+
+    def remove(self, vector_ids: list[str]) -> None:
+        with self.lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE vector_id = ?", [(v,) for v in vector_ids])
+            self._conn.executemany("DELETE FROM bands WHERE vector_id = ?", [(v,) for v in vector_ids])
+        self.settle(vector_ids)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+@lru_cache(maxsize=1)
+def get_registry() -> DedupRegistry:
+    settings = get_settings()
+    return DedupRegistry(settings.dedup_db_path, settings.dedup_min_similarity, settings.dedup_near_enabled)
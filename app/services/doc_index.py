@@ -0,0 +1,91 @@
+"""Document-level vectors for two-stage (hierarchical) retrieval.
+
+Ingest stores one vector per document next to its chunks: the normalized
+centroid of the document's chunk vectors, kept in a small separate index
+(``vector_store.get_doc_index``). With HIERARCHICAL_TOP_DOCS > 0, doc Q&A
+first picks the closest documents and then searches chunks of those documents
+only, via a metadata filter on ``doc_id``/``doc_ids``. When the document
+index has nothing to offer, retrieval falls back to the flat chunk search.
+
+Corpora restored from a snapshot or ingested before document vectors existed
+can be backfilled with ``python -m app.services.doc_index rebuild``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from typing import Any
+
+import numpy as np
+
+from app.services import metrics, sharding, vector_codec, vector_store
+
+DOC_NAMESPACE = "documents"
+
+
+def centroid(vectors: Any) -> np.ndarray:
+    """Unit-length mean of the (normalized) chunk vectors."""
+    matrix = vector_codec.l2_normalize(vector_codec.as_matrix(vectors))
+    return vector_codec.l2_normalize(matrix.mean(axis=0, keepdims=True))[0]
+
+
+def upsert_document(doc_id: str, vectors: Any, metadata: dict[str, Any], doc_index=None) -> None:
+    doc_index = doc_index if doc_index is not None else vector_store.get_doc_index()
+    document = {"doc_id": doc_id, **metadata}
+    vector_store.upsert_vectors(doc_index, [{"id": doc_id, "values": centroid(vectors), "metadata": document}])
+
+
+def top_documents(embedding: Any, top_docs: int, doc_index=None) -> list[str]:
+    doc_index = doc_index if doc_index is not None else vector_store.get_doc_index()
+    result = vector_store.query_vector(doc_index, embedding, top_k=top_docs)
+    return [str(match.get("id")) for match in result.get("matches", [])]
+
+
+def chunk_filter(doc_ids: list[str]) -> dict[str, Any]:
+    # Deduplicated chunks list every document they occur in under doc_ids.
+    return {"$or": [{"doc_id": {"$in": doc_ids}}, {"doc_ids": {"$in": doc_ids}}]}
+
+
+def rebuild(index=None, doc_index=None, page_size: int = 100) -> dict[str, int]:
+    """Recompute every document vector from the chunks in the index."""
+    # Imported lazily: ingest_service depends on this module.
+    from app.services.ingest_service import parse_occurrence
+
+    index = index if index is not None else vector_store.get_index()
+    doc_index = doc_index if doc_index is not None else vector_store.get_doc_index()
+    sums: dict[str, np.ndarray] = {}
+    documents: dict[str, dict[str, Any]] = {}
+    for ids in vector_store.list_ids(index, page_size=page_size):
+        for fetched in vector_store.fetch_vectors(index, ids).values():
+            metadata = fetched["metadata"]
+            vector = vector_codec.l2_normalize(vector_codec.as_matrix([fetched["values"]]))[0]
+            for doc_id in metadata.get("doc_ids") or [metadata.get("doc_id")]:
+                if doc_id:
+                    sums[doc_id] = sums.get(doc_id, 0) + vector
+                    documents.setdefault(doc_id, _document_metadata(metadata))
+            # Filenames of documents that only share this vector come from its occurrences.
+            for raw in metadata.get("occurrences") or []:
+                occurrence = parse_occurrence(raw)
+                documents.setdefault(occurrence["doc_id"], {})["source_filename"] = occurrence["source"]
+    for doc_id, total in sums.items():
+        upsert_document(doc_id, total[None, :], documents.get(doc_id, {}), doc_index)
+    metrics.incr("doc_index.rebuilt", len(sums))
+    return {"documents": len(sums)}
+
+
+def _document_metadata(chunk_metadata: dict[str, Any]) -> dict[str, Any]:
+    # A pinned shard is shared by every document merged into the vector.
+    keys = ("source_filename", sharding.SHARD_METADATA_KEY)
+    return {key: chunk_metadata[key] for key in keys if key in chunk_metadata}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain document-level vectors.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Recompute document vectors from the chunk index.")
+    parser.parse_args()
+    print(json.dumps(rebuild(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
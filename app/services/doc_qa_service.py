@@ -1,18 +1,35 @@
 """Grounded document Q&A service with citations."""
 from __future__ import annotations
 
-import os
-from pathlib import Path
-from typing import Any
-
-from dotenv import load_dotenv
+import re
+from functools import partial
+from typing import Any, Callable
 
 from app import prompts
-from app.services import chunker, document_parser, embedding_service, vector_store
-from app.services.llm_gateway import generate_text
+from app.config import get_settings
+from app.services import (
+    chunk_store,
+    doc_index,
+    embedding_service,
+    ingest_service,
+    metrics,
+    retrieval_cache,
+    session_store,
+    vector_store,
+)
+from app.services.llm_gateway import generate_for_task
+from app.services.model_router import TASK_DOC_QA
+from app.services.single_flight import SingleFlight, make_key, normalize_text
+
+NO_MATCH_ANSWER = "No strong match found in the documents."
+
+_RETRIEVAL_FLIGHTS: SingleFlight[dict[str, Any]] = SingleFlight("doc_qa_retrieval")
 
-ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
-load_dotenv(ENV_PATH, override=True)
+PRUNE_BELOW_MIN_RELEVANCE = "below_min_relevance"
+PRUNE_BELOW_FLOOR = "below_floor"
+PRUNE_SCORE_GAP = "score_gap"
+
+_CITATION_RE = re.compile(r"\[SOURCE\s+(\d+)\]", re.IGNORECASE)
 
 
 def _sanitize_question(question: str) -> str:
@@ -24,32 +41,23 @@ def _sanitize_question(question: str) -> str:
     return cleaned
 
 
-def _get_doc_root() -> Path:
-    root = os.getenv("RAG_DOC_ROOT")
-    if not root:
-        raise ValueError("RAG_DOC_ROOT is required to load source excerpts.")
-    return Path(root)
-
+def _session_excerpt(
+    session: session_store.Session, _doc_id: str | None, _filename: str, chunk_index: int
+) -> str:
+    if chunk_index < 0 or chunk_index >= len(session.chunks):
+        raise ValueError("Chunk index out of range for session document.")
+    return session.chunks[chunk_index]
 
-def _load_excerpt(doc_root: Path, filename: str, chunk_index: int, max_chars: int = 200) -> str:
-    path = doc_root / filename
-    if not path.exists():
-        raise ValueError(f"Source document not found: {path}")
-    raw_text = document_parser.extract_text_from_docx(path)
-    normalized = chunker.normalize_text(raw_text)
-    chunks = chunker.chunk_text(normalized, max_chars=max_chars)
-    if chunk_index < 0 or chunk_index >= len(chunks):
-        raise ValueError("Chunk index out of range for source document.")
-    return chunks[chunk_index]
 
-
-def _build_sources(matches: list[dict[str, Any]], doc_root: Path) -> list[dict[str, Any]]:
+def _build_sources(
+    matches: list[dict[str, Any]], load_excerpt: Callable[[str | None, str, int], str]
+) -> list[dict[str, Any]]:
     sources: list[dict[str, Any]] = []
     for match in matches:
         metadata = match.get("metadata") or {}
         filename = metadata.get("source_filename") or "unknown"
         chunk_index = int(metadata.get("chunk_index", -1))
-        excerpt = _load_excerpt(doc_root, filename, chunk_index)
+        excerpt = load_excerpt(metadata.get("doc_id"), filename, chunk_index)
         score = match.get("score")
         sources.append(
             {
@@ -75,29 +83,214 @@ def _format_sources(sources: list[dict[str, Any]]) -> str:
     return "\n".join(blocks)
 
 
-def answer_question(question: str, top_k: int = 5) -> dict[str, Any]:
-    cleaned = _sanitize_question(question)
-    embedding = embedding_service.embed_texts([cleaned])[0]
+def _score(match: dict[str, Any]) -> float:
+    score = match.get("score")
+    return float(score) if score is not None else 0.0
+
+
+def _pruned_entry(match: dict[str, Any], reason: str) -> dict[str, Any]:
+    metadata = match.get("metadata") or {}
+    return {
+        "id": str(match.get("id")),
+        "score": _score(match),
+        "source": metadata.get("source_filename") or "unknown",
+        "chunk_index": int(metadata.get("chunk_index", -1)),
+        "reason": reason,
+    }
 
+
+def _select_matches(
+    matches: list[dict[str, Any]],
+    top_k: int,
+    max_top_k: int,
+    floor: float,
+    max_gap: float,
+    cluster_spread: float,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]], int]:
+    """Choose which ranked matches become sources.
+
+    The window is widened from top_k to max_top_k only when the first top_k
+    scores sit within cluster_spread of each other (many equally good
+    candidates). Inside the window a match is pruned when it is below the
+    per-match floor, or once the score drops by more than max_gap from the
+    previous kept match; everything after a gap is pruned too.
+
+    Returns (kept, pruned, window size used).
+    """
+    window = min(top_k, len(matches))
+    if window and len(matches) > window and max_top_k > top_k:
+        spread = _score(matches[0]) - _score(matches[window - 1])
+        if spread <= cluster_spread:
+            window = min(max_top_k, len(matches))
+
+    kept: list[dict[str, Any]] = []
+    pruned: list[dict[str, Any]] = []
+    gap_hit = False
+    for match in matches[:window]:
+        score = _score(match)
+        if score < floor:
+            pruned.append(_pruned_entry(match, PRUNE_BELOW_FLOOR))
+        elif gap_hit or (kept and _score(kept[-1]) - score > max_gap):
+            gap_hit = True
+            pruned.append(_pruned_entry(match, PRUNE_SCORE_GAP))
+        else:
+            kept.append(match)
+    return kept, pruned, window
+
+
+def _query_chunks(embedding: Any, top_k: int, top_docs: int) -> dict[str, Any]:
+    """Flat chunk search, or chunks of the `top_docs` closest documents first."""
     index = vector_store.get_index()
-    result = index.query(vector=embedding, top_k=top_k, include_metadata=True)
+    if top_docs:
+        doc_ids = doc_index.top_documents(embedding, top_docs)
+        if doc_ids:
+            metrics.incr("doc_qa.hierarchical")
+            return vector_store.query_vector(index, embedding, top_k=top_k, filter=doc_index.chunk_filter(doc_ids))
+        metrics.incr("doc_qa.hierarchical_fallback")
+    return vector_store.query_vector(index, embedding, top_k=top_k)
+
+
+def _retrieve_sources(
+    cleaned: str, top_k: int, session: session_store.Session | None = None
+) -> dict[str, Any]:
+    """Embed, query, prune and load excerpts for the surviving matches only.
+
+    With a session, the session's own index and chunks are used instead of the
+    shared vector store and chunk store.
+    """
+    settings = get_settings()
+    embedding = embedding_service.embed_texts([cleaned])[0]
+
+    # Fetch the widest window up front; widening never costs a second query.
+    max_top_k = max(top_k, settings.retrieval_max_top_k)
+    if session is not None:
+        result = vector_store.query_vector(session.index, embedding, top_k=max_top_k)
+    else:
+        result = _query_chunks(embedding, max_top_k, settings.hierarchical_top_docs)
     matches = result.get("matches", [])
+    # A sharded index answers without shards that missed the deadline; say so.
+    shard_flags = {"partial": True, "missing_shards": result["missing_shards"]} if result.get("partial") else {}
     if not matches:
-        return {"answer": "No strong match found in the documents.", "sources": []}
+        return {"sources": [], "pruned": [], "top_k_used": 0, **shard_flags}
+
+    if _score(matches[0]) < settings.min_relevance_score:
+        pruned = [_pruned_entry(match, PRUNE_BELOW_MIN_RELEVANCE) for match in matches[:top_k]]
+        return {"sources": [], "pruned": pruned, "top_k_used": min(top_k, len(matches)), **shard_flags}
+
+    floor = settings.min_match_score
+    if floor is None:
+        floor = settings.min_relevance_score
+    kept, pruned, window = _select_matches(
+        matches,
+        top_k=top_k,
+        max_top_k=max_top_k,
+        floor=floor,
+        max_gap=settings.max_score_gap,
+        cluster_spread=settings.score_cluster_spread,
+    )
+
+    if session is not None:
+        load_excerpt = partial(_session_excerpt, session)
+    else:
+        load_excerpt = chunk_store.load_excerpt
+    # Deduplicated chunks list every place they occur; kept aside so the prompt
+    # stays small and only cited sources are expanded.
+    occurrences = {}
+    for match in kept:
+        raw = (match.get("metadata") or {}).get("occurrences") or []
+        if len(raw) > 1:
+            occurrences[str(match.get("id"))] = list(raw)
+    return {
+        "sources": _build_sources(kept, load_excerpt),
+        "pruned": pruned,
+        "top_k_used": window,
+        "occurrences": occurrences,
+        **shard_flags,
+    }
 
-    min_score = float(os.getenv("MIN_RELEVANCE_SCORE", "0.35"))
-    top_score = matches[0].get("score") or 0.0
-    if top_score < min_score:
-        return {"answer": "No strong match found in the documents.", "sources": []}
 
-    doc_root = _get_doc_root()
-    sources = _build_sources(matches, doc_root)
-    sources_block = _format_sources(sources)
-    user_prompt = (
+def retrieve_sources(question: str, top_k: int = 5) -> dict[str, Any]:
+    """The retrieval step of answer_question on the shared index, without the cache or LLM call.
+
+    Returns the sources that would go into the prompt, the pruned matches and
+    the window used; the offline retrieval evaluation measures exactly this.
+    """
+    return _retrieve_sources(_sanitize_question(question), top_k)
+
+
+def build_user_prompt(cleaned: str, sources: list[dict[str, Any]]) -> str:
+    return (
         f"Question: {cleaned}\n\n"
-        f"SOURCES:\n{sources_block}\n\n"
+        f"SOURCES:\n{_format_sources(sources)}\n\n"
         "Answer the question using only the SOURCES and cite them."
     )
 
-    llm_response = generate_text(user_prompt, system=prompts.LEGAL_DOC_QA_SYSTEM_PROMPT)
-    return {"answer": llm_response.content, "sources": sources}
+
+def _expand_cited_occurrences(
+    answer: str, sources: list[dict[str, Any]], occurrences: dict[str, list[str]]
+) -> list[dict[str, Any]]:
+    """Attach every (doc, chunk) occurrence to the sources the answer cites."""
+    cited = {int(number) for number in _CITATION_RE.findall(answer)}
+    expanded = []
+    for position, source in enumerate(sources, start=1):
+        raw = occurrences.get(source["id"])
+        if raw and position in cited:
+            # Copy: retrieval results may be shared with coalesced requests.
+            source = {**source, "occurrences": [ingest_service.parse_occurrence(item) for item in raw]}
+        expanded.append(source)
+    return expanded
+
+
+def has_valid_citations(answer: str, source_count: int) -> bool:
+    """True when the answer cites at least one source and only sources that exist."""
+    cited = {int(number) for number in _CITATION_RE.findall(answer)}
+    return bool(cited) and all(1 <= number <= source_count for number in cited)
+
+
+def answer_question(question: str, top_k: int = 5, session_id: str | None = None) -> dict[str, Any]:
+    cleaned = _sanitize_question(question)
+    session = session_store.get_store().get(session_id) if session_id else None
+    settings = get_settings()
+
+    def retrieve() -> dict[str, Any]:
+        if settings.single_flight_enabled:
+            key = make_key(normalize_text(cleaned), top_k, session_id)
+            return _RETRIEVAL_FLIGHTS.do(key, lambda: _retrieve_sources(cleaned, top_k, session))
+        return _retrieve_sources(cleaned, top_k, session)
+
+    if session is None:
+        # Everything that shapes the result besides the index contents.
+        shaping = (
+            settings.openai_embed_model,
+            settings.embedding_dim,
+            settings.min_relevance_score,
+            settings.min_match_score,
+            settings.max_score_gap,
+            settings.score_cluster_spread,
+            settings.retrieval_max_top_k,
+            settings.hierarchical_top_docs,
+        )
+        retrieval = retrieval_cache.cached(
+            "doc_qa",
+            (normalize_text(cleaned), top_k, shaping),
+            retrieve,
+            # Results missing a shard are not worth remembering.
+            cacheable=lambda result: not result.get("partial"),
+        )
+    else:
+        retrieval = retrieve()
+    sources = retrieval["sources"]
+    details = {"pruned": retrieval["pruned"], "top_k_used": retrieval["top_k_used"]}
+    if retrieval.get("partial"):
+        details.update(partial=True, missing_shards=retrieval["missing_shards"])
+    if not sources:
+        return {"answer": NO_MATCH_ANSWER, "sources": [], **details}
+
+    llm_response = generate_for_task(
+        TASK_DOC_QA,
+        build_user_prompt(cleaned, sources),
+        system=prompts.LEGAL_DOC_QA_SYSTEM_PROMPT,
+        accept=lambda answer: has_valid_citations(answer, len(sources)),
+    )
+    sources = _expand_cited_occurrences(llm_response.content, sources, retrieval.get("occurrences", {}))
+    return {"answer": llm_response.content, "sources": sources, **details}
@@ -1,13 +1,14 @@
 """DOCX parsing utilities."""
 from __future__ import annotations
 
+from io import BytesIO
 from pathlib import Path
-from zipfile import BadZipFile
-
-from docx import Document
-from docx.opc.exceptions import PackageNotFoundError
+from zipfile import BadZipFile, ZipFile
 
 ALLOWED_EXTENSIONS: set[str] = {".docx"}
+DOCUMENT_PART = "word/document.xml"
+WORD_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W = f"{{{WORD_NS}}}"
 
 
 def _validate_path(path: Path | None) -> Path:
@@ -27,6 +28,10 @@ def extract_text_from_docx(path: Path) -> str:
     ValueError when the file is missing, of the wrong type, or corrupted.
     """
     _validate_path(path)
+    # python-docx is imported on first use to keep app startup light.
+    from docx import Document
+    from docx.opc.exceptions import PackageNotFoundError
+
     try:
         doc = Document(path)
     except (PackageNotFoundError, BadZipFile, OSError, ValueError) as exc:
@@ -49,4 +54,46 @@ def extract_text_from_docx(path: Path) -> str:
                     if text:
                         parts.append(text)
 
-    return "\n".join(parts)
\ No newline at end of file
+    return "\n".join(parts)
+
+
+def parse_document_xml(data: bytes):
+    """Return the parsed root of word/document.xml from in-memory DOCX bytes."""
+    from lxml import etree
+
+    try:
+        with ZipFile(BytesIO(data)) as package:
+            xml = package.read(DOCUMENT_PART)
+        return etree.fromstring(xml)
+    except (BadZipFile, KeyError, etree.XMLSyntaxError) as exc:
+        raise ValueError("Invalid or corrupted DOCX file.") from exc
+
+
+def iter_paragraph_elements(root):
+    """All w:p elements of the body in document order (including tables)."""
+    body = root.find(f"{W}body")
+    if body is None:
+        return iter(())
+    return body.iter(f"{W}p")
+
+
+def iter_own(paragraph, tag: str):
+    """Descendants with `tag` that belong to this paragraph, not a nested one
+    (text boxes embed whole paragraphs inside a run)."""
+    for node in paragraph.iter(tag):
+        if next(node.iterancestors(f"{W}p"), None) is paragraph:
+            yield node
+
+
+def paragraph_text(paragraph) -> str:
+    return "".join(node.text or "" for node in iter_own(paragraph, f"{W}t"))
+
+
+def extract_paragraphs_from_docx_bytes(data: bytes) -> list[str]:
+    """Paragraph texts in document order, one entry per w:p (may be empty).
+
+    Indices line up with docx_writer.patch_docx_paragraphs, so callers can
+    rewrite selected paragraphs and patch them back into the same package.
+    """
+    root = parse_document_xml(data)
+    return [paragraph_text(paragraph) for paragraph in iter_paragraph_elements(root)]
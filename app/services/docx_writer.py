@@ -1,9 +1,9 @@
 """DOCX writer utilities for rewritten text."""
 from __future__ import annotations
 
+from io import BytesIO
 from pathlib import Path
-
-from docx import Document
+from zipfile import ZipFile
 
 
 def _is_heading(line: str) -> bool:
@@ -19,6 +19,8 @@ def _is_heading(line: str) -> bool:
 
 def write_docx(text: str, output_path: Path) -> Path:
     """Write rewritten text to a DOCX file with simple headings/paragraphs."""
+    from docx import Document
+
     doc = Document()
     for line in text.splitlines():
         stripped = line.strip()
@@ -30,3 +32,54 @@ def write_docx(text: str, output_path: Path) -> Path:
             doc.add_paragraph(stripped)
     doc.save(output_path)
     return output_path
+
+
+def _set_paragraph_text(paragraph, text: str) -> None:
+    """Replace a paragraph's text while keeping its pPr and first run's rPr.
+
+    The new text goes into the first run that carried text; text, tabs and
+    line breaks are removed from the remaining runs. Page breaks, drawings
+    and fields are left in place.
+    """
+    from app.services.document_parser import W, iter_own
+
+    runs = [run for run in iter_own(paragraph, f"{W}r") if run.find(f"{W}t") is not None]
+    if not runs:
+        return
+    for run in runs:
+        for child in list(run):
+            is_text_break = child.tag == f"{W}br" and child.get(f"{W}type") in (None, "textWrapping")
+            if child.tag in (f"{W}t", f"{W}tab", f"{W}cr") or is_text_break:
+                run.remove(child)
+    target = runs[0].makeelement(f"{W}t", {})
+    target.text = text
+    # Preserve leading/trailing spaces, which Word otherwise trims.
+    target.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+    runs[0].append(target)
+
+
+def patch_docx_paragraphs(data: bytes, replacements: dict[int, str]) -> bytes:
+    """Return a copy of the DOCX package with selected paragraphs rewritten.
+
+    ``replacements`` maps paragraph indices (as returned by
+    document_parser.extract_paragraphs_from_docx_bytes) to new text. Only
+    word/document.xml is re-serialized; every other part is copied with its
+    original bytes, compression and timestamps, so styles, numbering, headers
+    and media are untouched. Everything happens in memory.
+    """
+    from lxml import etree
+
+    from app.services.document_parser import DOCUMENT_PART, iter_paragraph_elements, parse_document_xml
+
+    root = parse_document_xml(data)
+    for idx, paragraph in enumerate(iter_paragraph_elements(root)):
+        if idx in replacements:
+            _set_paragraph_text(paragraph, replacements[idx])
+    document_xml = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    output = BytesIO()
+    with ZipFile(BytesIO(data)) as source, ZipFile(output, "w") as target:
+        for info in source.infolist():
+            payload = document_xml if info.filename == DOCUMENT_PART else source.read(info)
+            target.writestr(info, payload)
+    return output.getvalue()
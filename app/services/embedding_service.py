@@ -1,52 +1,73 @@
 """Embedding helper for RAG ingestion."""
 from __future__ import annotations
 
-import os
 from typing import Any
 
-import requests
-from dotenv import load_dotenv
+import numpy as np
 
-load_dotenv()
+from app.config import Settings, get_settings
+from app.services import http_client, vector_codec
+from app.services.resilience import get_upstream
 
+DEFAULT_BATCH_SIZE = 256
 
-def _get_target_dim() -> int | None:
-    raw = os.getenv("EMBEDDING_DIM")
-    if not raw:
-        return None
-    try:
-        return int(raw)
-    except ValueError:
-        return None
 
+def _adjust_dim(matrix: np.ndarray, target_dim: int | None) -> np.ndarray:
+    """Truncate (Matryoshka-style, renormalized) or zero-pad rows to target_dim."""
+    if target_dim is None or matrix.shape[1] == target_dim:
+        return matrix
+    if matrix.shape[1] > target_dim:
+        return vector_codec.l2_normalize(np.ascontiguousarray(matrix[:, :target_dim]))
+    # Zero padding keeps the norm, so cosine scores are unchanged.
+    return np.pad(matrix, ((0, 0), (0, target_dim - matrix.shape[1])))
 
-def _adjust_dim(vector: list[float], target_dim: int | None) -> list[float]:
-    if target_dim is None:
-        return vector
-    if len(vector) > target_dim:
-        return vector[:target_dim]
-    if len(vector) < target_dim:
-        return vector + [0.0] * (target_dim - len(vector))
-    return vector
 
+def _embed_batch(texts: list[str], settings: Settings) -> np.ndarray:
+    # base64 skips materializing the response as Python floats; set
+    # OPENAI_EMBED_ENCODING_FORMAT=float for providers that do not support it.
+    payload = {
+        "model": settings.openai_embed_model,
+        "input": texts,
+        "encoding_format": settings.openai_embed_encoding_format,
+    }
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    def post(timeout: float) -> dict[str, Any]:
+        resp = http_client.get_session().post(
+            settings.openai_embed_api_base,
+            headers={
+                "Authorization": f"Bearer {settings.openai_api_key}",
+                "Content-Type": "application/json",
+            },
+            json=payload,
+            timeout=timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    data = get_upstream("embeddings").call(post)
+
+    items = sorted(data.get("data", []), key=lambda item: item.get("index", 0))
+    if not items:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack([vector_codec.decode_embedding(item["embedding"]) for item in items])
+
+
+def embed_texts(texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+    """Embed texts into a contiguous (len(texts), dim) float32 array."""
+    settings = get_settings()
+    if not settings.openai_api_key:
         raise ValueError("OPENAI_API_KEY is required for embeddings.")
 
-    endpoint = os.getenv("OPENAI_EMBED_API_BASE", "https://api.openai.com/v1/embeddings")
-    model = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
-    payload = {"model": model, "input": texts}
-
-    resp = requests.post(
-        endpoint,
-        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-        json=payload,
-        timeout=30,
-    )
-    resp.raise_for_status()
-    data: dict[str, Any] = resp.json()
-
-    target_dim = _get_target_dim()
-    return [_adjust_dim(item["embedding"], target_dim) for item in data.get("data", [])]
+    target_dim = settings.embedding_dim
+    result: np.ndarray | None = None
+    for start in range(0, len(texts), batch_size):
+        batch = _adjust_dim(_embed_batch(texts[start : start + batch_size], settings), target_dim)
+        if batch.shape[0] != len(texts[start : start + batch_size]):
+            raise RuntimeError("Embedding count does not match input count.")
+        if result is None:
+            # Preallocate once so large ingests never hold per-batch copies.
+            result = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+        result[start : start + batch.shape[0]] = batch
+    if result is None:
+        return np.empty((0, target_dim or 0), dtype=np.float32)
+    return result
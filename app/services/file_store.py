@@ -13,26 +13,69 @@ ALLOWED_CONTENT_TYPES: set[str] = {
     # Some browsers send generic octet-stream; we'll rely on extension check too.
     "application/octet-stream",
 }
+# Batch endpoints also take a zip of DOCX files.
+ARCHIVE_EXTENSIONS: set[str] = {".zip"}
+ARCHIVE_CONTENT_TYPES: set[str] = {"application/zip", "application/x-zip-compressed"}
 DEFAULT_MAX_BYTES = 5 * 1024 * 1024  # 5 MB
 READ_CHUNK_BYTES = 1024 * 1024
 
 
-def _validate_extension(filename: str | None) -> str:
+def is_archive(filename: str | None) -> bool:
+    return bool(filename) and Path(filename).suffix.lower() in ARCHIVE_EXTENSIONS
+
+
+def _validate_extension(filename: str | None, allowed: set[str] = ALLOWED_EXTENSIONS) -> str:
+    expected = " or ".join(sorted(allowed))
     if not filename:
-        raise ValueError("Filename missing; please upload a .docx file.")
+        raise ValueError(f"Filename missing; please upload a {expected} file.")
     ext = Path(filename).suffix.lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        raise ValueError("Unsupported file type; please upload a .docx file.")
+    if ext not in allowed:
+        raise ValueError(f"Unsupported file type; please upload a {expected} file.")
     return ext
 
 
-def _validate_content_type(content_type: str | None) -> None:
+def _validate_content_type(content_type: str | None, allowed: set[str] = ALLOWED_CONTENT_TYPES) -> None:
     if content_type is None:
         return
-    if content_type not in ALLOWED_CONTENT_TYPES:
+    if content_type not in allowed:
         raise ValueError("Unsupported content type; please upload a DOCX file.")
 
 
+def _iter_upload_chunks(upload: UploadFile, max_bytes: int):
+    """Yield the upload in 1 MB chunks, enforcing the size cap as we go."""
+    # Start from the beginning in case the upload stream was read earlier.
+    try:
+        upload.file.seek(0)
+    except Exception:
+        pass
+
+    total = 0
+    while True:
+        chunk = upload.file.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise ValueError(f"File too large; max allowed is {max_bytes / (1024 * 1024):g} MB.")
+        yield chunk
+
+
+def read_upload_bytes(upload: UploadFile, max_bytes: int = DEFAULT_MAX_BYTES, allow_archive: bool = False) -> bytes:
+    """Read a validated UploadFile fully into memory (no temp file).
+
+    Applies the same extension, content-type and size checks as
+    save_upload_to_temp, also accepting a .zip when allow_archive is set;
+    raises ValueError on failure.
+    """
+    if allow_archive:
+        _validate_extension(upload.filename, ALLOWED_EXTENSIONS | ARCHIVE_EXTENSIONS)
+        _validate_content_type(upload.content_type, ALLOWED_CONTENT_TYPES | ARCHIVE_CONTENT_TYPES)
+    else:
+        _validate_extension(upload.filename)
+        _validate_content_type(upload.content_type)
+    return b"".join(_iter_upload_chunks(upload, max_bytes))
+
+
 def save_upload_to_temp(upload: UploadFile, max_bytes: int = DEFAULT_MAX_BYTES) -> Path:
     """Persist an UploadFile to a temporary file with basic validation.
 
@@ -42,23 +85,10 @@ def save_upload_to_temp(upload: UploadFile, max_bytes: int = DEFAULT_MAX_BYTES)
     ext = _validate_extension(upload.filename)
     _validate_content_type(upload.content_type)
 
-    # Start from the beginning in case the upload stream was read earlier.
-    try:
-        upload.file.seek(0)
-    except Exception:
-        pass
-
     temp = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-    total = 0
     try:
         # Stream the upload in 1 MB chunks to avoid large memory spikes.
-        while True:
-            chunk = upload.file.read(READ_CHUNK_BYTES)
-            if not chunk:
-                break
-            total += len(chunk)
-            if total > max_bytes:
-                raise ValueError("File too large; max allowed is 5 MB.")
+        for chunk in _iter_upload_chunks(upload, max_bytes):
             temp.write(chunk)
         temp.flush()
     except Exception:
@@ -69,4 +99,4 @@ def save_upload_to_temp(upload: UploadFile, max_bytes: int = DEFAULT_MAX_BYTES)
     else:
         # Close handle so callers can safely read/unlink.
         temp.close()
-        return Path(temp.name)
\ No newline at end of file
+        return Path(temp.name)
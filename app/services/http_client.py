@@ -0,0 +1,29 @@
+"""Shared HTTP session for outbound API calls.
+
+Reusing one pooled session keeps TCP/TLS connections to the LLM and embedding
+providers alive between requests instead of reconnecting on every call.
+"""
+from __future__ import annotations
+
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_MAXSIZE = 32
+
+_SESSION: requests.Session | None = None
+_LOCK = Lock()
+
+
+def get_session() -> requests.Session:
+    global _SESSION
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _SESSION = session
+    return _SESSION
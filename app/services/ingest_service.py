@@ -3,23 +3,91 @@ from __future__ import annotations
 
 import uuid
 from pathlib import Path
+from typing import Any
 
-from app.services import chunker, document_parser, embedding_service, vector_store
+import numpy as np
 
+from app.config import get_settings
+from app.services import (
+    chunk_store,
+    chunker,
+    cpu_pool,
+    dedup,
+    doc_index,
+    embedding_service,
+    metrics,
+    resilience,
+    sharding,
+    vector_store,
+)
 
-def ingest_docx(path: Path) -> dict[str, int | str]:
-    raw_text = document_parser.extract_text_from_docx(path)
-    normalized = chunker.normalize_text(raw_text)
-    chunks = chunker.chunk_text(normalized, max_chars=200)
+# Keeps occurrence lists well inside Pinecone's 40 KB per-vector metadata limit.
+MAX_OCCURRENCES = 500
+# Longest wait for a duplicate's vector that a concurrent ingest is still storing.
+PENDING_WAIT_SECONDS = 60.0
+# Vectors handled per filtered query when deleting a document (Pinecone returns
+# at most 1000 matches with metadata).
+DELETE_PAGE_SIZE = 1000
+
+
+def format_occurrence(doc_id: str, chunk_index: int, filename: str) -> str:
+    # Pinecone metadata lists must hold strings, so occurrences are packed.
+    return f"{doc_id}|{chunk_index}|{filename}"
+
+
+def parse_occurrence(raw: str) -> dict[str, Any]:
+    doc_id, chunk_index, filename = raw.split("|", 2)
+    return {"doc_id": doc_id, "chunk_index": int(chunk_index), "source": filename}
+
+
+def _document_metadata(total: int, filename: str, shard: str | None = None) -> dict[str, Any]:
+    metadata: dict[str, Any] = {"chunk_count": total, "source_filename": filename}
+    if shard:
+        # Pins the document to one shard (region/matter) instead of hash routing.
+        metadata[sharding.SHARD_METADATA_KEY] = shard
+    return metadata
+
+
+def _chunk_metadata(doc_id: str, idx: int, total: int, filename: str, shard: str | None = None) -> dict[str, Any]:
+    return {"doc_id": doc_id, "chunk_index": idx, **_document_metadata(total, filename, shard)}
+
+
+def _pending_wait() -> float:
+    """How long to wait for pending duplicates: the request budget left, at most PENDING_WAIT_SECONDS."""
+    left = resilience.remaining()
+    if left is None:
+        return PENDING_WAIT_SECONDS
+    if left <= 0:
+        raise resilience.DeadlineExceeded("dedup_wait")
+    return min(left, PENDING_WAIT_SECONDS)
+
+
+def ingest_docx(path: Path, shard: str | None = None) -> dict[str, int | str]:
+    if shard and shard not in dict(get_settings().vector_shards):
+        raise ValueError(f"Unknown shard {shard!r}; configure it in VECTOR_SHARDS.")
+    chunks = cpu_pool.run(chunker.chunk_docx, path, chunker.CHUNK_CHARS, size_hint=path.stat().st_size)
     if not chunks:
         raise ValueError("No content available for indexing.")
 
+    doc_id = uuid.uuid4().hex
+    # Stored first, so excerpts are available as soon as the vectors are visible.
+    store = chunk_store.get_store()
+    store.put_document(doc_id, path.name, chunks)
+    try:
+        if get_settings().dedup_enabled:
+            return _ingest_deduplicated(path, doc_id, chunks, shard)
+        return _ingest_all(path, doc_id, chunks, shard)
+    except Exception:
+        store.delete_document(doc_id)
+        raise
+
+
+def _ingest_all(path: Path, doc_id: str, chunks: list[str], shard: str | None = None) -> dict[str, int | str]:
     vectors = embedding_service.embed_texts(chunks)
     if len(vectors) != len(chunks):
         raise RuntimeError("Embedding count does not match chunk count.")
 
     index = vector_store.get_index()
-    doc_id = uuid.uuid4().hex
     total = len(chunks)
     payload = []
 
@@ -28,14 +96,221 @@ def ingest_docx(path: Path) -> dict[str, int | str]:
             {
                 "id": f"{doc_id}-{idx}",
                 "values": vector,
-                "metadata": {
-                    "doc_id": doc_id,
-                    "chunk_index": idx,
-                    "chunk_count": total,
-                    "source_filename": path.name,
-                },
+                "metadata": _chunk_metadata(doc_id, idx, total, path.name, shard),
             }
         )
 
     vector_store.upsert_vectors(index, payload)
+    doc_index.upsert_document(doc_id, vectors, _document_metadata(total, path.name, shard))
     return {"doc_id": doc_id, "chunk_count": total, "vectors_upserted": total}
+
+
+def _ingest_deduplicated(
+    path: Path, doc_id: str, chunks: list[str], shard: str | None = None
+) -> dict[str, int | str]:
+    """Embed and store only chunks not seen before; duplicates become occurrences.
+
+    Each stored vector lists every (doc, chunk) it stands for in its
+    ``occurrences`` metadata (plus ``doc_ids``), so boilerplate repeated across
+    agreements costs one embedding and one index slot. A document pinned to a
+    shard is never merged into a vector pinned elsewhere, so residency holds.
+    """
+    registry = dedup.get_registry()
+    index = vector_store.get_index()
+    total = len(chunks)
+    stats = {dedup.DUPLICATE_EXACT: 0, dedup.DUPLICATE_NEAR: 0}
+    new: dict[str, dict[str, Any]] = {}
+    new_texts: list[str] = []
+    additions: dict[str, list[tuple[int, str, str, np.ndarray]]] = {}
+
+    # The registry lock covers registry reads and writes only; embedding and
+    # upserts run without it. Chunks registered here stay pending until this
+    # ingest settles them, so a concurrent ingest of the same text waits for
+    # the vector instead of storing a second copy.
+    with registry.lock:
+        for idx, chunk in enumerate(chunks):
+            digest, signature = dedup.content_hash(chunk), dedup.minhash(chunk)
+            found = registry.find(digest, signature, chunk)
+            if found is None:
+                _register_new(
+                    new, new_texts, registry, doc_id, idx, total, path.name, chunk, digest, signature, shard
+                )
+                continue
+            target, kind = found
+            stats[kind] += 1
+            if target in new:
+                _append_occurrences(new[target], [format_occurrence(doc_id, idx, path.name)], [doc_id])
+            else:
+                additions.setdefault(target, []).append((idx, chunk, digest, signature))
+
+    try:
+        registry.wait_settled(list(additions), timeout=_pending_wait())
+        existing = vector_store.fetch_vectors(index, list(additions))
+        with registry.lock:
+            for target in list(additions):
+                if target in existing:
+                    if existing[target]["metadata"].get(sharding.SHARD_METADATA_KEY) == shard:
+                        continue
+                else:
+                    # The registry outlived the vector (e.g. a reset local index, or the
+                    # ingest that registered it failed): store these again.
+                    registry.remove([target])
+                for idx, chunk, digest, signature in additions.pop(target):
+                    _register_new(
+                        new, new_texts, registry, doc_id, idx, total, path.name, chunk, digest, signature, shard
+                    )
+
+        # Nothing to embed when every chunk was already stored.
+        vectors = embedding_service.embed_texts(new_texts) if new_texts else []
+        if len(vectors) != len(new_texts):
+            raise RuntimeError("Embedding count does not match chunk count.")
+        payload = [
+            {"id": vector_id, "values": vector, "metadata": metadata}
+            for (vector_id, metadata), vector in zip(new.items(), vectors)
+        ]
+        vector_store.upsert_vectors(index, payload)
+    except Exception:
+        registry.remove(list(new))
+        raise
+    registry.settle(list(new))
+
+    if additions:
+        with registry.merge_lock:
+            # Re-read under the merge lock: another ingest may have appended since the fetch above.
+            current = vector_store.fetch_vectors(index, list(additions))
+            for target, items in additions.items():
+                metadata = current.get(target, existing[target])["metadata"]
+                occurrences = [format_occurrence(doc_id, idx, path.name) for idx, *_ in items]
+                vector_store.update_metadata(index, target, _append_occurrences(metadata, occurrences, [doc_id]))
+
+    # The document vector covers shared chunks too, so it is built from every
+    # vector this document maps to, not only the newly embedded ones.
+    shared = [existing[target]["values"] for target in additions]
+    doc_index.upsert_document(doc_id, [*vectors, *shared], _document_metadata(total, path.name, shard))
+
+    metrics.incr("ingest.chunks", total)
+    metrics.incr("ingest.duplicates.exact", stats[dedup.DUPLICATE_EXACT])
+    metrics.incr("ingest.duplicates.near", stats[dedup.DUPLICATE_NEAR])
+    return {
+        "doc_id": doc_id,
+        "chunk_count": total,
+        "vectors_upserted": len(new),
+        "duplicates_exact": stats[dedup.DUPLICATE_EXACT],
+        "duplicates_near": stats[dedup.DUPLICATE_NEAR],
+    }
+
+
+def delete_document(doc_id: str) -> dict[str, int] | None:
+    """Remove a document's vectors, document vector and stored chunks; None if unknown.
+
+    Every vector that names the document (its own chunks, and deduplicated
+    vectors listing it in ``doc_ids``) is found with a metadata-filtered
+    query, so this works from any worker and after restarts. A vector that
+    other documents still map to is kept: this document's occurrences are
+    dropped from it and, if it was this document's own chunk, it is
+    re-attributed to the next occurrence.
+    """
+    store = chunk_store.get_store()
+    index = vector_store.get_index()
+    doc_vector = vector_store.fetch_vectors(vector_store.get_doc_index(), [doc_id]).get(doc_id)
+    document = store.document(doc_id)
+    probe = _probe_vector(index, doc_id, doc_vector, document)
+
+    seen: set[str] = set()
+    deleted: list[str] = []
+    kept = 0
+    registry = dedup.get_registry()
+    with registry.merge_lock:
+        while probe is not None:
+            # Handled vectors stop matching the filter; `seen` guards against stale reads.
+            result = vector_store.query_vector(
+                index, probe, top_k=DELETE_PAGE_SIZE, filter=doc_index.chunk_filter([doc_id])
+            )
+            matches = [match for match in result.get("matches", []) if str(match.get("id")) not in seen]
+            if not matches:
+                break
+            page: list[str] = []
+            for match in matches:
+                vector_id = str(match.get("id"))
+                seen.add(vector_id)
+                update = _detach(store, doc_id, match.get("metadata") or {})
+                if update is None:
+                    page.append(vector_id)
+                else:
+                    vector_store.update_metadata(index, vector_id, update)
+                    kept += 1
+            vector_store.delete_vectors(index, page)
+            deleted.extend(page)
+    if document is None and doc_vector is None and not seen:
+        return None
+    registry.remove(deleted)
+    if doc_vector is not None:
+        vector_store.delete_vectors(vector_store.get_doc_index(), [doc_id])
+    store.delete_document(doc_id)
+    metrics.incr("ingest.documents_deleted")
+    return {"doc_id": doc_id, "vectors_deleted": len(deleted), "vectors_kept": kept}
+
+
+def _probe_vector(
+    index, doc_id: str, doc_vector: dict[str, Any] | None, document: dict[str, Any] | None
+) -> Any | None:
+    """Any vector of the index's dimension, to run filter-only queries with."""
+    if doc_vector is not None:
+        return doc_vector["values"]
+    total = document["chunk_count"] if document is not None else 1
+    for vector in vector_store.fetch_vectors(index, [f"{doc_id}-{idx}" for idx in range(total)]).values():
+        return vector["values"]
+    dim = get_settings().embedding_dim
+    return np.eye(1, dim, dtype=np.float32)[0] if dim else None
+
+
+def _detach(store: chunk_store.ChunkStore, doc_id: str, metadata: dict[str, Any]) -> dict[str, Any] | None:
+    """Metadata update that removes `doc_id` from a vector; None when nothing else uses it."""
+    remaining = [doc for doc in metadata.get("doc_ids") or [] if doc != doc_id]
+    occurrences = [raw for raw in metadata.get("occurrences") or [] if parse_occurrence(raw)["doc_id"] != doc_id]
+    if not remaining or not occurrences:
+        return None
+    update: dict[str, Any] = {"occurrences": occurrences, "doc_ids": remaining}
+    if metadata.get("doc_id") == doc_id:
+        owner = parse_occurrence(occurrences[0])
+        update.update(doc_id=owner["doc_id"], chunk_index=owner["chunk_index"], source_filename=owner["source"])
+        owner_document = store.document(owner["doc_id"])
+        if owner_document is not None:
+            update["chunk_count"] = owner_document["chunk_count"]
+    return update
+
+
+def _register_new(
+    new: dict[str, dict[str, Any]],
+    new_texts: list[str],
+    registry: dedup.DedupRegistry,
+    doc_id: str,
+    idx: int,
+    total: int,
+    filename: str,
+    chunk: str,
+    digest: str,
+    signature: np.ndarray,
+    shard: str | None = None,
+) -> None:
+    vector_id = f"{doc_id}-{idx}"
+    metadata = _chunk_metadata(doc_id, idx, total, filename, shard)
+    metadata.update(
+        content_hash=digest,
+        occurrences=[format_occurrence(doc_id, idx, filename)],
+        doc_ids=[doc_id],
+    )
+    new[vector_id] = metadata
+    new_texts.append(chunk)
+    registry.add(vector_id, digest, signature, chunk)
+
+
+def _append_occurrences(metadata: dict[str, Any], occurrences: list[str], doc_ids: list[str]) -> dict[str, Any]:
+    """Add occurrences (capped) and doc ids to metadata in place; returns the changed keys."""
+    merged = list(metadata.get("occurrences") or [])
+    merged.extend(occurrences)
+    known_docs = list(metadata.get("doc_ids") or [])
+    known_docs.extend(doc for doc in doc_ids if doc not in known_docs)
+    metadata["occurrences"] = merged[:MAX_OCCURRENCES]
+    metadata["doc_ids"] = known_docs[:MAX_OCCURRENCES]
+    return {"occurrences": metadata["occurrences"], "doc_ids": metadata["doc_ids"]}
@@ -6,30 +6,53 @@ caching, or safety checks in one place.
 
 from __future__ import annotations
 
-import os
-from dataclasses import dataclass
-from typing import Any
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable
 
-import requests
-from dotenv import load_dotenv
+from app.config import get_settings
+from app.services import http_client, metrics, model_router
+from app.services.resilience import CircuitOpenError, DeadlineExceeded, get_upstream, is_retryable, retry_after_hint
+from app.services.llm_scheduler import PRIORITY_INTERACTIVE, estimate_tokens, get_scheduler
+from app.services.single_flight import SingleFlight, make_key
 
-# Load environment variables from a local .env file if present
-load_dotenv()
 
+# Retry-After for a failed call when the upstream response gave no hint.
+FAILED_RETRY_AFTER_SECONDS = 5.0
 
-@dataclass
+
+@dataclass(frozen=True)
 class LLMResponse:
     content: str
+    model: str | None = None
+
+
+class LLMCallFailedError(RuntimeError):
+    """The LLM call still failed after its retries.
+
+    Raised instead of returning the error as an answer; the API serves it as
+    503 when the failure is transient (timeouts, 429, 5xx), else 502, both
+    with Retry-After.
+    """
+
+    def __init__(self, cause: BaseException) -> None:
+        super().__init__(f"The language model call failed ({cause}); please retry shortly.")
+        self.status_code = 503 if is_retryable(cause) else 502
+        self.retry_after = retry_after_hint(cause) or FAILED_RETRY_AFTER_SECONDS
+
+
+# Identical prompts in flight at the same time share one upstream call.
+_GENERATION_FLIGHTS: SingleFlight[LLMResponse] = SingleFlight("llm_generation")
 
 
 def get_api_key() -> str | None:
     """Fetch API key from environment variables."""
-    return os.getenv("OPENAI_API_KEY")
+    return get_settings().openai_api_key
 
 
 def get_default_model() -> str:
     """Allow environment override for model; default to gpt-4o-mini."""
-    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    return get_settings().openai_model
 
 
 def _build_messages(user_prompt: str, system_prompt: str | None) -> list[dict[str, Any]]:
@@ -45,6 +68,7 @@ def generate_text(
     model: str | None = None,
     system: str | None = None,
     max_tokens: int = 350,
+    priority: str = PRIORITY_INTERACTIVE,
 ) -> LLMResponse:
     """
     Call the OpenAI-compatible chat completions API.
@@ -54,6 +78,8 @@ def generate_text(
         model: Optional model id; defaults to env OPENAI_MODEL or gpt-4o-mini if not provided.
         system: Optional system persona to prepend.
         max_tokens: Cap on generated tokens.
+        priority: Scheduler class ("interactive", "batch" or "ingest"); raises
+            SchedulerOverloadedError when the call is shed.
     """
     api_key = get_api_key()
     if not api_key:
@@ -61,7 +87,8 @@ def generate_text(
             content="OpenAI API key is missing. Set OPENAI_API_KEY in your .env file."
         )
 
-    endpoint = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1/chat/completions")
+    settings = get_settings()
+    endpoint = settings.openai_api_base
     model_name = model or get_default_model()
 
     payload = {
@@ -71,18 +98,70 @@ def generate_text(
         "temperature": 0.3,
     }
 
-    try:
-        resp = requests.post(
+    tokens = estimate_tokens(len(prompt) + len(system or ""), max_tokens)
+
+    def call() -> LLMResponse:
+        with get_scheduler().slot(priority, tokens):
+            started = time.monotonic()
+            try:
+                response = _post_completion(endpoint, api_key, payload)
+            except LLMCallFailedError:
+                model_router.record_outcome(model_name, time.monotonic() - started, False)
+                raise
+        model_router.record_outcome(model_name, time.monotonic() - started, True)
+        return replace(response, model=model_name)
+
+    if not settings.single_flight_enabled:
+        return call()
+    # Coalesced followers wait on the leader and never take a scheduler slot.
+    return _GENERATION_FLIGHTS.do(make_key(endpoint, payload), call)
+
+
+def _post_completion(endpoint: str, api_key: str, payload: dict[str, Any]) -> LLMResponse:
+    def post(timeout: float) -> str:
+        resp = http_client.get_session().post(
             endpoint,
             headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
             json=payload,
-            timeout=15,
+            timeout=timeout,
         )
         resp.raise_for_status()
-        data = resp.json()
-        content = data["choices"][0]["message"]["content"]
-        return LLMResponse(content=content)
+        return resp.json()["choices"][0]["message"]["content"]
+
+    try:
+        return LLMResponse(content=get_upstream("llm").call(post))
+    except (DeadlineExceeded, CircuitOpenError):
+        # Surfaced as 504/503 by the API instead of being dressed up as an answer.
+        raise
     except Exception as exc:  # Pragmatic catch-all for network/API issues
-        return LLMResponse(
-            content=f"LLM call failed: {exc}. Please retry or check your API key/settings."
-        )
+        raise LLMCallFailedError(exc) from exc
+
+
+def generate_for_task(
+    task: str,
+    prompt: str,
+    system: str | None = None,
+    max_tokens: int = 350,
+    priority: str = PRIORITY_INTERACTIVE,
+    accept: Callable[[str], bool] | None = None,
+) -> LLMResponse:
+    """Generate with the routed model, escalating once if the answer is rejected.
+
+    `accept` is a cheap check on the first answer (e.g. citations present);
+    when it fails, or the first call raises LLMCallFailedError, and a larger
+    model is configured, the call is repeated on that model and its answer
+    is returned as-is.
+    """
+    route = model_router.choose(task, len(prompt) + len(system or ""))
+    try:
+        response = generate_text(prompt, model=route.model, system=system, max_tokens=max_tokens, priority=priority)
+    except LLMCallFailedError:
+        if route.escalation_model is None:
+            raise
+    else:
+        if route.escalation_model is None or accept is None or accept(response.content):
+            return response
+    metrics.incr(f"model_router.{task}.escalated")
+    return generate_text(
+        prompt, model=route.escalation_model, system=system, max_tokens=max_tokens, priority=priority
+    )
@@ -0,0 +1,224 @@
+"""Admission control and priority scheduling for LLM calls.
+
+Every completion made through llm_gateway takes a slot here first:
+
+- a global concurrency cap plus a per-class cap (interactive, batch, ingest);
+- token buckets that track the provider's requests/minute and tokens/minute;
+- a priority queue, so waiting interactive Q&A is admitted before queued
+  rewrite or ingest work;
+- load shedding: when the queue is full (or a caller waits too long) the call
+  fails fast with SchedulerOverloadedError, which the API maps to 503 with a
+  Retry-After header.
+
+Waiters block a request thread, so the app's threadpool must be able to hold
+every running and queued call with room to spare (see threadpool_size);
+otherwise requests pile up in front of the threadpool, the queue never fills
+and nothing is shed.
+"""
+from __future__ import annotations
+
+import itertools
+import math
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from threading import Condition
+from typing import Iterator
+
+from app.config import Settings, get_settings
+from app.services import metrics, resilience
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITY_INGEST = "ingest"
+PRIORITY_RANKS = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1, PRIORITY_INGEST: 2}
+# Threads kept free for requests that never reach the scheduler (health, chunks,
+# uploads); matches anyio's default threadpool size.
+THREADPOOL_HEADROOM = 40
+
+
+class SchedulerOverloadedError(RuntimeError):
+    """The LLM queue is saturated; callers should retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilling bucket sized to one minute of budget."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0.0 when available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int,
+        class_limits: dict[str, int],
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_queue_depth: int = 64,
+        queue_timeout: float = 30.0,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.class_limits = {name: class_limits.get(name, max_concurrency) for name in PRIORITY_RANKS}
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self._rpm = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tpm = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._cond = Condition()
+        self._seq = itertools.count()
+        self._waiting: list[tuple[int, int, str]] = []
+        self._active = 0
+        self._class_active = {name: 0 for name in PRIORITY_RANKS}
+        self._avg_service_s = 1.0
+
+    def _next_eligible(self) -> tuple[int, int, str] | None:
+        """Highest-priority waiter whose class still has a free slot."""
+        if self._active >= self.max_concurrency:
+            return None
+        for ticket in sorted(self._waiting):
+            if self._class_active[ticket[2]] < self.class_limits[ticket[2]]:
+                return ticket
+        return None
+
+    def _rate_wait(self, tokens: int) -> float:
+        now = time.monotonic()
+        waits = [0.0]
+        if self._rpm is not None:
+            waits.append(self._rpm.wait_time(1, now))
+        if self._tpm is not None:
+            waits.append(self._tpm.wait_time(tokens, now))
+        return max(waits)
+
+    def _retry_after(self) -> float:
+        backlog = len(self._waiting) + self._active
+        return float(max(1, math.ceil(backlog * self._avg_service_s / max(1, self.max_concurrency))))
+
+    def _publish_gauges(self) -> None:
+        metrics.set_value("llm_scheduler.queue_depth", len(self._waiting))
+        metrics.set_value("llm_scheduler.active", self._active)
+
+    def _acquire(self, priority: str, tokens: int) -> None:
+        with self._cond:
+            ticket = (PRIORITY_RANKS[priority], next(self._seq), priority)
+            self._waiting.append(ticket)
+            if len(self._waiting) > self.max_queue_depth and not (
+                self._next_eligible() == ticket and self._rate_wait(tokens) == 0.0
+            ):
+                # Only calls that would actually have to wait are shed.
+                self._waiting.remove(ticket)
+                metrics.incr(f"llm_scheduler.shed.{priority}")
+                raise SchedulerOverloadedError("LLM queue is full; please retry shortly.", self._retry_after())
+            self._publish_gauges()
+            queued_at = time.monotonic()
+            budget = resilience.remaining()
+            bounded_by_request = budget is not None and budget < self.queue_timeout
+            deadline = queued_at + (budget if bounded_by_request else self.queue_timeout)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if bounded_by_request:
+                            raise resilience.DeadlineExceeded("llm_queue")
+                        metrics.incr(f"llm_scheduler.queue_timeouts.{priority}")
+                        raise SchedulerOverloadedError(
+                            "Timed out waiting for LLM capacity; please retry shortly.", self._retry_after()
+                        )
+                    if self._next_eligible() == ticket:
+                        rate_wait = self._rate_wait(tokens)
+                        if rate_wait == 0.0:
+                            break
+                        self._cond.wait(min(rate_wait, remaining))
+                    else:
+                        self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # Whoever is next may now be eligible (or the head left the queue).
+                self._cond.notify_all()
+
+            if self._rpm is not None:
+                self._rpm.take(1)
+            if self._tpm is not None:
+                self._tpm.take(tokens)
+            self._active += 1
+            self._class_active[priority] += 1
+            self._publish_gauges()
+        metrics.incr(f"llm_scheduler.admitted.{priority}")
+        metrics.incr(f"llm_scheduler.wait_ms.{priority}", round((time.monotonic() - queued_at) * 1000))
+
+    def _release(self, priority: str, service_s: float) -> None:
+        with self._cond:
+            self._active -= 1
+            self._class_active[priority] -= 1
+            self._avg_service_s = 0.8 * self._avg_service_s + 0.2 * service_s
+            self._publish_gauges()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str, estimated_tokens: int) -> Iterator[None]:
+        """Block until the call may proceed; raises SchedulerOverloadedError when shed."""
+        if priority not in PRIORITY_RANKS:
+            raise ValueError(f"Unknown LLM priority class: {priority}")
+        self._acquire(priority, estimated_tokens)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - started)
+
+
+def estimate_tokens(prompt_chars: int, max_tokens: int) -> int:
+    """Rough TPM charge: ~4 characters per prompt token plus the output cap."""
+    return prompt_chars // 4 + max_tokens
+
+
+def threadpool_size(settings: Settings) -> int:
+    """Request threadpool size that lets the LLM queue fill (and shed) before the pool does.
+
+    THREADPOOL_SIZE=0 sizes it automatically; an explicit size that cannot hold
+    every running and queued LLM call plus one free thread is a configuration
+    error.
+    """
+    llm_threads = settings.llm_max_concurrency + settings.llm_max_queue_depth
+    if settings.threadpool_size == 0:
+        return llm_threads + THREADPOOL_HEADROOM
+    if settings.threadpool_size <= llm_threads:
+        raise ValueError(
+            f"THREADPOOL_SIZE must exceed LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE_DEPTH ({llm_threads}), "
+            "or queued LLM calls exhaust the threadpool before any are shed."
+        )
+    return settings.threadpool_size
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> LLMScheduler:
+    settings = get_settings()
+    return LLMScheduler(
+        max_concurrency=settings.llm_max_concurrency,
+        class_limits=dict(settings.llm_class_limits),
+        requests_per_minute=settings.llm_requests_per_minute,
+        tokens_per_minute=settings.llm_tokens_per_minute,
+        max_queue_depth=settings.llm_max_queue_depth,
+        queue_timeout=settings.llm_queue_timeout_seconds,
+    )
@@ -0,0 +1,328 @@
+"""In-process vector index with a Pinecone-compatible surface.
+
+Used as a local stand-in for Pinecone (offline load tests, dev setups) via
+VECTOR_STORE_BACKEND=memory. Only the subset of the Index API that the app
+calls is implemented, including simple metadata filters ($eq, $ne, $in, $nin,
+$and, $or).
+
+Vectors are kept L2-normalized in one contiguous float32 matrix (or int8 codes
+plus per-row scales when ``quantization="int8"``), so a query is a single
+matrix-vector product. Rows are also indexed by their ``doc_id`` and
+``doc_ids`` metadata, so a filter pinned to documents (``{"doc_id": {"$in":
+[...]}}``, or the ``$or`` of both fields that two-stage retrieval sends)
+scores only those documents' rows instead of scanning every row's metadata.
+"""
+from __future__ import annotations
+
+from threading import Lock
+from typing import Any, Iterator
+
+import numpy as np
+
+from app.services import vector_codec
+
+QUANTIZATION_MODES = ("none", "int8")
+_INITIAL_CAPACITY = 64
+
+
+def _matches_value(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    # As in Pinecone, a list-valued field matches when any element does.
+    values = value if isinstance(value, list) else [value]
+    for op, operand in condition.items():
+        if op == "$eq":
+            ok = operand in values
+        elif op == "$ne":
+            ok = operand not in values
+        elif op == "$in":
+            ok = any(item in operand for item in values)
+        elif op == "$nin":
+            ok = not any(item in operand for item in values)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches_filter(metadata: dict[str, Any], filter: dict[str, Any]) -> bool:
+    """Evaluate the subset of Pinecone's metadata filter language used by the app."""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key in metadata:
+            if not _matches_value(metadata[key], condition):
+                return False
+        elif not (isinstance(condition, dict) and set(condition) <= {"$ne", "$nin"}):
+            # A missing field only satisfies negative conditions.
+            return False
+    return True
+
+
+# Metadata fields naming the document(s) a row belongs to.
+_DOC_FIELDS = ("doc_id", "doc_ids")
+
+
+def _doc_keys(metadata: dict[str, Any]) -> list[tuple[str, Any]]:
+    keys = []
+    for field in _DOC_FIELDS:
+        value = metadata.get(field)
+        if value is not None:
+            keys.extend((field, item) for item in (value if isinstance(value, list) else [value]))
+    return keys
+
+
+def _pinned_values(condition: Any) -> list[Any] | None:
+    if not isinstance(condition, dict):
+        return [condition]
+    if set(condition) == {"$eq"}:
+        return [condition["$eq"]]
+    if set(condition) == {"$in"}:
+        return list(condition["$in"])
+    return None
+
+
+def _pinned_keys(filter: dict[str, Any]) -> tuple[list[tuple[str, Any]], dict[str, Any]] | None:
+    """Document keys that bound a filter's matches, plus the clauses left to check.
+
+    Handles a document field at the top level and an ``$or`` whose every
+    clause is a single document-field condition; None when neither applies.
+    """
+    for field in _DOC_FIELDS:
+        values = _pinned_values(filter[field]) if field in filter else None
+        if values is not None:
+            return [(field, value) for value in values], {key: cond for key, cond in filter.items() if key != field}
+    clauses = filter.get("$or")
+    if not clauses:
+        return None
+    keys: list[tuple[str, Any]] = []
+    for clause in clauses:
+        if len(clause) != 1:
+            return None
+        [(field, condition)] = clause.items()
+        values = _pinned_values(condition) if field in _DOC_FIELDS else None
+        if values is None:
+            return None
+        keys.extend((field, value) for value in values)
+    return keys, {key: cond for key, cond in filter.items() if key != "$or"}
+
+
+class InMemoryIndex:
+    """Thread-safe index scored by cosine similarity."""
+
+    # Lets vector_store pass float32 arrays through without list conversion.
+    accepts_arrays = True
+
+    def __init__(self, quantization: str = "none") -> None:
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError("quantization must be 'none' or 'int8'.")
+        self.quantization = quantization
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._metadata: list[dict[str, Any]] = []
+        self._doc_rows: dict[tuple[str, Any], set[int]] = {}
+        self._matrix: np.ndarray | None = None
+        self._scales: np.ndarray | None = None
+        self._lock = Lock()
+
+    @property
+    def dimension(self) -> int:
+        return 0 if self._matrix is None else int(self._matrix.shape[1])
+
+    def _ensure_capacity(self, needed: int, dim: int) -> None:
+        if self._matrix is None:
+            capacity = max(_INITIAL_CAPACITY, needed)
+            dtype = np.int8 if self.quantization == "int8" else np.float32
+            self._matrix = np.zeros((capacity, dim), dtype=dtype)
+            self._scales = np.ones(capacity, dtype=np.float32)
+            return
+        if dim != self._matrix.shape[1]:
+            raise ValueError(f"Vector dimension {dim} does not match index dimension {self._matrix.shape[1]}.")
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, dim), dtype=self._matrix.dtype)
+        grown[: len(self._ids)] = self._matrix[: len(self._ids)]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[: len(self._ids)] = self._scales[: len(self._ids)]
+        self._matrix, self._scales = grown, scales
+
+    def _link_locked(self, row: int) -> None:
+        for key in _doc_keys(self._metadata[row]):
+            self._doc_rows.setdefault(key, set()).add(row)
+
+    def _unlink_locked(self, row: int) -> None:
+        for key in _doc_keys(self._metadata[row]):
+            rows = self._doc_rows.get(key)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._doc_rows[key]
+
+    def _filtered_rows_locked(self, filter: dict[str, Any], count: int) -> np.ndarray:
+        pinned = _pinned_keys(filter)
+        if pinned is None:
+            candidates: Any = range(count)
+            rest = filter
+        else:
+            # Gather the pinned documents' rows; only the other clauses need checking.
+            keys, rest = pinned
+            candidates = sorted(set().union(*(self._doc_rows.get(key, ()) for key in keys)))
+        if rest:
+            candidates = (row for row in candidates if matches_filter(self._metadata[row], rest))
+        return np.fromiter(candidates, dtype=np.intp)
+
+    def _encode(self, matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        normalized = vector_codec.l2_normalize(vector_codec.as_matrix(matrix))
+        if self.quantization == "int8":
+            return vector_codec.quantize_int8(normalized)
+        return normalized, np.ones(normalized.shape[0], dtype=np.float32)
+
+    def upsert(self, vectors: list[dict[str, Any]], **_: Any) -> dict[str, int]:
+        if not vectors:
+            return {"upserted_count": 0}
+        codes, scales = self._encode(np.stack([np.asarray(item["values"], dtype=np.float32) for item in vectors]))
+        with self._lock:
+            self._ensure_capacity(len(self._ids) + len(vectors), codes.shape[1])
+            for offset, item in enumerate(vectors):
+                vector_id = str(item["id"])
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[vector_id] = row
+                    self._ids.append(vector_id)
+                    self._metadata.append({})
+                self._matrix[row] = codes[offset]
+                self._scales[row] = scales[offset]
+                self._unlink_locked(row)
+                self._metadata[row] = dict(item.get("metadata") or {})
+                self._link_locked(row)
+        return {"upserted_count": len(vectors)}
+
+    def query(
+        self,
+        vector: Any,
+        top_k: int = 10,
+        include_metadata: bool = False,
+        filter: dict[str, Any] | None = None,
+        **_: Any,
+    ) -> dict[str, Any]:
+        query = vector_codec.l2_normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or top_k <= 0:
+                return {"matches": [], "namespace": ""}
+            if filter:
+                # Score only the rows that pass the filter.
+                rows = self._filtered_rows_locked(filter, count)
+                if rows.size == 0:
+                    return {"matches": [], "namespace": ""}
+                scores = (self._matrix[rows] @ query) * self._scales[rows]
+            else:
+                rows = None
+                scores = (self._matrix[:count] @ query) * self._scales[:count]
+            k = min(top_k, scores.shape[0])
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            matches = []
+            for position in top:
+                row = rows[position] if rows is not None else position
+                match: dict[str, Any] = {"id": self._ids[row], "score": float(scores[position])}
+                if include_metadata:
+                    match["metadata"] = dict(self._metadata[row])
+                matches.append(match)
+        return {"matches": matches, "namespace": ""}
+
+    def _values(self, row: int) -> np.ndarray:
+        if self.quantization == "int8":
+            return vector_codec.dequantize_int8(self._matrix[row : row + 1], self._scales[row : row + 1])[0]
+        return self._matrix[row].copy()
+
+    def fetch(self, ids: list[str], **_: Any) -> dict[str, Any]:
+        """Stored (unit-length) values and metadata for the ids that exist."""
+        with self._lock:
+            vectors = {}
+            for vector_id in ids:
+                row = self._rows.get(vector_id)
+                if row is not None:
+                    vectors[vector_id] = {
+                        "id": vector_id,
+                        "values": self._values(row),
+                        "metadata": dict(self._metadata[row]),
+                    }
+        return {"vectors": vectors, "namespace": ""}
+
+    def update(
+        self,
+        id: str,
+        values: Any = None,
+        set_metadata: dict[str, Any] | None = None,
+        **_: Any,
+    ) -> dict:
+        """Replace the values and/or merge metadata of an existing vector."""
+        with self._lock:
+            row = self._rows.get(id)
+            if row is None:
+                return {}
+            if values is not None:
+                codes, scales = self._encode(np.asarray(values, dtype=np.float32))
+                self._matrix[row] = codes[0]
+                self._scales[row] = scales[0]
+            if set_metadata:
+                self._unlink_locked(row)
+                self._metadata[row].update(set_metadata)
+                self._link_locked(row)
+        return {}
+
+    def list(self, prefix: str | None = None, limit: int = 100, **_: Any) -> Iterator[list[str]]:
+        """Yield pages of ids, like the Pinecone serverless ``Index.list`` generator."""
+        with self._lock:
+            ids = [vector_id for vector_id in self._ids if not prefix or vector_id.startswith(prefix)]
+        for start in range(0, len(ids), limit):
+            yield ids[start : start + limit]
+
+    def delete(self, ids: list[str] | None = None, delete_all: bool = False, **_: Any) -> dict:
+        with self._lock:
+            if delete_all:
+                self._ids, self._rows, self._metadata, self._doc_rows = [], {}, [], {}
+                self._matrix = self._scales = None
+                return {}
+            for vector_id in ids or []:
+                row = self._rows.pop(vector_id, None)
+                if row is None:
+                    continue
+                self._unlink_locked(row)
+                # Swap the last row into the hole to keep storage contiguous.
+                last = len(self._ids) - 1
+                if row != last:
+                    self._unlink_locked(last)
+                    moved_id = self._ids[last]
+                    self._ids[row] = moved_id
+                    self._metadata[row] = self._metadata[last]
+                    self._matrix[row] = self._matrix[last]
+                    self._scales[row] = self._scales[last]
+                    self._rows[moved_id] = row
+                    self._link_locked(row)
+                self._ids.pop()
+                self._metadata.pop()
+        return {}
+
+    def describe_index_stats(self, **_: Any) -> dict[str, Any]:
+        with self._lock:
+            count = len(self._ids)
+            nbytes = 0
+            if self._matrix is not None:
+                nbytes = self._matrix[:count].nbytes + self._scales[:count].nbytes
+        return {
+            "total_vector_count": count,
+            "dimension": self.dimension,
+            "quantization": self.quantization,
+            "vector_bytes": nbytes,
+        }
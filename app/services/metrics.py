@@ -0,0 +1,38 @@
+"""In-process counters exposed through /api/metrics.
+
+Counters are per worker process and reset on restart; they are meant for
+quick operational insight, not as a replacement for a metrics backend.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from threading import Lock
+
+_COUNTERS: Counter[str] = Counter()
+_LOCK = Lock()
+
+
+def incr(name: str, amount: int | float = 1) -> None:
+    with _LOCK:
+        _COUNTERS[name] += amount
+
+
+def set_value(name: str, value: int | float) -> None:
+    """Record a point-in-time value (gauge) such as a queue depth."""
+    with _LOCK:
+        _COUNTERS[name] = value
+
+
+def get(name: str) -> int | float:
+    with _LOCK:
+        return _COUNTERS.get(name, 0)
+
+
+def snapshot() -> dict[str, int | float]:
+    with _LOCK:
+        return dict(sorted(_COUNTERS.items()))
+
+
+def reset() -> None:
+    with _LOCK:
+        _COUNTERS.clear()
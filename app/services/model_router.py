@@ -0,0 +1,118 @@
+"""Per-call model selection for the LLM gateway.
+
+Two tiers are configured: a small, fast model (LLM_SMALL_MODEL, defaulting to
+OPENAI_MODEL) and an optional large model (LLM_LARGE_MODEL). Each task has a
+default tier; oversized prompts go to the large model, and a tier whose recent
+calls are mostly failing, or too slow for the time left in the request, is
+swapped for the other one. Without a large model every call uses the small
+one, which is the pre-routing behavior.
+
+The gateway uses the chosen model for a first attempt and escalates to the
+large model only when the answer fails the caller's cheap acceptance check.
+"""
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+
+from app.config import get_settings
+from app.services import metrics, resilience
+
+TASK_QA = "qa"
+TASK_DOC_QA = "doc_qa"
+TASK_REWRITE = "rewrite"
+
+TIER_SMALL = "small"
+TIER_LARGE = "large"
+
+# Interactive Q&A starts small (and may escalate); rewrites favour quality.
+TASK_TIERS = {TASK_QA: TIER_SMALL, TASK_DOC_QA: TIER_SMALL, TASK_REWRITE: TIER_LARGE}
+
+_MIN_HEALTH_SAMPLES = 10
+_HEALTH_WINDOW = 50
+
+
+@dataclass(frozen=True)
+class Route:
+    model: str
+    tier: str
+    reason: str
+    escalation_model: str | None
+
+
+class _ModelHealth:
+    """Outcomes of the most recent calls to one model."""
+
+    def __init__(self) -> None:
+        self._calls: deque[tuple[float, bool]] = deque(maxlen=_HEALTH_WINDOW)
+        self._lock = Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._calls.append((seconds, ok))
+
+    def error_rate(self) -> float | None:
+        with self._lock:
+            if len(self._calls) < _MIN_HEALTH_SAMPLES:
+                return None
+            return sum(1 for _, ok in self._calls if not ok) / len(self._calls)
+
+    def median_latency(self) -> float | None:
+        with self._lock:
+            latencies = sorted(seconds for seconds, ok in self._calls if ok)
+        if len(latencies) < _MIN_HEALTH_SAMPLES:
+            return None
+        return latencies[len(latencies) // 2]
+
+
+_HEALTH: dict[str, _ModelHealth] = {}
+_HEALTH_LOCK = Lock()
+
+
+def _health(model: str) -> _ModelHealth:
+    with _HEALTH_LOCK:
+        return _HEALTH.setdefault(model, _ModelHealth())
+
+
+def record_outcome(model: str, seconds: float, ok: bool) -> None:
+    _health(model).record(seconds, ok)
+
+
+def reset_health() -> None:
+    with _HEALTH_LOCK:
+        _HEALTH.clear()
+
+
+def _unhealthy_reason(model: str) -> str | None:
+    health = _health(model)
+    error_rate = health.error_rate()
+    if error_rate is not None and error_rate >= get_settings().router_max_error_rate:
+        return "error_rate"
+    budget = resilience.remaining()
+    latency = health.median_latency()
+    if budget is not None and latency is not None and latency > budget:
+        return "latency"
+    return None
+
+
+def choose(task: str, prompt_chars: int = 0) -> Route:
+    """Pick the model for one call and record the decision in metrics."""
+    settings = get_settings()
+    small = settings.llm_small_model or settings.openai_model
+    large = settings.llm_large_model
+    if not large or large == small:
+        route = Route(small, TIER_SMALL, "single_model", None)
+    else:
+        models = {TIER_SMALL: small, TIER_LARGE: large}
+        tier, reason = TASK_TIERS.get(task, TIER_SMALL), "task"
+        if tier == TIER_SMALL and prompt_chars > settings.router_large_prompt_chars:
+            tier, reason = TIER_LARGE, "prompt_size"
+        other = TIER_LARGE if tier == TIER_SMALL else TIER_SMALL
+        unhealthy = _unhealthy_reason(models[tier])
+        if unhealthy and _unhealthy_reason(models[other]) is None:
+            tier, reason = other, unhealthy
+        route = Route(models[tier], tier, reason, large if tier == TIER_SMALL else None)
+    metrics.incr(f"model_router.{task}.{route.tier}")
+    metrics.incr(f"model_router.reason.{route.reason}")
+    return route
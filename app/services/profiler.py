@@ -0,0 +1,291 @@
+"""Opt-in request profiling and memory snapshots.
+
+Request profiling is statistical: while a profiled request runs, a sampler
+thread reads the stacks of the threads doing that request's work
+(``sys._current_frames``) every PROFILE_INTERVAL_MS and counts folded stacks.
+Only code locations (module and function names) are recorded; frame locals,
+arguments and return values are never read, so no document or question text
+can end up in an artifact.
+
+Each profile is written to PROFILE_DIR as ``<request_id>.folded`` (the
+flamegraph.pl / speedscope input format) and ``<request_id>.svg`` (a
+self-contained flamegraph). The newest PROFILE_MAX_ARTIFACTS requests are
+kept.
+
+Memory snapshots use tracemalloc: the first capture starts tracing and takes a
+baseline, and each later capture returns the top allocation growth by source
+line since the previous one.
+"""
+from __future__ import annotations
+
+import hmac
+import html
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Iterator
+
+from app.config import get_settings
+from app.services import metrics
+
+_REQUEST_ID: ContextVar[str | None] = ContextVar("request_id", default=None)
+_ACTIVE_PROFILE: ContextVar["RequestProfile | None"] = ContextVar("active_profile", default=None)
+_MAX_STACK_DEPTH = 64
+
+
+def set_request_id(request_id: str):
+    return _REQUEST_ID.set(request_id)
+
+
+def current_request_id() -> str | None:
+    return _REQUEST_ID.get()
+
+
+def admin_authorized(token: str | None) -> bool:
+    """True when admin endpoints are enabled and `token` matches ADMIN_TOKEN."""
+    expected = get_settings().admin_token
+    return bool(expected and token and hmac.compare_digest(token.encode(), expected.encode()))
+
+
+def profile_dir() -> Path:
+    configured = get_settings().profile_dir
+    path = configured or Path(tempfile.gettempdir()) / "legal-rewrite-profiles"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _frame_label(frame) -> str:
+    # Module name + function only: nothing from f_locals is ever touched.
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def _fold(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < _MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RequestProfile:
+    def __init__(self, request_id: str) -> None:
+        self.request_id = request_id
+        self.samples: Counter[str] = Counter()
+        self.started = time.monotonic()
+        self._threads: set[int] = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def attach(self) -> Iterator[None]:
+        """Sample the calling thread until the block exits."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads.add(thread_id)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads.discard(thread_id)
+
+    def sample(self, frames: dict[int, Any]) -> None:
+        with self._lock:
+            threads = list(self._threads)
+        for thread_id in threads:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.samples[_fold(frame)] += 1
+
+
+class _Sampler:
+    """One daemon thread sampling every active profile; exits when idle."""
+
+    def __init__(self) -> None:
+        self._profiles: set[RequestProfile] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def active(self) -> int:
+        with self._lock:
+            return len(self._profiles)
+
+    def _run(self) -> None:
+        interval = get_settings().profile_interval_ms / 1000
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+            del frames
+            time.sleep(interval)
+
+
+_SAMPLER = _Sampler()
+
+
+def should_profile(requested: bool) -> bool:
+    """Explicit requests (already authorized by the caller) or the random sample rate."""
+    settings = get_settings()
+    if _SAMPLER.active() >= settings.profile_max_concurrent:
+        return False
+    return requested or (settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate)
+
+
+def start(request_id: str) -> RequestProfile:
+    """Begin profiling the current request; worker threads opt in via attach()."""
+    profile = RequestProfile(request_id)
+    _ACTIVE_PROFILE.set(profile)
+    _SAMPLER.add(profile)
+    metrics.incr("profiler.requests")
+    return profile
+
+
+def current_profile() -> RequestProfile | None:
+    return _ACTIVE_PROFILE.get()
+
+
+@contextmanager
+def attach(profile: RequestProfile | None) -> Iterator[None]:
+    if profile is None:
+        yield
+        return
+    with profile.attach():
+        yield
+
+
+def finish(profile: RequestProfile) -> Path:
+    """Stop sampling and write the folded stacks and SVG flamegraph."""
+    _SAMPLER.remove(profile)
+    directory = profile_dir()
+    folded = "".join(f"{stack} {count}\n" for stack, count in profile.samples.most_common())
+    (directory / f"{profile.request_id}.folded").write_text(folded, encoding="utf-8")
+    svg = render_flamegraph(profile.samples, title=f"request {profile.request_id}")
+    path = directory / f"{profile.request_id}.svg"
+    path.write_text(svg, encoding="utf-8")
+    _prune(directory, get_settings().profile_max_artifacts)
+    return path
+
+
+def _prune(directory: Path, keep: int) -> None:
+    svgs = sorted(directory.glob("*.svg"), key=lambda item: item.stat().st_mtime, reverse=True)
+    for stale in svgs[keep:]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix(".folded").unlink(missing_ok=True)
+
+
+def artifact_path(request_id: str, fmt: str) -> Path | None:
+    path = profile_dir() / f"{request_id}.{fmt}"
+    return path if path.exists() else None
+
+
+def render_flamegraph(samples: Counter[str], title: str = "", width: int = 1200) -> str:
+    """Minimal self-contained SVG flamegraph (root at the bottom)."""
+    tree: dict[str, Any] = {"count": 0, "children": {}}
+    for stack, count in samples.items():
+        node = tree
+        node["count"] += count
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"count": 0, "children": {}})
+            node["count"] += count
+
+    row_height, total = 16, max(tree["count"], 1)
+    rects: list[str] = []
+    depth_seen = 0
+
+    def draw(node: dict[str, Any], x: float, depth: int) -> None:
+        nonlocal depth_seen
+        depth_seen = max(depth_seen, depth)
+        for label, child in sorted(node["children"].items()):
+            w = child["count"] / total * width
+            if w >= 0.5:
+                hue = 10 + (hash(label) % 40)
+                text = html.escape(label)
+                pct = child["count"] / total * 100
+                rects.append(
+                    f'<g><title>{text} ({child["count"]} samples, {pct:.1f}%)</title>'
+                    f'<rect x="{x:.1f}" y="{{y{depth}}}" width="{w:.1f}" height="{row_height - 1}" '
+                    f'fill="hsl({hue},80%,60%)"/>'
+                    + (
+                        f'<text x="{x + 3:.1f}" y="{{t{depth}}}" font-size="11">{text[: int(w / 7)]}</text>'
+                        if w > 30
+                        else ""
+                    )
+                    + "</g>"
+                )
+                draw(child, x, depth + 1)
+            x += w
+
+    draw(tree, 0.0, 0)
+    height = (depth_seen + 2) * row_height
+    body = "\n".join(rects)
+    for depth in range(depth_seen + 1):
+        y = height - (depth + 1) * row_height
+        body = body.replace(f"{{y{depth}}}", str(y)).replace(f"{{t{depth}}}", str(y + 11))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height + 20}" '
+        f'font-family="monospace"><text x="4" y="14" font-size="12">{html.escape(title)} '
+        f"({tree['count']} samples)</text><g transform=\"translate(0,20)\">\n{body}\n</g></svg>\n"
+    )
+
+
+_MEMORY_LOCK = threading.Lock()
+_MEMORY_BASELINE: tracemalloc.Snapshot | None = None
+
+
+def memory_snapshot(limit: int = 25) -> dict[str, Any]:
+    """Start tracing (first call) or diff against the previous snapshot."""
+    global _MEMORY_BASELINE
+    with _MEMORY_LOCK:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(get_settings().tracemalloc_frames)
+            _MEMORY_BASELINE = tracemalloc.take_snapshot()
+            return {"status": "tracing_started", "top": []}
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(_MEMORY_BASELINE, "lineno") if _MEMORY_BASELINE else []
+        _MEMORY_BASELINE = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+    return {
+        "status": "diff",
+        "traced_bytes": current,
+        "peak_bytes": peak,
+        "top": [
+            {
+                # Source locations only; allocation contents are never inspected.
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_diff": stat.size_diff,
+                "size": stat.size,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+
+def stop_memory_tracing() -> dict[str, Any]:
+    global _MEMORY_BASELINE
+    with _MEMORY_LOCK:
+        was_tracing = tracemalloc.is_tracing()
+        tracemalloc.stop()
+        _MEMORY_BASELINE = None
+    return {"status": "stopped" if was_tracing else "not_tracing"}
@@ -3,7 +3,8 @@
 from __future__ import annotations
 
 from app import prompts
-from app.services.llm_gateway import generate_text
+from app.services.llm_gateway import generate_for_task
+from app.services.model_router import TASK_QA
 
 
 
@@ -13,5 +14,7 @@ def answer_question(question: str) -> str:
         f"{question}\n\n"
         "Respond succinctly in 3-6 sentences."
     )
-    llm_response = generate_text(user_prompt, system=prompts.PERSONA_PROMPT)
+    llm_response = generate_for_task(
+        TASK_QA, user_prompt, system=prompts.PERSONA_PROMPT, accept=lambda answer: bool(answer.strip())
+    )
     return llm_response.content
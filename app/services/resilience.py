@@ -0,0 +1,284 @@
+"""Deadlines, retries, hedging and circuit breaking for upstream calls.
+
+A request deadline is set once per endpoint call (``deadline_scope``) and read
+through a context variable, so embedding, vector query and generation each get
+only the budget that is left instead of their own fixed timeout.
+
+``Upstream.call`` wraps one HTTP call to a provider with:
+
+- a per-attempt timeout of min(configured cap, remaining request budget);
+- retries with full-jitter exponential backoff on connection errors,
+  timeouts, 429 and 5xx, never sleeping past the deadline;
+- an optional hedged duplicate, fired once the first attempt has run longer
+  than the recent p95 latency (first success wins);
+- a circuit breaker that fails fast while the provider keeps failing.
+"""
+from __future__ import annotations
+
+import math
+import random
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from threading import Lock
+from typing import Callable, Iterator, TypeVar
+
+import requests
+
+from app.config import get_settings
+from app.services import metrics
+
+T = TypeVar("T")
+
+_DEADLINE: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request budget ran out before `stage` could start or finish."""
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"Request deadline exceeded during {stage}.")
+        self.stage = stage
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream is failing; calls are rejected until the breaker resets."""
+
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(f"{name} is temporarily unavailable; please retry shortly.")
+        self.retry_after = retry_after
+
+
+@contextmanager
+def deadline_scope(seconds: float | None) -> Iterator[None]:
+    """Bound everything in the block to `seconds` (never extends an outer deadline)."""
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current request budget, or None when unbounded."""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(stage: str) -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        metrics.incr(f"deadline.exceeded.{stage}")
+        raise DeadlineExceeded(stage)
+
+
+def stage_timeout(stage: str, cap: float) -> float:
+    """Timeout for the next call: the configured cap or the budget left, whichever is smaller."""
+    check_deadline(stage)
+    left = remaining()
+    return cap if left is None else min(cap, left)
+
+
+class LatencyWindow:
+    """Recent successful-call latencies, used to pick the hedge delay."""
+
+    def __init__(self, size: int = 256, min_samples: int = 20) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self._min_samples = min_samples
+        self._lock = Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        with self._lock:
+            if len(self._samples) < self._min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open probe after a cool-down."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited >= self.reset_seconds and not self._probe_in_flight:
+                # Let a single probe through; its outcome closes or re-opens the circuit.
+                self._probe_in_flight = True
+                return
+            retry_after = max(1.0, self.reset_seconds - waited)
+        metrics.incr(f"circuit.{self.name}.rejected")
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    metrics.incr(f"circuit.{self.name}.opened")
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return False
+
+
+def retry_after_hint(exc: BaseException) -> float | None:
+    """Seconds from the response's Retry-After header; None when missing, malformed or negative."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    try:
+        hint = float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+    return hint if math.isfinite(hint) and hint >= 0 else None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry."""
+    return random.uniform(0.0, min(cap, base * (2**attempt)))
+
+
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+class Upstream:
+    def __init__(
+        self,
+        name: str,
+        timeout_cap: float,
+        max_attempts: int = 3,
+        backoff_base: float = 0.2,
+        backoff_cap: float = 2.0,
+        hedge: bool = False,
+        hedge_percentile: float = 95.0,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.name = name
+        self.timeout_cap = timeout_cap
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker(name, failure_threshold=5, reset_seconds=30.0)
+        self.latency = LatencyWindow()
+
+    def call(self, fn: Callable[[float], T]) -> T:
+        """Run fn(timeout) under the deadline with retries, hedging and the breaker.
+
+        fn must be idempotent: it may be retried and, with hedging, run twice
+        concurrently. Raises DeadlineExceeded, CircuitOpenError, or the last
+        upstream error once retries are exhausted.
+        """
+        for attempt in range(self.max_attempts):
+            timeout = stage_timeout(self.name, self.timeout_cap)
+            self.breaker.before_call()
+            started = time.monotonic()
+            try:
+                result = self._attempt(fn, timeout)
+            except Exception as exc:
+                if not is_retryable(exc):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                metrics.incr(f"upstream.{self.name}.failures")
+                left = remaining()
+                if left is not None and left <= 0:
+                    metrics.incr(f"deadline.exceeded.{self.name}")
+                    raise DeadlineExceeded(self.name) from exc
+                hint = retry_after_hint(exc)
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap) if hint is None else hint
+                # An upstream asking for a longer pause than backoff_cap is not waited for
+                # in a request thread; the error (and its Retry-After) goes to the caller.
+                if attempt + 1 >= self.max_attempts or delay > self.backoff_cap or (left is not None and delay >= left):
+                    raise
+                metrics.incr(f"upstream.{self.name}.retries")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.latency.record(time.monotonic() - started)
+            return result
+        raise AssertionError("unreachable")
+
+    def _attempt(self, fn: Callable[[float], T], timeout: float) -> T:
+        delay = self.latency.percentile(self.hedge_percentile) if self.hedge else None
+        if delay is None or delay >= timeout:
+            return fn(timeout)
+
+        primary = _HEDGE_POOL.submit(fn, timeout)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        metrics.incr(f"upstream.{self.name}.hedged")
+        hedge = _HEDGE_POOL.submit(fn, max(0.001, timeout - delay))
+        pending: set[Future[T]] = {primary, hedge}
+        error: BaseException | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        metrics.incr(f"upstream.{self.name}.hedge_wins")
+                    # The slower request is left to finish (or time out) on its own.
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+@lru_cache(maxsize=None)
+def get_upstream(name: str) -> Upstream:
+    """Shared wrapper per provider ("llm" or "embeddings"), configured from settings."""
+    settings = get_settings()
+    caps = {"llm": settings.llm_timeout_seconds, "embeddings": settings.embed_timeout_seconds}
+    return Upstream(
+        name,
+        timeout_cap=caps[name],
+        max_attempts=settings.upstream_max_attempts,
+        hedge=settings.hedge_requests,
+        hedge_percentile=settings.hedge_percentile,
+        breaker=CircuitBreaker(name, settings.circuit_failure_threshold, settings.circuit_reset_seconds),
+    )
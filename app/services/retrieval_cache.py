@@ -0,0 +1,161 @@
+"""Cache of retrieval results, invalidated by index writes.
+
+Entries are keyed by the normalized query, top_k, any filters and settings
+that shape the result, and the current *index version*. Every write that goes
+through ``vector_store`` (upsert, metadata update, delete) bumps the version,
+so entries from before an ingest can never be served again; they simply age
+out.
+
+Where the version lives decides whether the cache is safe:
+
+- with the local memory backend the index belongs to this process, so every
+  write to it bumps this process's version; an in-process LRU of
+  RETRIEVAL_CACHE_SIZE entries is used;
+- with a shared index (Pinecone) other workers and the CLIs (ingest, snapshot
+  import, doc_index rebuild) write too, so the cache is only enabled with
+  RETRIEVAL_CACHE_DB: a SQLite file holding the version and a shared result
+  tier. Every process that writes the index must point at the same file.
+  Without it the cache is off.
+
+Values are stored as JSON, so every hit is an independent copy.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Any, Callable, TypeVar
+
+from app.config import get_settings
+from app.services import metrics
+from app.services.single_flight import make_key
+
+T = TypeVar("T")
+
+_VERSION_KEY = "index_version"
+
+
+class RetrievalCache:
+    def __init__(self, max_entries: int, db_path: str | None = None, max_db_entries: int = 10_000) -> None:
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._version = 0
+        self._lock = Lock()
+        self._conn: sqlite3.Connection | None = None
+        if db_path:
+            # Several worker processes share the file; WAL lets readers proceed during writes.
+            self._conn = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL)"
+            )
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0)", (_VERSION_KEY,))
+
+    def version(self) -> int:
+        with self._lock:
+            if self._conn is None:
+                return self._version
+            return self._conn.execute("SELECT value FROM meta WHERE key = ?", (_VERSION_KEY,)).fetchone()[0]
+
+    def bump(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = ?", (_VERSION_KEY,))
+                self._conn.execute(
+                    "DELETE FROM results WHERE version < (SELECT value FROM meta WHERE key = ?)", (_VERSION_KEY,)
+                )
+        metrics.incr("retrieval_cache.version_bumps")
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                tier = "memory"
+            elif self._conn is not None:
+                row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                raw, tier = (row[0], "shared") if row else (None, "")
+                if raw is not None:
+                    self._remember_locked(key, raw)
+        if raw is None:
+            metrics.incr("retrieval_cache.misses")
+            return None
+        metrics.incr(f"retrieval_cache.hits.{tier}")
+        return json.loads(raw)
+
+    def put(self, key: str, version: int, value: Any) -> None:
+        raw = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            self._remember_locked(key, raw)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, version, value) VALUES (?, ?, ?)", (key, version, raw)
+                )
+                # Keep the shared tier bounded: drop the oldest rows beyond the cap.
+                self._conn.execute(
+                    "DELETE FROM results WHERE rowid <= (SELECT MAX(rowid) FROM results) - ?",
+                    (self.max_db_entries,),
+                )
+
+    def _remember_locked(self, key: str, raw: str) -> None:
+        self._entries[key] = raw
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+@lru_cache(maxsize=1)
+def get_cache() -> RetrievalCache | None:
+    settings = get_settings()
+    if settings.retrieval_cache_size <= 0:
+        return None
+    if settings.vector_store_backend == "memory":
+        # The index lives in this process: no other process can change it, and
+        # a shared tier would mix results from different workers' indexes.
+        return RetrievalCache(settings.retrieval_cache_size)
+    if not settings.retrieval_cache_db:
+        # A per-process version would miss writes from other workers and the CLIs.
+        return None
+    return RetrievalCache(
+        settings.retrieval_cache_size, settings.retrieval_cache_db, settings.retrieval_cache_db_max_entries
+    )
+
+
+def bump_version() -> None:
+    """Invalidate every cached result; called by vector_store after each write."""
+    cache = get_cache()
+    if cache is not None:
+        cache.bump()
+
+
+def cached(
+    scope: str,
+    parts: tuple[Any, ...],
+    compute: Callable[[], T],
+    cacheable: Callable[[T], bool] = lambda _value: True,
+) -> T:
+    """Return the cached result for (scope, parts, index version), computing it on a miss."""
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    # Read the version first: a write during compute() files the result under
+    # the old version, where no later lookup will find it.
+    version = cache.version()
+    key = make_key(scope, version, *parts)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    value = compute()
+    if cacheable(value):
+        cache.put(key, version, value)
+    return value
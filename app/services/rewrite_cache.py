@@ -0,0 +1,58 @@
+"""Paragraph-level memo of LLM rewrites.
+
+Entries are keyed by a hash of the paragraph text together with everything
+else that shapes the output (goals, notes, model, prompt version), so a
+cached rewrite is only reused when the request would have produced the same
+prompt for that paragraph.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+
+from app.services import metrics
+from app.services.single_flight import make_key
+
+
+def make_paragraph_key(
+    text: str,
+    goals: list[str],
+    notes: str | None,
+    model: str,
+    prompt_version: str,
+) -> str:
+    return make_key(prompt_version, model, goals, notes or "", " ".join(text.split()))
+
+
+class RewriteCache:
+    """Thread-safe LRU mapping paragraph keys to rewritten text."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        metrics.incr("rewrite_cache.hits" if value is not None else "rewrite_cache.misses")
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
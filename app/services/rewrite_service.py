@@ -1,18 +1,60 @@
 """Rewrite service built on top of the LLM gateway."""
 from __future__ import annotations
 
-import time
+import hashlib
+import json
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator
 
 from app import prompts
+from app.config import get_settings
+from app.services import cpu_pool, document_parser, docx_writer, model_router
 from app.services.llm_gateway import generate_text
+from app.services.llm_scheduler import PRIORITY_BATCH
+from app.services.rewrite_cache import RewriteCache, make_paragraph_key
 from app.services.services import lock_service
 
 GOALS_MAX_CHARS = 500
 NOTES_MAX_CHARS = 1000
-LOCK_TTL_SECONDS = 60
+# Added to REWRITE_DEADLINE_SECONDS, so a lock outlives the rewrite that holds it.
+LOCK_TTL_MARGIN_SECONDS = 30
 REWRITE_IN_PROGRESS_MESSAGE = (
     "A rewrite is already running for this document. Please wait and try again."
 )
+MAX_REWRITE_TOKENS = 4096
+# Paragraph text per LLM call, so the rewritten output (~3 characters per token,
+# less room for markers) fits inside MAX_REWRITE_TOKENS instead of being cut off.
+REWRITE_BATCH_CHARS = (MAX_REWRITE_TOKENS - 200) * 3
+_PARAGRAPH_MARKER_RE = re.compile(r"\[\[P(\d+)\]\]")
+
+
+class RewriteInProgressError(ValueError):
+    """Raised when another rewrite holds the lock for the same document."""
+
+
+@dataclass(frozen=True)
+class ParagraphRewrite:
+    paragraphs: list[str]
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # Paragraphs the model did not return, kept with their original text.
+    unchanged: int = 0
+
+
+@dataclass(frozen=True)
+class DocxRewrite:
+    data: bytes
+    cache_hits: int = 0
+    cache_misses: int = 0
+    unchanged: int = 0
+
+
+@lru_cache(maxsize=1)
+def get_cache() -> RewriteCache:
+    return RewriteCache(get_settings().rewrite_cache_size)
 
 
 def _clean_goals(goals: list[str] | None) -> list[str]:
@@ -34,6 +76,26 @@ def _validate_notes(notes: str | None) -> str | None:
     return cleaned or None
 
 
+def validate_options(goals: list[str] | None, notes: str | None) -> tuple[list[str], str | None]:
+    """Clean goals and notes up front; raises ValueError like the rewrite calls would."""
+    return _clean_goals(goals), _validate_notes(notes)
+
+
+def document_id_for(data: bytes) -> str:
+    """Content-derived document ID: the same file always maps to the same ID."""
+    return "docx-" + hashlib.sha256(data).hexdigest()[:32]
+
+
+def lock_key(document_id: str, goals: list[str], notes: str | None) -> str:
+    """Rewrite lock for one document under one set of (cleaned) goals and notes.
+
+    Only an identical rewrite conflicts; the same file rewritten with other
+    goals runs independently.
+    """
+    options = hashlib.sha256(json.dumps([goals, notes]).encode("utf-8")).hexdigest()[:16]
+    return f"rewrite:{document_id}:{options}"
+
+
 def _build_user_prompt(text: str, goals: list[str], notes: str | None) -> str:
     parts = ["Rewrite the document below.\n", "Document:\n", text.strip(), "\n"]
     if goals:
@@ -45,31 +107,186 @@ def _build_user_prompt(text: str, goals: list[str], notes: str | None) -> str:
     return "\n".join(parts)
 
 
-def rewrite_document(
-    document_id: str,
-    text: str,
-    goals: list[str] | None = None,
-    notes: str | None = None,
-) -> str:
+def _build_paragraph_prompt(paragraphs: list[str], goals: list[str], notes: str | None) -> str:
+    marked = "\n\n".join(f"[[P{idx}]] {text.strip()}" for idx, text in enumerate(paragraphs, start=1))
+    parts = [
+        "Rewrite each numbered paragraph of the document below.\n",
+        "Document:\n",
+        marked,
+        "\n",
+    ]
+    if goals:
+        goals_block = "\n".join(f"- {goal}" for goal in goals)
+        parts.extend(["Goals:\n", goals_block, "\n"])
+    if notes:
+        parts.extend(["User notes:\n", notes.strip(), "\n"])
+    parts.append(
+        "Return only the rewritten paragraphs, each starting with its original [[Pn]] "
+        "marker, in the same order. Do not merge, split, add or drop paragraphs."
+    )
+    return "\n".join(parts)
+
+
+def _parse_marked_output(output: str, count: int) -> dict[int, str]:
+    """Map 0-based paragraph positions to rewritten text found in the output."""
+    pieces = _PARAGRAPH_MARKER_RE.split(output)
+    rewritten: dict[int, str] = {}
+    # split() yields [preamble, n1, text1, n2, text2, ...]
+    for number, text in zip(pieces[1::2], pieces[2::2]):
+        position = int(number) - 1
+        cleaned = " ".join(text.split())
+        if 0 <= position < count and cleaned and position not in rewritten:
+            rewritten[position] = cleaned
+    return rewritten
+
+
+def _batches(units: list[str]) -> Iterator[list[int]]:
+    """Group unit positions into runs of at most REWRITE_BATCH_CHARS (an oversized unit goes alone)."""
+    batch: list[int] = []
+    size = 0
+    for idx, text in enumerate(units):
+        if batch and size + len(text) > REWRITE_BATCH_CHARS:
+            yield batch
+            batch, size = [], 0
+        batch.append(idx)
+        size += len(text)
+    if batch:
+        yield batch
+
+
+def _max_tokens_for(text: str) -> int:
+    # Roughly 4 characters per token, with headroom for slightly longer output.
+    return min(MAX_REWRITE_TOKENS, len(text) // 3 + 200)
+
+
+@contextmanager
+def _document_lock(document_id: str, goals: list[str], notes: str | None) -> Iterator[None]:
     cleaned_document_id = document_id.strip() if document_id else ""
     if not cleaned_document_id:
         raise ValueError("Document ID is required.")
 
-    lock_key = f"rewrite:{cleaned_document_id}"
-    if not lock_service.acquire(lock_key, ttl_seconds=LOCK_TTL_SECONDS):
-        raise ValueError(REWRITE_IN_PROGRESS_MESSAGE)
-
+    key = lock_key(cleaned_document_id, goals, notes)
+    ttl = get_settings().rewrite_deadline_seconds + LOCK_TTL_MARGIN_SECONDS
+    token = lock_service.acquire(key, ttl_seconds=ttl)
+    if token is None:
+        raise RewriteInProgressError(REWRITE_IN_PROGRESS_MESSAGE)
     try:
-        time.sleep(10)
+        yield
+    finally:
+        lock_service.release(key, token)
 
+
+def rewrite_document(
+    document_id: str,
+    text: str,
+    goals: list[str] | None = None,
+    notes: str | None = None,
+) -> str:
+    cleaned_goals, cleaned_notes = validate_options(goals, notes)
+    with _document_lock(document_id, cleaned_goals, cleaned_notes):
         if not text or not text.strip():
             raise ValueError("Document text is empty.")
 
-        cleaned_goals = _clean_goals(goals)
-        cleaned_notes = _validate_notes(notes)
         prompt = _build_user_prompt(text, cleaned_goals, cleaned_notes)
 
-        llm_response = generate_text(prompt, system=prompts.REWRITE_PROMPT)
+        llm_response = generate_text(
+            prompt,
+            model=model_router.choose(model_router.TASK_REWRITE).model,
+            system=prompts.REWRITE_PROMPT,
+            priority=PRIORITY_BATCH,
+        )
         return llm_response.content
-    finally:
-        lock_service.release(lock_key)
+
+
+def rewrite_paragraphs(
+    document_id: str,
+    paragraphs: list[str],
+    goals: list[str] | None = None,
+    notes: str | None = None,
+) -> ParagraphRewrite:
+    """Rewrite paragraphs one-for-one, returning a list aligned with the input.
+
+    Blank paragraphs are passed through untouched. Paragraphs already
+    rewritten under the same goals, notes, model and prompt version are served
+    from the cache; the rest go to the LLM in batches of REWRITE_BATCH_CHARS.
+    A failed LLM call raises LLMCallFailedError. Any paragraph the model fails
+    to return (missing or mangled marker) keeps its original text, is not
+    cached and is counted in `unchanged`, so the result always has the
+    original structure.
+    """
+    cleaned_goals, cleaned_notes = validate_options(goals, notes)
+    with _document_lock(document_id, cleaned_goals, cleaned_notes):
+        positions = [idx for idx, text in enumerate(paragraphs) if text.strip()]
+        if not positions:
+            raise ValueError("Document text is empty.")
+
+        # Routed by task only, so the cache key's model is stable across calls.
+        model = model_router.choose(model_router.TASK_REWRITE).model
+        cache = get_cache()
+
+        result = list(paragraphs)
+        pending: list[tuple[int, str]] = []
+        for paragraph_idx in positions:
+            key = make_paragraph_key(
+                paragraphs[paragraph_idx], cleaned_goals, cleaned_notes, model, prompts.REWRITE_PROMPT_VERSION
+            )
+            cached = cache.get(key)
+            if cached is None:
+                pending.append((paragraph_idx, key))
+            else:
+                result[paragraph_idx] = cached
+
+        unchanged = 0
+        units = [paragraphs[paragraph_idx] for paragraph_idx, _ in pending]
+        for batch in _batches(units):
+            prompt = _build_paragraph_prompt([units[unit_idx] for unit_idx in batch], cleaned_goals, cleaned_notes)
+            llm_response = generate_text(
+                prompt,
+                model=model,
+                system=prompts.REWRITE_PROMPT,
+                max_tokens=_max_tokens_for(prompt),
+                priority=PRIORITY_BATCH,
+            )
+            rewritten = _parse_marked_output(llm_response.content, len(batch))
+            for batch_idx, unit_idx in enumerate(batch):
+                paragraph_idx, key = pending[unit_idx]
+                if batch_idx in rewritten:
+                    result[paragraph_idx] = rewritten[batch_idx]
+                    cache.put(key, rewritten[batch_idx])
+                else:
+                    unchanged += 1
+
+        return ParagraphRewrite(
+            paragraphs=result,
+            cache_hits=len(positions) - len(pending),
+            cache_misses=len(pending),
+            unchanged=unchanged,
+        )
+
+
+def rewrite_docx(
+    document_id: str,
+    data: bytes,
+    goals: list[str] | None = None,
+    notes: str | None = None,
+) -> DocxRewrite:
+    """Rewrite a DOCX package in place and return the patched package bytes.
+
+    Paragraph formatting, tables, numbering and every part other than
+    word/document.xml are preserved; no temp files are written.
+    """
+    paragraphs = cpu_pool.run(document_parser.extract_paragraphs_from_docx_bytes, data, size_hint=len(data))
+    if not any(text.strip() for text in paragraphs):
+        raise ValueError("No text found in the document.")
+    rewrite = rewrite_paragraphs(document_id, paragraphs, goals=goals, notes=notes)
+    replacements = {
+        idx: text
+        for idx, (text, original) in enumerate(zip(rewrite.paragraphs, paragraphs))
+        if text != original
+    }
+    return DocxRewrite(
+        data=cpu_pool.run(docx_writer.patch_docx_paragraphs, data, replacements, size_hint=len(data)),
+        cache_hits=rewrite.cache_hits,
+        cache_misses=rewrite.cache_misses,
+        unchanged=rewrite.unchanged,
+    )
@@ -1,16 +1,11 @@
 """Semantic search service for RAG retrieval."""
 from __future__ import annotations
 
-import os
-from pathlib import Path
 from typing import Any
 
-from dotenv import load_dotenv
-
-from app.services import chunker, document_parser, embedding_service, vector_store
-
-ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
-load_dotenv(ENV_PATH, override=True)
+from app.config import get_settings
+from app.services import chunk_store, embedding_service, retrieval_cache, vector_store
+from app.services.single_flight import normalize_text
 
 
 def _sanitize_query(query: str) -> str:
@@ -22,40 +17,30 @@ def _sanitize_query(query: str) -> str:
     return cleaned
 
 
-def _get_doc_root() -> Path:
-    root = os.getenv("RAG_DOC_ROOT")
-    if not root:
-        raise ValueError("RAG_DOC_ROOT is required to load source excerpts.")
-    return Path(root)
-
-
-def _load_excerpt(doc_root: Path, filename: str, chunk_index: int, max_chars: int = 200) -> str:
-    path = doc_root / filename
-    if not path.exists():
-        raise ValueError(f"Source document not found: {path}")
-    raw_text = document_parser.extract_text_from_docx(path)
-    normalized = chunker.normalize_text(raw_text)
-    chunks = chunker.chunk_text(normalized, max_chars=max_chars)
-    if chunk_index < 0 or chunk_index >= len(chunks):
-        raise ValueError("Chunk index out of range for source document.")
-    return chunks[chunk_index]
-
-
 def search(query: str, top_k: int = 5) -> list[dict[str, Any]]:
     cleaned = _sanitize_query(query)
+    settings = get_settings()
+    return retrieval_cache.cached(
+        "search",
+        (normalize_text(cleaned), top_k, settings.openai_embed_model, settings.embedding_dim),
+        lambda: _search(cleaned, top_k),
+    )
+
+
+def _search(cleaned: str, top_k: int) -> list[dict[str, Any]]:
     embedding = embedding_service.embed_texts([cleaned])[0]
 
     index = vector_store.get_index()
-    result = index.query(vector=embedding, top_k=top_k, include_metadata=True)
+    result = vector_store.query_vector(index, embedding, top_k=top_k)
     matches = result.get("matches", [])
 
-    doc_root = _get_doc_root()
     results: list[dict[str, Any]] = []
     for match in matches:
         metadata = match.get("metadata") or {}
         filename = metadata.get("source_filename") or "unknown"
         chunk_index = int(metadata.get("chunk_index", -1))
-        excerpt = _load_excerpt(doc_root, filename, chunk_index)
+        # The ID also fetches the chunk with its neighbours from GET /api/chunks/{id}.
+        excerpt = chunk_store.load_excerpt(metadata.get("doc_id"), filename, chunk_index)
         results.append(
             {
                 "id": match.get("id"),
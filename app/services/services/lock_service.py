@@ -1,24 +1,29 @@
 import time
+import uuid
 from threading import Lock
 
-_LOCKS: dict[str, float] = {}
+# key -> (expires_at, owner token)
+_LOCKS: dict[str, tuple[float, str]] = {}
 _MUTEX = Lock()
 
-def acquire(key: str, ttl_seconds: int = 60) -> bool:
-    """True if lock acquired; False if already held (and not expired)."""
+def acquire(key: str, ttl_seconds: float = 60) -> str | None:
+    """Owner token if the lock was acquired; None if already held (and not expired)."""
     now = time.time()
     with _MUTEX:
-        expires_at = _LOCKS.get(key)
-        if expires_at is not None and expires_at <= now:
+        held = _LOCKS.get(key)
+        if held is not None and held[0] <= now:
             _LOCKS.pop(key, None)
 
         if key in _LOCKS:
-            return False
+            return None
 
-        _LOCKS[key] = now + ttl_seconds
-        return True
+        token = uuid.uuid4().hex
+        _LOCKS[key] = (now + ttl_seconds, token)
+        return token
 
-def release(key: str) -> None:
-    """Release lock (safe if missing)."""
+def release(key: str, token: str) -> None:
+    """Release a lock held with `token` (safe if missing, expired or re-acquired by someone else)."""
     with _MUTEX:
-        _LOCKS.pop(key, None)
\ No newline at end of file
+        held = _LOCKS.get(key)
+        if held is not None and held[1] == token:
+            del _LOCKS[key]
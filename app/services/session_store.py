@@ -0,0 +1,315 @@
+"""Session-scoped document Q&A over a single uploaded DOCX.
+
+An uploaded document is chunked and embedded into its own in-memory index, so
+questions about it never touch the shared vector store and nothing is written
+to RAG_DOC_ROOT. Sessions are dropped when:
+
+- they have not been used for SESSION_TTL_SECONDS;
+- more than SESSION_MAX_SESSIONS exist (least recently used first);
+- their combined size exceeds SESSION_MAX_BYTES (least recently used first).
+
+Without SESSION_STORE_PATH sessions live in process memory, so they are only
+visible to the worker that created them: run a single worker (gunicorn.conf.py
+refuses more). With it, chunks and vectors are kept in a SQLite file shared by
+every worker on the host; the file is the source of truth for expiry and the
+caps, and each worker keeps recently used sessions loaded as a local cache.
+The file holds the uploaded documents' chunk text, so expired rows are
+deleted on every lookup and by the periodic sweep the app runs
+(purge_expired), not only when new sessions are added.
+"""
+from __future__ import annotations
+
+import json
+import secrets
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from threading import Lock
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from app.config import get_settings
+from app.services import chunker, cpu_pool, embedding_service, metrics
+from app.services.memory_index import InMemoryIndex
+
+# Same chunk size as shared-index ingest, so excerpts and citations read alike.
+CHUNK_CHARS = chunker.CHUNK_CHARS
+# How often the app sweeps expired sessions when no request looks them up.
+PURGE_INTERVAL_SECONDS = 60.0
+
+
+class SessionNotFoundError(LookupError):
+    """The session ID is unknown or the session has expired."""
+
+    def __init__(self) -> None:
+        super().__init__("Session not found or expired.")
+
+
+@dataclass
+class Session:
+    session_id: str
+    filename: str
+    chunks: list[str]
+    index: InMemoryIndex
+    nbytes: int
+    last_used: float = field(default=0.0)
+
+
+class _SharedSessions:
+    """SQLite table of sessions shared by every worker; expiry and caps are applied here."""
+
+    def __init__(self, db_path: str | Path) -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, filename TEXT NOT NULL, "
+            "chunks TEXT NOT NULL, vectors BLOB NOT NULL, dim INTEGER NOT NULL, nbytes INTEGER NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+        self._lock = Lock()
+
+    def add(self, session: Session, vectors: np.ndarray, cutoff: float, max_sessions: int, max_bytes: int) -> list[str]:
+        """Store the session and evict past the caps; returns the eviction reasons."""
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        evicted: list[str] = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._conn.execute("DELETE FROM sessions WHERE last_used <= ?", (cutoff,)).rowcount
+                evicted.extend(["ttl"] * expired)
+                self._conn.execute(
+                    "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        session.session_id,
+                        session.filename,
+                        json.dumps(session.chunks),
+                        matrix.tobytes(),
+                        matrix.shape[1],
+                        session.nbytes,
+                        session.last_used,
+                    ),
+                )
+                while True:
+                    count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM sessions").fetchone()
+                    if count <= max_sessions and total <= max_bytes:
+                        break
+                    self._conn.execute(
+                        "DELETE FROM sessions WHERE session_id = "
+                        "(SELECT session_id FROM sessions ORDER BY last_used LIMIT 1)"
+                    )
+                    evicted.append("lru" if count > max_sessions else "memory")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return evicted
+
+    def purge(self, cutoff: float) -> int:
+        """Delete every session last used at or before `cutoff`; returns how many."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM sessions WHERE last_used <= ?", (cutoff,)).rowcount
+
+    def touch(self, session_id: str, now: float, cutoff: float) -> bool:
+        """Refresh last use; False (and the row removed) when missing or expired."""
+        with self._lock:
+            alive = self._conn.execute(
+                "UPDATE sessions SET last_used = ? WHERE session_id = ? AND last_used > ?", (now, session_id, cutoff)
+            ).rowcount
+            if not alive:
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            return bool(alive)
+
+    def load(self, session_id: str) -> tuple[str, list[str], np.ndarray, int, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, chunks, vectors, dim, nbytes, last_used FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        filename, chunks, blob, dim, nbytes, last_used = row
+        return filename, json.loads(chunks), np.frombuffer(blob, dtype=np.float32).reshape(-1, dim), nbytes, last_used
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def stats(self, cutoff: float) -> tuple[int, int]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM sessions WHERE last_used > ?", (cutoff,)
+            ).fetchone()
+
+
+def _build_index(filename: str, vectors: np.ndarray) -> InMemoryIndex:
+    index = InMemoryIndex(quantization=get_settings().vector_quantization)
+    index.upsert(
+        [
+            {"id": f"chunk-{idx}", "values": vector, "metadata": {"chunk_index": idx, "source_filename": filename}}
+            for idx, vector in enumerate(vectors)
+        ]
+    )
+    return index
+
+
+class SessionStore:
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_sessions: int,
+        max_bytes: int,
+        clock: Callable[[], float] = time.time,
+        db_path: str | Path | None = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        # Wall-clock `clock` matters here: last use is compared across processes.
+        self._shared = _SharedSessions(db_path) if db_path else None
+
+    def add(self, filename: str, chunks: list[str], vectors: np.ndarray) -> Session:
+        index = _build_index(filename, vectors)
+        nbytes = index.describe_index_stats()["vector_bytes"] + sum(len(chunk.encode("utf-8")) for chunk in chunks)
+        if nbytes > self.max_bytes:
+            raise ValueError("Document is too large for a Q&A session.")
+        session = Session(secrets.token_urlsafe(16), filename, chunks, index, nbytes, self._clock())
+        if self._shared is not None:
+            cutoff = session.last_used - self.ttl_seconds
+            for reason in self._shared.add(session, vectors, cutoff, self.max_sessions, self.max_bytes):
+                metrics.incr(f"sessions.evicted.{reason}")
+        with self._lock:
+            self._remember_locked(session)
+        metrics.incr("sessions.created")
+        return session
+
+    def get(self, session_id: str) -> Session:
+        if self._shared is not None:
+            return self._get_shared(session_id)
+        with self._lock:
+            self._expire_locked()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise SessionNotFoundError()
+            session.last_used = self._clock()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def _get_shared(self, session_id: str) -> Session:
+        now = self._clock()
+        self._purge_shared(now - self.ttl_seconds)
+        if not self._shared.touch(session_id, now, now - self.ttl_seconds):
+            with self._lock:
+                if session_id in self._sessions:
+                    self._drop_locked(session_id, "ttl")
+                    self._publish_locked()
+            raise SessionNotFoundError()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+                return session
+        # Created by (or evicted from the cache of) another worker: load it from the shared file.
+        loaded = self._shared.load(session_id)
+        if loaded is None:
+            raise SessionNotFoundError()
+        filename, chunks, vectors, nbytes, _last_used = loaded
+        session = Session(session_id, filename, chunks, _build_index(filename, vectors), nbytes, now)
+        metrics.incr("sessions.loaded")
+        with self._lock:
+            self._remember_locked(session)
+        return session
+
+    def purge_expired(self) -> int:
+        """Drop expired sessions now; returns the rows removed from the shared file (every worker's)."""
+        with self._lock:
+            self._expire_locked()
+        if self._shared is None:
+            return 0
+        return self._purge_shared(self._clock() - self.ttl_seconds)
+
+    def _purge_shared(self, cutoff: float) -> int:
+        expired = self._shared.purge(cutoff)
+        if expired:
+            metrics.incr("sessions.evicted.ttl", expired)
+        return expired
+
+    def delete(self, session_id: str) -> bool:
+        deleted = self._shared.delete(session_id) if self._shared is not None else False
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop_locked(session_id, "deleted")
+                self._publish_locked()
+                deleted = True
+        return deleted
+
+    def __len__(self) -> int:
+        if self._shared is not None:
+            return self._shared.stats(self._clock() - self.ttl_seconds)[0]
+        with self._lock:
+            self._expire_locked()
+            return len(self._sessions)
+
+    def _remember_locked(self, session: Session) -> None:
+        self._expire_locked()
+        self._sessions[session.session_id] = session
+        self._bytes += session.nbytes
+        while len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+            reason = "lru" if len(self._sessions) > self.max_sessions else "memory"
+            self._drop_locked(next(iter(self._sessions)), reason)
+        self._publish_locked()
+
+    def _expire_locked(self) -> None:
+        cutoff = self._clock() - self.ttl_seconds
+        # Ordered by last use, so expired sessions are all at the front.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used > cutoff:
+                break
+            self._drop_locked(session_id, "ttl")
+        self._publish_locked()
+
+    def _drop_locked(self, session_id: str, reason: str) -> None:
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.nbytes
+        # With a shared file this only unloads the local copy; evictions are counted in add().
+        metrics.incr(f"sessions.{'unloaded' if self._shared is not None else 'evicted'}.{reason}")
+
+    def _publish_locked(self) -> None:
+        metrics.set_value("sessions.active", len(self._sessions))
+        metrics.set_value("sessions.bytes", self._bytes)
+
+
+def create_session(filename: str, data: bytes) -> Session:
+    """Chunk and embed an uploaded DOCX into a new session."""
+    settings = get_settings()
+    chunks = cpu_pool.run(chunker.chunk_docx_bytes, data, CHUNK_CHARS, size_hint=len(data))
+    if not chunks:
+        raise ValueError("No content available for Q&A.")
+    if len(chunks) > settings.session_max_chunks:
+        raise ValueError(f"Document is too long for a Q&A session (max {settings.session_max_chunks} chunks).")
+    vectors = embedding_service.embed_texts(chunks)
+    if len(vectors) != len(chunks):
+        raise RuntimeError("Embedding count does not match chunk count.")
+    return get_store().add(filename, chunks, vectors)
+
+
+@lru_cache(maxsize=1)
+def get_store() -> SessionStore:
+    settings = get_settings()
+    return SessionStore(
+        settings.session_ttl_seconds,
+        settings.session_max_sessions,
+        settings.session_max_bytes,
+        db_path=settings.session_store_path,
+    )
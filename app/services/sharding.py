@@ -0,0 +1,216 @@
+"""Sharded vector index with parallel query fan-out.
+
+VECTOR_SHARDS splits the corpus across several indexes (for size, or to keep
+a region's or matter's vectors in their own index). ``ShardedIndex`` exposes
+the same surface as a single index, so ingest, retrieval and snapshots work
+unchanged:
+
+- writes go to one shard: the shard named in the vector's ``shard`` metadata
+  (set by ingest for region/matter routing), otherwise a stable hash of its
+  ``doc_id``, so a document's chunks always land together;
+- queries go in parallel to the shards that can match: those named in
+  ``shards=``, and only the pinned ones when the filter constrains ``shard``
+  (a vector carries that key only on the shard it names); otherwise every
+  shard. Each is bounded by SHARD_TIMEOUT_SECONDS and the request deadline,
+  and the per-shard top-k lists are merged with a heap. Shards that fail or
+  miss the deadline are left out and the result is flagged ``partial`` with
+  the shards that are missing;
+- lookups by id (fetch, update, delete) are sent to every shard, since ids
+  alone do not say where a vector lives.
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import chain
+from typing import Any, Iterator
+
+from app.services import metrics, resilience
+
+SHARD_METADATA_KEY = "shard"
+
+_FANOUT_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="shard-query")
+
+
+def _field(item: Any, name: str) -> Any:
+    # Pinecone returns response objects; the local index returns dicts.
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+
+
+def _pinned_shards(filter: dict[str, Any] | None) -> set[str] | None:
+    """Shard names a metadata filter restricts ``shard`` to; None when it does not."""
+    if not filter:
+        return None
+    for clause in [filter, *filter.get("$and", [])]:
+        if SHARD_METADATA_KEY not in clause:
+            continue
+        condition = clause[SHARD_METADATA_KEY]
+        if not isinstance(condition, dict):
+            return {condition}
+        if "$eq" in condition:
+            return {condition["$eq"]}
+        if "$in" in condition:
+            return set(condition["$in"])
+    return None
+
+
+class NamespacedIndex:
+    """A Pinecone namespace presented as its own index."""
+
+    def __init__(self, index, namespace: str) -> None:
+        self._index = index
+        self.namespace = namespace
+
+    def upsert(self, vectors, **kwargs):
+        return self._index.upsert(vectors=vectors, namespace=self.namespace, **kwargs)
+
+    def query(self, **kwargs):
+        return self._index.query(namespace=self.namespace, **kwargs)
+
+    def fetch(self, ids, **kwargs):
+        return self._index.fetch(ids=ids, namespace=self.namespace, **kwargs)
+
+    def update(self, id, **kwargs):
+        return self._index.update(id=id, namespace=self.namespace, **kwargs)
+
+    def list(self, **kwargs):
+        return self._index.list(namespace=self.namespace, **kwargs)
+
+    def delete(self, **kwargs):
+        return self._index.delete(namespace=self.namespace, **kwargs)
+
+    def describe_index_stats(self, **kwargs):
+        return self._index.describe_index_stats(**kwargs)
+
+
+class ShardedIndex:
+    def __init__(self, shards: dict[str, Any], timeout_seconds: float = 2.0) -> None:
+        if not shards:
+            raise ValueError("At least one shard is required.")
+        self.shards = dict(shards)
+        self.timeout_seconds = timeout_seconds
+        self._names = sorted(self.shards)
+        self.accepts_arrays = all(getattr(shard, "accepts_arrays", False) for shard in self.shards.values())
+
+    def shard_for(self, metadata: dict[str, Any] | None, vector_id: str = "") -> str:
+        metadata = metadata or {}
+        explicit = metadata.get(SHARD_METADATA_KEY)
+        if explicit:
+            if explicit not in self.shards:
+                raise ValueError(f"Unknown shard: {explicit}")
+            return explicit
+        key = str(metadata.get("doc_id") or vector_id)
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+        return self._names[digest % len(self._names)]
+
+    def upsert(self, vectors: list[dict[str, Any]], **kwargs: Any) -> dict[str, int]:
+        routed: dict[str, list[dict[str, Any]]] = {}
+        for item in vectors:
+            routed.setdefault(self.shard_for(item.get("metadata"), str(item["id"])), []).append(item)
+        for name, batch in routed.items():
+            self.shards[name].upsert(vectors=batch, **kwargs)
+            metrics.incr(f"shards.{name}.upserted", len(batch))
+        return {"upserted_count": len(vectors)}
+
+    def shards_for(self, shards: list[str] | None = None, filter: dict[str, Any] | None = None) -> list[str]:
+        """Shards a query has to reach: `shards` (default all), less those `filter` rules out."""
+        if shards is None:
+            names = list(self._names)
+        else:
+            unknown = sorted(set(shards) - set(self.shards))
+            if unknown:
+                raise ValueError(f"Unknown shard: {', '.join(unknown)}")
+            names = [name for name in self._names if name in shards]
+        pinned = _pinned_shards(filter)
+        return names if pinned is None else [name for name in names if name in pinned]
+
+    def query(
+        self,
+        vector: Any,
+        top_k: int = 10,
+        include_metadata: bool = False,
+        shards: list[str] | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        targets = self.shards_for(shards, kwargs.get("filter"))
+        if len(targets) < len(self.shards):
+            metrics.incr("shards.skipped", len(self.shards) - len(targets))
+        if not targets:
+            return {"matches": [], "namespace": ""}
+        budget = resilience.remaining()
+        timeout = self.timeout_seconds if budget is None else min(self.timeout_seconds, budget)
+        futures = {
+            _FANOUT_POOL.submit(
+                self.shards[name].query, vector=vector, top_k=top_k, include_metadata=include_metadata, **kwargs
+            ): name
+            for name in targets
+        }
+        done, pending = wait(futures, timeout=timeout)
+        for future in pending:
+            future.cancel()
+
+        per_shard: list[list[dict[str, Any]]] = []
+        missing = [futures[future] for future in pending]
+        for name in missing:
+            metrics.incr(f"shards.{name}.timeouts")
+        errors: list[BaseException] = []
+        for future in done:
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as exc:
+                errors.append(exc)
+                missing.append(name)
+                metrics.incr(f"shards.{name}.errors")
+                continue
+            per_shard.append(
+                [
+                    {"id": _field(match, "id"), "score": _field(match, "score") or 0.0}
+                    | ({"metadata": dict(_field(match, "metadata") or {})} if include_metadata else {})
+                    for match in _field(result, "matches") or []
+                ]
+            )
+        if not per_shard:
+            if errors:
+                raise errors[0]
+            raise resilience.DeadlineExceeded("vector_query")
+
+        # Each shard list is already sorted by score; keep the global best top_k.
+        matches = heapq.nlargest(top_k, chain.from_iterable(per_shard), key=lambda match: match["score"])
+        response: dict[str, Any] = {"matches": matches, "namespace": ""}
+        if missing:
+            metrics.incr("shards.partial_queries")
+            response.update(partial=True, missing_shards=sorted(missing))
+        return response
+
+    def fetch(self, ids: list[str], **kwargs: Any) -> dict[str, Any]:
+        vectors: dict[str, Any] = {}
+        for shard in self.shards.values():
+            vectors.update(_field(shard.fetch(ids=ids, **kwargs), "vectors") or {})
+        return {"vectors": vectors, "namespace": ""}
+
+    def update(self, id: str, **kwargs: Any) -> dict:
+        for shard in self.shards.values():
+            if _field(shard.fetch(ids=[id]), "vectors"):
+                shard.update(id=id, **kwargs)
+        return {}
+
+    def list(self, limit: int = 100, **kwargs: Any) -> Iterator[list[str]]:
+        for name in self._names:
+            yield from self.shards[name].list(limit=limit, **kwargs)
+
+    def delete(self, ids: list[str] | None = None, delete_all: bool = False, **kwargs: Any) -> dict:
+        for shard in self.shards.values():
+            if delete_all:
+                shard.delete(delete_all=True, **kwargs)
+            elif ids:
+                shard.delete(ids=ids, **kwargs)
+        return {}
+
+    def describe_index_stats(self, **kwargs: Any) -> dict[str, Any]:
+        per_shard = {name: shard.describe_index_stats(**kwargs) for name, shard in self.shards.items()}
+        return {
+            "total_vector_count": sum(_field(stats, "total_vector_count") or 0 for stats in per_shard.values()),
+            "shards": per_shard,
+        }
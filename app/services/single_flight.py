@@ -0,0 +1,79 @@
+"""Single-flight coalescing of identical concurrent calls.
+
+While a call for a key is in flight, later callers with the same key wait for
+it and share its result (or exception) instead of repeating the work. Nothing
+is retained once the call finishes, so there is no staleness window. A waiter
+gives up when its own request deadline runs out, even if the call it joined
+has a longer budget.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from threading import Event, Lock
+from typing import Any, Callable, Generic, TypeVar
+
+from app.services import metrics, resilience
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+def make_key(*parts: Any) -> str:
+    """Stable digest of JSON-serializable key parts."""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: dict[str, _Call] = {}
+        self._lock = Lock()
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """Run fn() for key, or wait for the in-flight run and share its outcome."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            metrics.incr(f"single_flight.{self.name}.coalesced")
+            budget = resilience.remaining()
+            if not call.done.wait(None if budget is None else max(0.0, budget)):
+                metrics.incr(f"single_flight.{self.name}.wait_timeouts")
+                raise resilience.DeadlineExceeded(f"single_flight.{self.name}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f"single_flight.{self.name}.executed")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,55 @@
+"""Float32 vector helpers shared by embedding, ingest and local indexes."""
+from __future__ import annotations
+
+import base64
+from typing import Any, Sequence
+
+import numpy as np
+
+INT8_MAX = 127.0
+
+
+def decode_embedding(raw: Any) -> np.ndarray:
+    """Decode one embedding from an API response into a float32 vector.
+
+    Accepts either a list of floats or the base64 string returned when the
+    request used ``encoding_format="base64"``.
+    """
+    if isinstance(raw, str):
+        return np.frombuffer(base64.b64decode(raw), dtype="<f4").astype(np.float32, copy=False)
+    return np.asarray(raw, dtype=np.float32)
+
+
+def as_matrix(vectors: np.ndarray | Sequence[Sequence[float]]) -> np.ndarray:
+    """Return vectors as a contiguous 2-D float32 array."""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix
+
+
+def l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length; all-zero rows are left as zeros."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row scalar quantization to int8 codes plus float32 scales."""
+    matrix = as_matrix(matrix)
+    scales = np.abs(matrix).max(axis=1) / INT8_MAX
+    scales[scales == 0.0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None].astype(np.float32)
+
+
+def to_wire(values: Any) -> list[float]:
+    """Convert a vector to the plain list the Pinecone client serializes."""
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float32, copy=False).tolist()
+    return list(values)
@@ -0,0 +1,195 @@
+"""Export and restore vector index snapshots without re-embedding.
+
+A snapshot is a directory with:
+
+- ``manifest.json``: format version, count, dimension, dtype, embedding
+  model, source backend and a sha256 per data file;
+- ``vectors.f32`` (or ``vectors.i8`` + ``scales.f32`` for int8 snapshots):
+  row-major little-endian vectors, memory-mappable with numpy;
+- ``metadata.jsonl``: one ``{"id", "metadata"}`` object per row, same order.
+
+Everything goes through the vector_store boundary, so the same snapshot can be
+exported from Pinecone and loaded into Pinecone or the local index.
+
+Usage:
+    python -m app.services.vector_snapshot export snapshots/2024-06-01
+    python -m app.services.vector_snapshot import snapshots/2024-06-01 --workers 8
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.config import get_settings
+from app.services import vector_codec, vector_store
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+METADATA_FILE = "metadata.jsonl"
+VECTOR_FILES = {"float32": "vectors.f32", "int8": "vectors.i8"}
+SCALES_FILE = "scales.f32"
+DEFAULT_BATCH_SIZE = 100
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_snapshot(
+    out_dir: Path,
+    index=None,
+    dtype: str = "float32",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> dict[str, Any]:
+    """Stream every vector in the index to `out_dir`; returns the manifest."""
+    if dtype not in VECTOR_FILES:
+        raise ValueError(f"dtype must be one of: {', '.join(VECTOR_FILES)}.")
+    index = index if index is not None else vector_store.get_index()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = [VECTOR_FILES[dtype], METADATA_FILE] + ([SCALES_FILE] if dtype == "int8" else [])
+
+    count, dimension = 0, None
+    with ExitStack() as stack:
+        vectors_out = stack.enter_context((out_dir / VECTOR_FILES[dtype]).open("wb"))
+        metadata_out = stack.enter_context((out_dir / METADATA_FILE).open("w", encoding="utf-8"))
+        scales_out = stack.enter_context((out_dir / SCALES_FILE).open("wb")) if dtype == "int8" else None
+        for ids in vector_store.list_ids(index, page_size=batch_size):
+            fetched = vector_store.fetch_vectors(index, ids)
+            present = [vector_id for vector_id in ids if vector_id in fetched]
+            if not present:
+                continue
+            matrix = vector_codec.as_matrix([fetched[vector_id]["values"] for vector_id in present])
+            if dimension is None:
+                dimension = matrix.shape[1]
+            elif matrix.shape[1] != dimension:
+                raise ValueError("Index returned vectors with mixed dimensions.")
+            if dtype == "int8":
+                codes, scales = vector_codec.quantize_int8(matrix)
+                vectors_out.write(codes.tobytes())
+                scales_out.write(scales.astype("<f4").tobytes())
+            else:
+                vectors_out.write(matrix.astype("<f4").tobytes())
+            for vector_id in present:
+                metadata_out.write(json.dumps({"id": vector_id, "metadata": fetched[vector_id]["metadata"]}))
+                metadata_out.write("\n")
+            count += len(present)
+
+    settings = get_settings()
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "count": count,
+        "dimension": dimension or 0,
+        "dtype": dtype,
+        "embed_model": settings.openai_embed_model,
+        "source_backend": settings.vector_store_backend,
+        "files": {name: _sha256(out_dir / name) for name in files},
+    }
+    (out_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def read_manifest(snapshot_dir: Path, verify: bool = True) -> dict[str, Any]:
+    manifest = json.loads((snapshot_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    if verify:
+        for name, expected in manifest["files"].items():
+            if _sha256(snapshot_dir / name) != expected:
+                raise ValueError(f"Snapshot file {name} failed its checksum.")
+    return manifest
+
+
+def load_vectors(snapshot_dir: Path, manifest: dict[str, Any]) -> np.ndarray:
+    """Memory-map the snapshot's vectors as float32 (int8 is dequantized)."""
+    shape = (manifest["count"], manifest["dimension"])
+    if manifest["count"] == 0:
+        return np.empty(shape, dtype=np.float32)
+    if manifest["dtype"] == "int8":
+        codes = np.memmap(snapshot_dir / VECTOR_FILES["int8"], dtype=np.int8, mode="r", shape=shape)
+        scales = np.fromfile(snapshot_dir / SCALES_FILE, dtype="<f4")
+        return vector_codec.dequantize_int8(codes, scales)
+    return np.memmap(snapshot_dir / VECTOR_FILES["float32"], dtype="<f4", mode="r", shape=shape)
+
+
+def import_snapshot(
+    snapshot_dir: Path,
+    index=None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = 4,
+    verify: bool = True,
+) -> dict[str, Any]:
+    """Upsert a snapshot into the index in parallel batches; no embedding calls."""
+    snapshot_dir = Path(snapshot_dir)
+    manifest = read_manifest(snapshot_dir, verify=verify)
+    index = index if index is not None else vector_store.get_index()
+    vectors = load_vectors(snapshot_dir, manifest)
+
+    upserted = 0
+    in_flight: set[Future] = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot") as pool, (
+        snapshot_dir / METADATA_FILE
+    ).open(encoding="utf-8") as metadata_in:
+        batch: list[dict[str, Any]] = []
+        for row, line in enumerate(metadata_in):
+            record = json.loads(line)
+            batch.append({"id": record["id"], "values": vectors[row], "metadata": record["metadata"]})
+            if len(batch) < batch_size:
+                continue
+            # Bound the number of queued batches so large snapshots stream.
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                upserted += sum(future.result() for future in done)
+            in_flight.add(pool.submit(_upsert_batch, index, batch))
+            batch = []
+        if batch:
+            in_flight.add(pool.submit(_upsert_batch, index, batch))
+        upserted += sum(future.result() for future in in_flight)
+
+    if upserted != manifest["count"]:
+        raise RuntimeError(f"Snapshot lists {manifest['count']} vectors but {upserted} were upserted.")
+    return {"vectors_upserted": upserted, "dimension": manifest["dimension"], "dtype": manifest["dtype"]}
+
+
+def _upsert_batch(index, batch: list[dict[str, Any]]) -> int:
+    vector_store.upsert_vectors(index, batch)
+    return len(batch)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export or import vector index snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="Write the configured index to a snapshot directory.")
+    export_cmd.add_argument("path", type=Path)
+    export_cmd.add_argument("--dtype", choices=sorted(VECTOR_FILES), default="float32")
+    export_cmd.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    import_cmd = sub.add_parser("import", help="Upsert a snapshot into the configured index.")
+    import_cmd.add_argument("path", type=Path)
+    import_cmd.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    import_cmd.add_argument("--workers", type=int, default=4)
+    import_cmd.add_argument("--no-verify", action="store_true", help="Skip checksum verification.")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        result = export_snapshot(args.path, dtype=args.dtype, batch_size=args.batch_size)
+    else:
+        result = import_snapshot(
+            args.path, batch_size=args.batch_size, workers=args.workers, verify=not args.no_verify
+        )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
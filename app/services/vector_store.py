@@ -1,36 +1,220 @@
 """Pinecone vector store helpers."""
 from __future__ import annotations
 
-import os
-from typing import Any
+from threading import RLock
+from typing import TYPE_CHECKING, Any, Iterator
 
-from dotenv import load_dotenv
-from pinecone import Pinecone
+from app.config import get_settings
+from app.services import resilience, retrieval_cache, vector_codec
 
-load_dotenv()
+if TYPE_CHECKING:
+    from app.services.memory_index import InMemoryIndex
+    from app.services.sharding import ShardedIndex
 
+_MEMORY_INDEX: InMemoryIndex | None = None
+_SHARDED_INDEX: ShardedIndex | None = None
+_DOC_INDEX = None
+_PINECONE_INDEX = None
+_INDEX_LOCK = RLock()
 
-def get_index():
-    api_key = os.getenv("PINECONE_API_KEY")
-    index_name = os.getenv("PINECONE_INDEX")
-    if not api_key or not index_name:
+
+def _seed_memory_index(seed_dir) -> None:
+    # Imported lazily: ingest_service depends on this module.
+    from app.services import ingest_service
+
+    for path in sorted(seed_dir.glob("*.docx")):
+        ingest_service.ingest_docx(path)
+
+
+def _seed_local(index) -> None:
+    settings = get_settings()
+    if settings.memory_index_snapshot:
+        from app.services import vector_snapshot
+
+        vector_snapshot.import_snapshot(settings.memory_index_snapshot, index=index)
+        if settings.hierarchical_top_docs:
+            # Snapshots hold chunk vectors only; derive the document vectors.
+            from app.services import doc_index
+
+            doc_index.rebuild(index=index)
+    if settings.memory_index_seed_dir:
+        _seed_memory_index(settings.memory_index_seed_dir)
+
+
+def _get_memory_index() -> InMemoryIndex:
+    global _MEMORY_INDEX
+    with _INDEX_LOCK:
+        if _MEMORY_INDEX is not None:
+            return _MEMORY_INDEX
+        from app.services.memory_index import InMemoryIndex
+
+        _MEMORY_INDEX = InMemoryIndex(quantization=get_settings().vector_quantization)
+        _seed_local(_MEMORY_INDEX)
+        return _MEMORY_INDEX
+
+
+def _pinecone_client():
+    settings = get_settings()
+    if not settings.pinecone_api_key or not settings.pinecone_index:
         raise ValueError("PINECONE_API_KEY and PINECONE_INDEX are required.")
-    client = Pinecone(api_key=api_key)
-    host = os.getenv("PINECONE_HOST")
-    if host:
-        return client.Index(index_name, host=host)
-    return client.Index(index_name)
+    # The SDK is only imported (and the client built) on first use.
+    from pinecone import Pinecone
+
+    return Pinecone(api_key=settings.pinecone_api_key)
+
+
+def _get_pinecone_index():
+    global _PINECONE_INDEX
+    with _INDEX_LOCK:
+        if _PINECONE_INDEX is not None:
+            return _PINECONE_INDEX
+        settings = get_settings()
+        client = _pinecone_client()
+        if settings.pinecone_host:
+            _PINECONE_INDEX = client.Index(settings.pinecone_index, host=settings.pinecone_host)
+        else:
+            _PINECONE_INDEX = client.Index(settings.pinecone_index)
+        return _PINECONE_INDEX
+
+
+def _get_sharded_index() -> ShardedIndex:
+    """One index per VECTOR_SHARDS entry behind a fan-out ShardedIndex."""
+    global _SHARDED_INDEX
+    with _INDEX_LOCK:
+        if _SHARDED_INDEX is not None:
+            return _SHARDED_INDEX
+        from app.services.sharding import NamespacedIndex, ShardedIndex
+
+        settings = get_settings()
+        shards = {}
+        if settings.vector_store_backend == "memory":
+            from app.services.memory_index import InMemoryIndex
+
+            for name, _target in settings.vector_shards:
+                shards[name] = InMemoryIndex(quantization=settings.vector_quantization)
+        else:
+            client = _pinecone_client()
+            for name, target in settings.vector_shards:
+                # A dedicated index (e.g. in another region), else a namespace of the main one.
+                shards[name] = client.Index(target) if target else NamespacedIndex(_get_pinecone_index(), name)
+        _SHARDED_INDEX = ShardedIndex(shards, timeout_seconds=settings.shard_timeout_seconds)
+        if settings.vector_store_backend == "memory":
+            _seed_local(_SHARDED_INDEX)
+        return _SHARDED_INDEX
+
+
+def _get_doc_index_locked():
+    global _DOC_INDEX
+    if _DOC_INDEX is not None:
+        return _DOC_INDEX
+    from app.services.doc_index import DOC_NAMESPACE
+    from app.services.sharding import NamespacedIndex, ShardedIndex
+
+    settings = get_settings()
+    if settings.vector_store_backend == "memory":
+        from app.services.memory_index import InMemoryIndex
+
+        def build(_name, _target):
+            return InMemoryIndex()
+    else:
+        client = _pinecone_client()
+
+        def build(name, target):
+            # Document vectors stay in the same index (and region) as their chunks.
+            if target:
+                return NamespacedIndex(client.Index(target), DOC_NAMESPACE)
+            return NamespacedIndex(_get_pinecone_index(), f"{name}-{DOC_NAMESPACE}" if name else DOC_NAMESPACE)
 
+    if settings.vector_shards:
+        shards = {name: build(name, target) for name, target in settings.vector_shards}
+        _DOC_INDEX = ShardedIndex(shards, timeout_seconds=settings.shard_timeout_seconds)
+    else:
+        _DOC_INDEX = build(None, None)
+    return _DOC_INDEX
 
-def upsert_vector(index, vector_id: str, values: list[float], metadata: dict[str, Any]):
-    index.upsert(vectors=[{"id": vector_id, "values": values, "metadata": metadata}])
+
+def get_doc_index():
+    """The small index of document-level vectors used by hierarchical retrieval."""
+    with _INDEX_LOCK:
+        return _get_doc_index_locked()
+
+
+def get_index():
+    settings = get_settings()
+    if settings.vector_shards:
+        return _get_sharded_index()
+    if settings.vector_store_backend == "memory":
+        return _get_memory_index()
+    return _get_pinecone_index()
+
+
+def is_configured() -> bool:
+    """True when get_index() has what it needs to build a client."""
+    settings = get_settings()
+    if settings.vector_store_backend == "memory":
+        return True
+    return bool(settings.pinecone_api_key and settings.pinecone_index)
+
+
+def _wire_vector(index, values: Any) -> Any:
+    # The local index works on float32 arrays directly; Pinecone needs lists.
+    if getattr(index, "accepts_arrays", False):
+        return values
+    return vector_codec.to_wire(values)
+
+
+# Every write below bumps the retrieval cache's index version, so cached
+# results never outlive the data they were computed from.
+
+
+def upsert_vector(index, vector_id: str, values: Any, metadata: dict[str, Any]):
+    index.upsert(vectors=[{"id": vector_id, "values": _wire_vector(index, values), "metadata": metadata}])
+    retrieval_cache.bump_version()
 
 
 def upsert_vectors(index, vectors: list[dict[str, Any]]):
     if not vectors:
         return
-    index.upsert(vectors=vectors)
+    index.upsert(vectors=[{**item, "values": _wire_vector(index, item["values"])} for item in vectors])
+    retrieval_cache.bump_version()
+
+
+def update_metadata(index, vector_id: str, metadata: dict[str, Any]):
+    """Merge `metadata` into an existing vector's metadata."""
+    index.update(id=vector_id, set_metadata=metadata)
+    retrieval_cache.bump_version()
+
+
+def delete_vectors(index, ids: list[str]):
+    if not ids:
+        return
+    index.delete(ids=ids)
+    retrieval_cache.bump_version()
+
+
+def query_vector(index, values: Any, top_k: int = 3, filter: dict[str, Any] | None = None):
+    resilience.check_deadline("vector_query")
+    kwargs = {"filter": filter} if filter else {}
+    return index.query(vector=_wire_vector(index, values), top_k=top_k, include_metadata=True, **kwargs)
+
+
+def _field(item: Any, name: str) -> Any:
+    # Pinecone returns response objects; the local index returns dicts.
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+
+
+def list_ids(index, page_size: int = 100) -> Iterator[list[str]]:
+    """Yield pages of vector ids (Pinecone serverless or the local index)."""
+    for page in index.list(limit=page_size):
+        yield list(page)
 
 
-def query_vector(index, values: list[float], top_k: int = 3):
-    return index.query(vector=values, top_k=top_k, include_metadata=True)
+def fetch_vectors(index, ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Values and metadata for `ids`, keyed by id; missing ids are omitted."""
+    if not ids:
+        return {}
+    vectors = _field(index.fetch(ids=ids), "vectors") or {}
+    return {
+        vector_id: {"values": _field(item, "values"), "metadata": dict(_field(item, "metadata") or {})}
+        for vector_id, item in vectors.items()
+    }
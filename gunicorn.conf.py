@@ -0,0 +1,48 @@
+"""Gunicorn settings: pre-forked uvicorn workers sharing preloaded imports.
+
+Run with ``gunicorn -c gunicorn.conf.py app.main:app``. Environment overrides:
+WEB_CONCURRENCY (worker count, default one per core), BIND, GUNICORN_TIMEOUT.
+
+Each worker is its own process: metrics, caches, the LLM scheduler's limits
+and the local memory index are per worker. Divide LLM_RPM / LLM_TPM by the
+worker count to stay inside provider limits, and use a shared vector store
+(Pinecone) when running more than one worker.
+
+Every worker also starts its own CPU pool for DOCX work, so the host runs
+workers * (1 + CPU_POOL_WORKERS) processes. Unless CPU_POOL_WORKERS is set,
+each pool gets cores // workers processes (1 to 4), so pool processes across
+all workers add up to about one per core; WEB_CONCURRENCY is exported for that
+below.
+
+Q&A sessions are only shared between workers through SESSION_STORE_PATH; with
+more than one worker and no path set, startup is refused rather than letting
+requests for a session land on a worker that has never seen it.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+# Read by the app's settings to size each worker's CPU pool.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+if workers > 1 and not os.getenv("SESSION_STORE_PATH", "").strip():
+    raise RuntimeError(
+        f"WEB_CONCURRENCY={workers} needs SESSION_STORE_PATH (a SQLite file shared by the workers); "
+        "in-memory Q&A sessions are only visible to the worker that created them. "
+        "Set it, or run with WEB_CONCURRENCY=1."
+    )
+
+# Import the app once in the master; workers fork with modules already loaded
+# (the CPU pool and HTTP clients are created lazily, after the fork).
+preload_app = True
+
+# Recycle workers periodically to contain memory growth from large uploads.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = 100
+
+# Longer than REWRITE_DEADLINE_SECONDS so deadlines fire before the watchdog.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,214 @@
+"""Manual load driver for the Q&A, doc Q&A and rewrite endpoints.
+
+Runs against a live server (normally wired to tests/stub_openai_server.py and
+VECTOR_STORE_BACKEND=memory, so no API quota is spent) and reports p50/p95/p99
+latency, throughput and error rate per endpoint at a target concurrency.
+
+Example:
+
+    python tests/stub_openai_server.py --port 9100 &
+    OPENAI_API_KEY=stub \\
+    OPENAI_API_BASE=http://127.0.0.1:9100/v1/chat/completions \\
+    OPENAI_EMBED_API_BASE=http://127.0.0.1:9100/v1/embeddings \\
+    VECTOR_STORE_BACKEND=memory MEMORY_INDEX_SEED_DIR=RAG_Source_Doc \\
+    RAG_DOC_ROOT=RAG_Source_Doc MIN_RELEVANCE_SCORE=0.25 uvicorn app.main:app --port 8000 &
+    python tests/manual_load_test.py --concurrency 16 --duration 60
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable
+
+import requests
+from docx import Document
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+QA_QUESTIONS = [
+    "How should a notice period clause be drafted?",
+    "What makes a confidentiality clause enforceable?",
+    "How do I word a payment in lieu of notice provision?",
+    "What should a holiday carry-over clause say?",
+]
+DOC_QA_QUESTIONS = [
+    "What is the clause for holiday pay?",
+    "What is the standard notice period for termination?",
+    "Which penguin breeds are defined in the test clause?",
+    "When does completion occur in a property purchase?",
+    "Who pays Stamp Duty Land Tax?",
+]
+
+
+def _build_docx_bytes() -> bytes:
+    buffer = BytesIO()
+    doc = Document()
+    doc.add_heading("Sample Agreement", level=2)
+    doc.add_paragraph("This agreement is made between the parties on the date signed.")
+    doc.add_paragraph("The employee shall give one month written notice to terminate.")
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile; returns 0.0 for an empty sample."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+
+    def record(self, endpoint: str, latency_ms: float, status: int | str, ok: bool) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(latency_ms)
+            self.statuses[endpoint][str(status)] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, elapsed_s: float) -> dict[str, dict[str, Any]]:
+        report: dict[str, dict[str, Any]] = {}
+        with self._lock:
+            for endpoint, samples in sorted(self.latencies.items()):
+                count = len(samples)
+                errors = self.errors[endpoint]
+                report[endpoint] = {
+                    "requests": count,
+                    "errors": errors,
+                    "error_rate": round(errors / count, 4) if count else 0.0,
+                    "throughput_rps": round(count / elapsed_s, 2) if elapsed_s else 0.0,
+                    "p50_ms": round(percentile(samples, 50), 1),
+                    "p95_ms": round(percentile(samples, 95), 1),
+                    "p99_ms": round(percentile(samples, 99), 1),
+                    "statuses": dict(self.statuses[endpoint]),
+                }
+        return report
+
+
+def _make_callers(base_url: str, timeout: float) -> dict[str, Callable[[requests.Session], requests.Response]]:
+    docx_bytes = _build_docx_bytes()
+
+    def qa(session: requests.Session) -> requests.Response:
+        question = random.choice(QA_QUESTIONS)
+        return session.post(f"{base_url}/api/qa", json={"question": question}, timeout=timeout)
+
+    def doc_qa(session: requests.Session) -> requests.Response:
+        question = random.choice(DOC_QA_QUESTIONS)
+        return session.post(f"{base_url}/api/doc_qa", json={"question": question}, timeout=timeout)
+
+    def rewrite(session: requests.Session) -> requests.Response:
+        files = {"file": ("sample.docx", BytesIO(docx_bytes), DOCX_TYPE)}
+        return session.post(f"{base_url}/api/rewrite", files=files, timeout=timeout)
+
+    return {"qa": qa, "doc_qa": doc_qa, "rewrite": rewrite}
+
+
+def _parse_mix(raw: str) -> list[str]:
+    weighted: list[str] = []
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        weighted.extend([name.strip()] * int(weight or 1))
+    if not weighted:
+        raise SystemExit("--mix must name at least one endpoint.")
+    return weighted
+
+
+def run_load(
+    base_url: str,
+    concurrency: int,
+    duration_s: float | None,
+    total_requests: int | None,
+    mix: list[str],
+    timeout: float,
+) -> tuple[dict[str, dict[str, Any]], float]:
+    callers = _make_callers(base_url.rstrip("/"), timeout)
+    unknown = set(mix) - callers.keys()
+    if unknown:
+        raise SystemExit(f"Unknown endpoint(s) in --mix: {', '.join(sorted(unknown))}")
+
+    recorder = Recorder()
+    counter = itertools.count()
+    started = time.perf_counter()
+    deadline = started + duration_s if duration_s else None
+
+    def _next_slot() -> bool:
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        if total_requests is not None and next(counter) >= total_requests:
+            return False
+        return True
+
+    def _worker() -> None:
+        session = requests.Session()
+        while _next_slot():
+            endpoint = random.choice(mix)
+            t0 = time.perf_counter()
+            try:
+                resp = callers[endpoint](session)
+                ok = 200 <= resp.status_code < 300
+                status: int | str = resp.status_code
+            except requests.RequestException as exc:
+                ok = False
+                status = type(exc).__name__
+            recorder.record(endpoint, (time.perf_counter() - t0) * 1000.0, status, ok)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(_worker)
+
+    elapsed = time.perf_counter() - started
+    return recorder.summary(elapsed), elapsed
+
+
+def _print_report(report: dict[str, dict[str, Any]], elapsed: float, concurrency: int) -> None:
+    print(f"elapsed_s: {elapsed:.1f}  concurrency: {concurrency}")
+    header = f"{'endpoint':<10}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}  statuses"
+    print(header)
+    for endpoint, row in report.items():
+        print(
+            f"{endpoint:<10}{row['requests']:>7}{row['error_rate'] * 100:>6.1f}%"
+            f"{row['throughput_rps']:>8.2f}{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}"
+            f"{row['p99_ms']:>9.0f}  {row['statuses']}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the local API.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run.")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after N requests.")
+    parser.add_argument("--mix", default="qa=5,doc_qa=4,rewrite=1", help="Weighted endpoint mix.")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write report JSON here.")
+    args = parser.parse_args()
+
+    duration = None if args.requests else args.duration
+    report, elapsed = run_load(
+        args.base_url, args.concurrency, duration, args.requests, _parse_mix(args.mix), args.timeout
+    )
+    _print_report(report, elapsed, args.concurrency)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump({"elapsed_s": elapsed, "concurrency": args.concurrency, "endpoints": report}, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,13 +12,13 @@ from app.services import ingest_service
 
 def main() -> None:
     if len(sys.argv) < 2:
-        raise SystemExit("Usage: python tests/manual_rag_ingest.py <path-to-docx>")
+        raise SystemExit("Usage: python tests/manual_rag_ingest.py <path-to-docx> [shard]")
 
     path = Path(sys.argv[1])
     if not path.exists():
         raise SystemExit(f"File not found: {path}")
 
-    result = ingest_service.ingest_docx(path)
+    result = ingest_service.ingest_docx(path, shard=sys.argv[2] if len(sys.argv) > 2 else None)
     print("document_id:", result["doc_id"])
     print("chunk_count:", result["chunk_count"])
     print("vectors_upserted:", result["vectors_upserted"])
@@ -0,0 +1,362 @@
+"""Offline retrieval evaluation: quality and cost over a sweep of settings.
+
+Chunks the documents under RAG_Source_Doc, embeds them, and answers a golden
+question set through doc_qa_service.retrieve_sources (the retrieval step of
+doc Q&A, with its pruning and hierarchical search) pointed at an in-memory
+index. For every combination of chunk size, overlap, top_k and minimum score
+it reports:
+
+- recall@k: share of expected passages covered by the kept sources;
+- MRR: mean reciprocal rank of the first relevant source;
+- vectors stored and the tokens embedded at ingest;
+- prompt tokens of the doc Q&A call (same ~4 chars/token estimate as the
+  LLM scheduler; 0 when nothing passes the threshold and no call is made);
+- query latency (embed + search + prune + excerpts), p50/p95.
+
+Embeddings come from the stub's deterministic embedding by default
+(tests/stub_openai_server.py, computed in-process, so no network or API key
+is needed and every run gives the same numbers). Its feature-hashed
+bag-of-words scores are not on the real model's scale, so recall and cost
+comparisons carry over but min_score values do not. To tune min_score, run
+once with ``--embeddings real --embed-cache FILE`` (calls the configured
+embedding API and saves every vector), then ``--embeddings replay`` with the
+same file to sweep offline on the real model's vectors.
+
+Golden entries name the document and a verbatim span of its text. A chunk is
+relevant when it covers most of that span, so the set stays valid for any
+chunk size or overlap.
+
+Example:
+
+    python tests/manual_retrieval_eval.py --chunk-chars 200,400,800 --overlap 0,50 \\
+        --top-k 3,5 --min-score 0.1,0.2,0.35 --min-recall 0.8
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import hashlib
+import itertools
+import json
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator
+from unittest.mock import patch
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app import prompts
+from app.config import Settings, get_settings
+from app.services import (
+    chunk_store,
+    chunker,
+    doc_index,
+    doc_qa_service,
+    document_parser,
+    embedding_service,
+    vector_store,
+)
+from app.services.llm_scheduler import estimate_tokens
+from app.services.memory_index import InMemoryIndex
+from stub_openai_server import DEFAULT_EMBED_DIM, deterministic_embedding
+
+DEFAULT_GOLDEN = Path(__file__).resolve().parent / "eval" / "golden_rag_source_doc.json"
+# Share of an expected span a chunk must cover to count as relevant.
+MIN_COVERAGE = 0.8
+
+Embed = Callable[[list[str]], np.ndarray]
+
+
+@dataclass(frozen=True)
+class Config:
+    chunk_chars: int
+    overlap: int
+    top_k: int
+    min_score: float
+
+
+def stub_embedder(dim: int = DEFAULT_EMBED_DIM) -> Embed:
+    return lambda texts: np.asarray([deterministic_embedding(text, dim) for text in texts], dtype=np.float32)
+
+
+def cached_embedder(path: Path, embed: Embed | None = None) -> Embed:
+    """Replay vectors saved in `path` (.npz keyed by text hash); misses go to `embed` and are saved.
+
+    Without `embed` every text must already be in the file, so a replay run
+    never reaches the network.
+    """
+    cache = dict(np.load(path)) if path.exists() else {}
+
+    def run(texts: list[str]) -> np.ndarray:
+        keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in cache}
+        if missing:
+            if embed is None:
+                raise ValueError(f"{len(missing)} texts are not in {path}; record them with --embeddings real.")
+            for key, vector in zip(missing, embed(list(missing.values()))):
+                cache[key] = np.asarray(vector, dtype=np.float32)
+            with path.open("wb") as handle:
+                np.savez(handle, **cache)
+        return np.stack([cache[key] for key in keys])
+
+    return run
+
+
+def load_documents(doc_root: Path) -> dict[str, str]:
+    """Normalized text per filename, exactly as ingest sees it before chunking."""
+    return {
+        path.name: chunker.normalize_text(document_parser.extract_text_from_docx(path))
+        for path in sorted(doc_root.glob("*.docx"))
+    }
+
+
+def load_golden(path: Path, documents: dict[str, str]) -> list[dict[str, Any]]:
+    """Questions with the (document, start, end) spans they expect; fails on stale spans."""
+    questions = []
+    for item in json.loads(path.read_text(encoding="utf-8"))["questions"]:
+        targets = []
+        for expected in item["expected"]:
+            text = documents.get(expected["document"])
+            if text is None:
+                raise ValueError(f"Golden document not found: {expected['document']}")
+            span = chunker.normalize_text(expected["text"])
+            start = text.find(span)
+            if start < 0:
+                raise ValueError(f"Golden text not found in {expected['document']}: {span!r}")
+            targets.append((expected["document"], start, start + len(span)))
+        questions.append({"question": item["question"], "targets": targets})
+    return questions
+
+
+def chunk_spans(text: str, chunks: list[str]) -> list[tuple[int, int]]:
+    """Character span of each chunk in `text` (chunks may overlap)."""
+    spans = []
+    cursor = 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        if start < 0:
+            raise ValueError("Chunk does not occur in the source text.")
+        spans.append((start, start + len(chunk)))
+        cursor = start + 1
+    return spans
+
+
+def covers(chunk: tuple[str, int, int], target: tuple[str, int, int]) -> bool:
+    document, start, end = chunk
+    target_document, target_start, target_end = target
+    if document != target_document:
+        return False
+    shared = min(end, target_end) - max(start, target_start)
+    return shared >= MIN_COVERAGE * (target_end - target_start)
+
+
+def build_index(
+    documents: dict[str, str], chunk_chars: int, overlap: int, embed: Embed
+) -> tuple[InMemoryIndex, InMemoryIndex, dict[str, dict[str, Any]]]:
+    """Chunk and document indexes laid out as ingest writes them, plus each chunk's text and span."""
+    index = InMemoryIndex()
+    documents_index = InMemoryIndex()
+    chunks: dict[str, dict[str, Any]] = {}
+    for filename, text in documents.items():
+        pieces = chunker.chunk_text(text, chunk_chars, overlap)
+        vectors = embed(pieces)
+        payload = []
+        for chunk_index, (piece, span) in enumerate(zip(pieces, chunk_spans(text, pieces))):
+            vector_id = f"{filename}-{chunk_index}"
+            chunks[vector_id] = {"text": piece, "span": (filename, *span)}
+            metadata = {"doc_id": filename, "source_filename": filename, "chunk_index": chunk_index}
+            payload.append({"id": vector_id, "values": vectors[chunk_index], "metadata": metadata})
+        index.upsert(payload)
+        metadata = {"chunk_count": len(pieces), "source_filename": filename}
+        doc_index.upsert_document(filename, vectors, metadata, doc_index=documents_index)
+    return index, documents_index, chunks
+
+
+@contextmanager
+def _serving(
+    index: InMemoryIndex,
+    documents_index: InMemoryIndex,
+    chunks: dict[str, dict[str, Any]],
+    embed: Embed,
+    settings: Settings,
+) -> Iterator[None]:
+    """Point doc_qa_service's retrieval at the evaluation index, embedder and chunk text."""
+
+    def load_excerpt(_doc_id: str | None, filename: str, chunk_index: int) -> str:
+        return chunks[f"{filename}-{chunk_index}"]["text"]
+
+    with patch.object(doc_qa_service, "get_settings", return_value=settings), patch.object(
+        embedding_service, "embed_texts", side_effect=embed
+    ), patch.object(vector_store, "get_index", return_value=index), patch.object(
+        vector_store, "get_doc_index", return_value=documents_index
+    ), patch.object(chunk_store, "load_excerpt", side_effect=load_excerpt):
+        yield
+
+
+def _prompt_tokens(question: str, sources: list[dict[str, Any]]) -> int:
+    if not sources:
+        return 0
+    user_prompt = doc_qa_service.build_user_prompt(question, sources)
+    return estimate_tokens(len(prompts.LEGAL_DOC_QA_SYSTEM_PROMPT) + len(user_prompt), 0)
+
+
+def evaluate(
+    documents: dict[str, str],
+    questions: list[dict[str, Any]],
+    configs: list[Config],
+    embed: Embed,
+    settings: Settings | None = None,
+) -> list[dict[str, Any]]:
+    settings = settings or get_settings()
+    rows = []
+    built: dict[tuple[int, int], tuple[InMemoryIndex, InMemoryIndex, dict[str, dict[str, Any]]]] = {}
+    for config in configs:
+        key = (config.chunk_chars, config.overlap)
+        if key not in built:
+            built[key] = build_index(documents, config.chunk_chars, config.overlap, embed)
+        index, documents_index, chunks = built[key]
+        # The swept threshold is both the top-match bar and the per-match floor.
+        swept = dataclasses.replace(settings, min_relevance_score=config.min_score, min_match_score=config.min_score)
+
+        recalls, reciprocal_ranks, tokens, latencies, kept_counts = [], [], [], [], []
+        for item in questions:
+            with _serving(index, documents_index, chunks, embed, swept):
+                started = time.perf_counter()
+                kept = doc_qa_service.retrieve_sources(item["question"], config.top_k)["sources"]
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            spans = [chunks[source["id"]]["span"] for source in kept]
+            targets = item["targets"]
+            recalls.append(sum(any(covers(span, target) for span in spans) for target in targets) / len(targets))
+            rank = next(
+                (position for position, span in enumerate(spans, 1) if any(covers(span, t) for t in targets)), None
+            )
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+            tokens.append(_prompt_tokens(item["question"], kept))
+            kept_counts.append(len(kept))
+
+        rows.append(
+            {
+                **asdict(config),
+                "recall_at_k": round(statistics.fmean(recalls), 4),
+                "mrr": round(statistics.fmean(reciprocal_ranks), 4),
+                "vectors_stored": len(chunks),
+                "ingest_tokens": sum(len(chunk["text"]) for chunk in chunks.values()) // 4,
+                "sources_mean": round(statistics.fmean(kept_counts), 2),
+                "prompt_tokens_mean": round(statistics.fmean(tokens), 1),
+                "latency_p50_ms": round(_percentile(latencies, 50), 3),
+                "latency_p95_ms": round(_percentile(latencies, 95), 3),
+            }
+        )
+    return rows
+
+
+def cheapest(rows: list[dict[str, Any]], min_recall: float) -> dict[str, Any] | None:
+    """Lowest prompt cost (then fewest vectors) among rows meeting the recall bar."""
+    eligible = [row for row in rows if row["recall_at_k"] >= min_recall]
+    return min(eligible, key=lambda row: (row["prompt_tokens_mean"], row["vectors_stored"]), default=None)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+COLUMNS = (
+    ("chunk_chars", "chunk"),
+    ("overlap", "overlap"),
+    ("top_k", "top_k"),
+    ("min_score", "min_score"),
+    ("recall_at_k", "recall@k"),
+    ("mrr", "MRR"),
+    ("vectors_stored", "vectors"),
+    ("ingest_tokens", "ingest_tok"),
+    ("sources_mean", "sources"),
+    ("prompt_tokens_mean", "prompt_tok"),
+    ("latency_p50_ms", "p50_ms"),
+    ("latency_p95_ms", "p95_ms"),
+)
+
+
+def format_table(rows: list[dict[str, Any]]) -> str:
+    header = [label for _, label in COLUMNS]
+    body = [[str(row[key]) for key, _ in COLUMNS] for row in rows]
+    widths = [max(len(cell) for cell in column) for column in zip(header, *body)]
+    lines = ["  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in [header, *body]]
+    return "\n".join(lines)
+
+
+def _ints(raw: str) -> list[int]:
+    return [int(part) for part in raw.split(",") if part.strip()]
+
+
+def _floats(raw: str) -> list[float]:
+    return [float(part) for part in raw.split(",") if part.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--doc-root", type=Path, default=ROOT / "RAG_Source_Doc")
+    parser.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN)
+    parser.add_argument("--chunk-chars", type=_ints, default=[200, 400, 800])
+    parser.add_argument("--overlap", type=_ints, default=[0, 50])
+    parser.add_argument("--top-k", type=_ints, default=[3, 5])
+    parser.add_argument("--min-score", type=_floats, default=[0.1, 0.2, 0.35])
+    parser.add_argument(
+        "--embeddings",
+        choices=("stub", "real", "replay"),
+        default="stub",
+        help="stub: in-process stub vectors; real: the configured embedding API; replay: --embed-cache only.",
+    )
+    parser.add_argument("--embed-cache", type=Path, help="Saves real embeddings, and replays them offline.")
+    parser.add_argument("--dim", type=int, default=DEFAULT_EMBED_DIM, help="Stub embedding dimension.")
+    parser.add_argument("--min-recall", type=float, default=0.8, help="Recall bar for the suggested setting.")
+    parser.add_argument("--json", type=Path, help="Also write the rows to this file.")
+    args = parser.parse_args()
+
+    documents = load_documents(args.doc_root)
+    questions = load_golden(args.golden, documents)
+    configs = [
+        Config(chunk_chars, overlap, top_k, min_score)
+        for chunk_chars, overlap, top_k, min_score in itertools.product(
+            args.chunk_chars, args.overlap, args.top_k, args.min_score
+        )
+        if overlap < chunk_chars
+    ]
+    if args.embeddings == "stub":
+        embed = stub_embedder(args.dim)
+    elif args.embed_cache is None:
+        if args.embeddings == "replay":
+            parser.error("--embeddings replay needs --embed-cache.")
+        embed = embedding_service.embed_texts
+    else:
+        embed = cached_embedder(args.embed_cache, embedding_service.embed_texts if args.embeddings == "real" else None)
+    rows = evaluate(documents, questions, configs, embed)
+
+    print(f"{len(questions)} questions over {len(documents)} documents, {args.embeddings} embeddings\n")
+    print(format_table(rows))
+    best = cheapest(rows, args.min_recall)
+    if best is None:
+        print(f"\nNo setting reaches recall@k >= {args.min_recall}.")
+    else:
+        chosen = {key: best[key] for key in ("chunk_chars", "overlap", "top_k", "min_score")}
+        print(f"\nCheapest setting with recall@k >= {args.min_recall}: {json.dumps(chosen)}")
+        if args.embeddings == "stub":
+            print(
+                "min_score is for the stub embedding only; its scores do not transfer to the real model. "
+                "Tune it with --embeddings real/replay."
+            )
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
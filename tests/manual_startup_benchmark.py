@@ -0,0 +1,74 @@
+"""Manual cold-start benchmark: import cost of app.main plus warm-up time.
+
+Each run uses a fresh interpreter so nothing is cached between samples.
+Reports median wall time for `import app.main`, the slowest imports from
+`python -X importtime`, and the lifespan warm-up duration.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import app.main; "
+    "print(f'{(time.perf_counter() - t) * 1000:.1f}')"
+)
+WARMUP_SNIPPET = (
+    "import time; import app.main as m; t = time.perf_counter(); m._warm_up(); "
+    "print(f'{(time.perf_counter() - t) * 1000:.1f}')"
+)
+
+
+def _run(snippet: str, extra_args: list[str] | None = None) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *(extra_args or []), "-c", snippet],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _top_imports(limit: int) -> list[tuple[int, str]]:
+    """Largest cumulative import times (microseconds) for top-level packages."""
+    proc = _run("import app.main", ["-X", "importtime"])
+    rows: list[tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line.split(":", 1)[1].split("|"))
+        if cumulative.isdigit() and "." not in name:
+            rows.append((int(cumulative), name))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--skip-warmup", action="store_true", help="Do not time _warm_up().")
+    args = parser.parse_args()
+
+    import_ms = [float(_run(IMPORT_SNIPPET).stdout.strip()) for _ in range(args.runs)]
+    print(f"import app.main: median {statistics.median(import_ms):.1f} ms "
+          f"(min {min(import_ms):.1f}, max {max(import_ms):.1f}, runs {args.runs})")
+
+    print("slowest top-level imports (cumulative):")
+    for micros, name in _top_imports(args.top):
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    if not args.skip_warmup:
+        warm_ms = [float(_run(WARMUP_SNIPPET).stdout.strip().splitlines()[-1]) for _ in range(args.runs)]
+        print(f"warm-up: median {statistics.median(warm_ms):.1f} ms "
+              f"(min {min(warm_ms):.1f}, max {max(warm_ms):.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Local stand-in for the OpenAI chat and embeddings endpoints.
+
+Point the app at it through the existing environment variables:
+
+    OPENAI_API_BASE=http://127.0.0.1:9100/v1/chat/completions
+    OPENAI_EMBED_API_BASE=http://127.0.0.1:9100/v1/embeddings
+    OPENAI_API_KEY=stub
+
+Latency and error rates are configurable per endpoint so load tests can model
+a slow or flaky provider without spending real API quota. Embeddings are
+deterministic (feature-hashed bag of words), so the same text always maps to
+the same vector and lexically similar texts score as similar.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import math
+import random
+import re
+import struct
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DEFAULT_EMBED_DIM = 1536
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by do does for from in is it may must of on or shall "
+    "that the this to what when which who with".split()
+)
+
+
+@dataclass
+class LatencyModel:
+    """Samples a per-call delay in milliseconds.
+
+    `spread` is the half-width for uniform, the standard deviation (ms) for
+    normal and sigma for lognormal; it is ignored for fixed.
+    """
+
+    mean_ms: float = 0.0
+    distribution: str = "fixed"
+    spread: float = 0.0
+
+    def sample_ms(self, rng: random.Random) -> float:
+        if self.mean_ms <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            value = rng.uniform(self.mean_ms - self.spread, self.mean_ms + self.spread)
+        elif self.distribution == "normal":
+            value = rng.gauss(self.mean_ms, self.spread)
+        elif self.distribution == "lognormal":
+            # Parameterised so the distribution mean equals mean_ms.
+            mu = math.log(self.mean_ms) - (self.spread ** 2) / 2
+            value = rng.lognormvariate(mu, self.spread)
+        else:
+            value = self.mean_ms
+        return max(0.0, value)
+
+
+@dataclass
+class EndpointBehaviour:
+    latency: LatencyModel
+    error_rate: float = 0.0
+    rate_limit_share: float = 0.5
+
+
+def deterministic_embedding(text: str, dim: int = DEFAULT_EMBED_DIM) -> list[float]:
+    """Feature-hash the non-stopword terms of `text` into a unit vector."""
+    tokens = [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+    vector = [0.0] * dim
+    for feature in tokens:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[bucket] += sign
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0.0:
+        vector[0] = 1.0
+        return vector
+    return [v / norm for v in vector]
+
+
+def _section(text: str, start: str, ends: tuple[str, ...]) -> str | None:
+    begin = text.find(start)
+    if begin < 0:
+        return None
+    begin += len(start)
+    stop = len(text)
+    for end in ends:
+        found = text.find(end, begin)
+        if 0 <= found < stop:
+            stop = found
+    return text[begin:stop].strip()
+
+
+def _stub_completion(messages: list[dict[str, Any]]) -> str:
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    if "SOURCES:" in prompt:
+        return "According to the provided sources, the answer is set out in the cited clause [SOURCE 1]."
+    document = _section(prompt, "Document:\n", ("\nGoals:", "\nUser notes:", "\nReturn only"))
+    if document is not None:
+        # Rewrite requests: echo the document so output keeps its structure.
+        return document
+    return "This is a stubbed drafting answer. Review the clause wording with a qualified solicitor."
+
+
+def create_app(chat: EndpointBehaviour, embed: EndpointBehaviour, seed: int | None = None) -> FastAPI:
+    app = FastAPI(title="openai-stub")
+    rng = random.Random(seed)
+    stats = {"chat_calls": 0, "embedding_calls": 0, "errors_injected": 0}
+
+    def _maybe_fail(behaviour: EndpointBehaviour) -> JSONResponse | None:
+        if behaviour.error_rate <= 0 or rng.random() >= behaviour.error_rate:
+            return None
+        stats["errors_injected"] += 1
+        if rng.random() < behaviour.rate_limit_share:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (stub).", "type": "rate_limit"}},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        return JSONResponse(
+            {"error": {"message": "Upstream error (stub).", "type": "server_error"}},
+            status_code=500,
+        )
+
+    async def _delay(behaviour: EndpointBehaviour) -> None:
+        delay_ms = behaviour.latency.sample_ms(rng)
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000.0)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        stats["chat_calls"] += 1
+        body = await request.json()
+        await _delay(chat)
+        failure = _maybe_fail(chat)
+        if failure is not None:
+            return failure
+        content = _stub_completion(body.get("messages") or [])
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages") or [])
+        return {
+            "id": f"chatcmpl-stub-{stats['chat_calls']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (prompt_chars + len(content)) // 4,
+            },
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        stats["embedding_calls"] += 1
+        body = await request.json()
+        await _delay(embed)
+        failure = _maybe_fail(embed)
+        if failure is not None:
+            return failure
+        inputs = body.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = int(body.get("dimensions") or DEFAULT_EMBED_DIM)
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for idx, text in enumerate(inputs):
+            vector = deterministic_embedding(text, dim)
+            if as_base64:
+                vector = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": idx, "embedding": vector})
+        tokens = sum(len(text) for text in inputs) // 4
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.get("/stub/stats")
+    async def stub_stats():
+        return dict(stats)
+
+    return app
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed for repeatable runs.")
+    for name, default_ms in (("chat", 800.0), ("embed", 120.0)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=default_ms)
+        parser.add_argument(
+            f"--{name}-latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal"
+        )
+        parser.add_argument(
+            f"--{name}-latency-spread",
+            type=float,
+            default=0.5,
+            help="Uniform half-width / normal stddev in ms; sigma for lognormal.",
+        )
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+    return parser.parse_args(argv)
+
+
+def _behaviour(args: argparse.Namespace, name: str) -> EndpointBehaviour:
+    return EndpointBehaviour(
+        latency=LatencyModel(
+            mean_ms=getattr(args, f"{name}_latency_ms"),
+            distribution=getattr(args, f"{name}_latency_dist"),
+            spread=getattr(args, f"{name}_latency_spread"),
+        ),
+        error_rate=getattr(args, f"{name}_error_rate"),
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    import uvicorn
+
+    args = _parse_args(argv)
+    app = create_app(_behaviour(args, "chat"), _behaviour(args, "embed"), seed=args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
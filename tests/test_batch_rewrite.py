@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest.mock import patch
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import requests
+from docx import Document
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.main import app
+from app.services import batch_rewrite, file_store, rewrite_service
+from app.services.llm_gateway import LLMCallFailedError, LLMResponse
+from app.services.services import lock_service
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _docx(text: str) -> bytes:
+    buffer = BytesIO()
+    document = Document()
+    document.add_paragraph(text)
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _zip(entries: dict[str, bytes]) -> bytes:
+    buffer = BytesIO()
+    with ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _rewrite(prompt: str, **_kwargs) -> LLMResponse:
+    original = prompt.split("[[P1]] ", 1)[1].split("\n", 1)[0]
+    return LLMResponse(f"[[P1]] {original.upper()}")
+
+
+class PrepareTests(unittest.TestCase):
+    def test_expands_zips_and_reports_skipped_entries(self):
+        archive = _zip(
+            {
+                "deal/a.docx": _docx("One."),
+                "deal/notes.txt": b"text",
+                "__MACOSX/deal/._a.docx": b"fork",
+                "deal/sub/": b"",
+            }
+        )
+        batch = batch_rewrite.prepare([("a.docx", _docx("Two.")), ("deal.zip", archive)])
+        self.assertEqual([file.name for file in batch.files], ["a.docx", "a (2).docx"])
+        self.assertEqual([entry["name"] for entry in batch.skipped], ["notes.txt"])
+
+    def test_batch_caps(self):
+        settings = Settings(batch_rewrite_max_files=2, batch_rewrite_max_bytes=10_000_000)
+        with patch("app.services.batch_rewrite.get_settings", return_value=settings):
+            with self.assertRaises(ValueError):
+                batch_rewrite.prepare([(f"{n}.docx", b"x") for n in range(3)])
+            with self.assertRaises(ValueError):
+                batch_rewrite.prepare([("x.zip", b"not a zip")])
+            with self.assertRaises(ValueError):
+                batch_rewrite.prepare([("x.zip", _zip({"readme.txt": b"x"}))])
+
+    def test_archives_are_capped_while_expanding(self):
+        # 20 entries of 1 MB zeros: a few KB compressed, far past the byte cap once inflated.
+        bomb = BytesIO()
+        with ZipFile(bomb, "w", compression=ZIP_DEFLATED) as archive:
+            for n in range(20):
+                archive.writestr(f"{n}.docx", bytes(1024 * 1024))
+        settings = Settings(batch_rewrite_max_files=50, batch_rewrite_max_bytes=3 * 1024 * 1024)
+        with patch("app.services.batch_rewrite.get_settings", return_value=settings), patch(
+            "zipfile.ZipFile.open", side_effect=ZipFile.open, autospec=True
+        ) as opened:
+            with self.assertRaisesRegex(ValueError, "Batch too large"):
+                batch_rewrite.prepare([("bomb.zip", bomb.getvalue())])
+        self.assertEqual(opened.call_count, 3)
+
+        # The budget is shared across uploads, and the file count is enforced mid-archive too.
+        with patch("app.services.batch_rewrite.get_settings", return_value=settings):
+            with self.assertRaisesRegex(ValueError, "Batch too large"):
+                batch_rewrite.prepare([("a.docx", bytes(2 * 1024 * 1024)), ("bomb.zip", bomb.getvalue())])
+        few = Settings(batch_rewrite_max_files=2, batch_rewrite_max_bytes=100 * 1024 * 1024)
+        with patch("app.services.batch_rewrite.get_settings", return_value=few):
+            with self.assertRaisesRegex(ValueError, "Too many files"):
+                batch_rewrite.prepare([("bomb.zip", bomb.getvalue())])
+
+    def test_entries_declaring_an_oversized_file_are_skipped_unread(self):
+        archive = _zip({"big.docx": bytes(file_store.DEFAULT_MAX_BYTES + 1), "ok.docx": _docx("One.")})
+        with patch("zipfile.ZipFile.open", side_effect=ZipFile.open, autospec=True) as opened:
+            batch = batch_rewrite.prepare([("deal.zip", archive)])
+        self.assertEqual([file.name for file in batch.files], ["ok.docx"])
+        self.assertEqual([entry["name"] for entry in batch.skipped], ["big.docx"])
+        self.assertEqual(opened.call_count, 1)
+
+
+class BatchEndpointTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+
+    def setUp(self):
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        patches = [
+            patch("app.services.batch_rewrite.get_pool", return_value=pool),
+            patch("app.services.rewrite_service.get_cache", return_value=rewrite_service.RewriteCache(0)),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+
+    def _post(self, files):
+        response = self.client.post(
+            "/api/rewrite/batch", files=[("files", (name, BytesIO(data), kind)) for name, data, kind in files]
+        )
+        self.assertEqual(response.status_code, 200, response.text)
+        return ZipFile(BytesIO(response.content))
+
+    def test_streams_rewritten_documents_with_a_manifest(self):
+        locked = _docx("Locked elsewhere.")
+        lock_key = rewrite_service.lock_key(rewrite_service.document_id_for(locked), [], None)
+        token = lock_service.acquire(lock_key, ttl_seconds=60)
+        self.assertIsNotNone(token)
+        self.addCleanup(lock_service.release, lock_key, token)
+
+        with patch("app.services.rewrite_service.generate_text", side_effect=_rewrite):
+            archive = self._post(
+                [
+                    ("first.docx", _docx("First clause."), DOCX_TYPE),
+                    ("folder.zip", _zip({"second.docx": _docx("Second clause."), "x.pdf": b"%PDF"}), "application/zip"),
+                    ("locked.docx", locked, DOCX_TYPE),
+                ]
+            )
+
+        manifest = json.loads(archive.read("manifest.json"))
+        statuses = {entry["name"]: entry["status"] for entry in manifest["documents"]}
+        self.assertEqual(
+            statuses,
+            {"first.docx": "rewritten", "second.docx": "rewritten", "locked.docx": "failed", "x.pdf": "skipped"},
+        )
+        self.assertEqual((manifest["rewritten"], manifest["failed"], manifest["skipped"]), (2, 1, 1))
+        self.assertNotIn("locked.docx", archive.namelist())
+        second = next(entry for entry in manifest["documents"] if entry["name"] == "second.docx")
+        self.assertEqual(second["unchanged"], 0)
+        text = Document(BytesIO(archive.read("second.docx"))).paragraphs[0].text
+        self.assertEqual(text, "SECOND CLAUSE.")
+
+    def test_identical_files_are_rewritten_once(self):
+        same = _docx("Same clause.")
+        with patch("app.services.rewrite_service.generate_text", side_effect=_rewrite) as generate:
+            archive = self._post([("a.docx", same, DOCX_TYPE), ("b.docx", same, DOCX_TYPE)])
+        manifest = json.loads(archive.read("manifest.json"))
+        self.assertEqual([entry["status"] for entry in manifest["documents"]], ["rewritten", "rewritten"])
+        self.assertEqual(archive.read("a.docx"), archive.read("b.docx"))
+        self.assertEqual(generate.call_count, 1)
+
+    def test_failed_llm_calls_are_reported_as_failed(self):
+        failed = LLMCallFailedError(requests.ConnectionError("boom"))
+        with patch("app.services.rewrite_service.generate_text", side_effect=failed):
+            archive = self._post([("a.docx", _docx("Alpha."), DOCX_TYPE)])
+        manifest = json.loads(archive.read("manifest.json"))
+        self.assertEqual(manifest["documents"][0]["status"], "failed")
+        self.assertIn("boom", manifest["documents"][0]["error"])
+        self.assertNotIn("a.docx", archive.namelist())
+
+    def test_documents_are_rewritten_in_parallel(self):
+        # Each call waits for the other; run one at a time, the barrier would time out.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def rewrite(prompt, **kwargs):
+            barrier.wait()
+            return _rewrite(prompt, **kwargs)
+
+        with patch("app.services.rewrite_service.generate_text", side_effect=rewrite):
+            archive = self._post([("a.docx", _docx("Alpha."), DOCX_TYPE), ("b.docx", _docx("Beta."), DOCX_TYPE)])
+        self.assertEqual(json.loads(archive.read("manifest.json"))["rewritten"], 2)
+
+    def test_byte_cap_covers_all_uploads_together(self):
+        data = _docx("Clause.")
+        settings = Settings(batch_rewrite_max_bytes=len(data) * 2 + 1)
+        files = [("files", (f"{n}.docx", BytesIO(data), DOCX_TYPE)) for n in range(3)]
+        with patch("app.main.get_settings", return_value=settings):
+            response = self.client.post("/api/rewrite/batch", files=files)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Batch too large", response.json()["detail"])
+
+    def test_rejects_unsupported_uploads(self):
+        response = self.client.post("/api/rewrite/batch", files=[("files", ("a.pdf", BytesIO(b"x"), "application/pdf"))])
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.main import app
+from app.services import chunk_store, chunker, ingest_service, vector_store
+from app.services.chunk_store import ChunkStore
+from app.services.dedup import DedupRegistry
+from app.services.memory_index import InMemoryIndex
+
+ROOT = Path(__file__).resolve().parents[1]
+SOURCE = "Employment_Law_Test_Document (1).docx"
+CHUNKS = ["Clause one.", "Clause two.", "Clause three.", "Clause four."]
+
+
+class ChunkStoreTests(unittest.TestCase):
+    def test_put_replaces_and_ranges_are_ordered(self):
+        store = ChunkStore()
+        store.put_document("d", "a.docx", ["old"] * 6)
+        store.put_document("d", "a.docx", CHUNKS)
+        self.assertEqual(store.document("d")["chunk_count"], 4)
+        self.assertEqual(store.get_range("d", 1, 9), [(1, "Clause two."), (2, "Clause three."), (3, "Clause four.")])
+        self.assertIsNone(store.get_chunk("d", 4))
+        self.assertTrue(store.delete_document("d"))
+        self.assertIsNone(store.document("d"))
+
+    def test_file_store_is_shared_and_creates_its_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "data" / "chunks.db"
+            ChunkStore(path).put_document("d", "a.docx", CHUNKS)
+            self.assertEqual(ChunkStore(path).get_chunk("d", 2), "Clause three.")
+
+    def test_memory_store_drops_least_recently_read_documents(self):
+        store = ChunkStore(max_bytes=25)
+        store.put_document("a", "a.docx", ["x" * 10])
+        store.put_document("b", "b.docx", ["y" * 10])
+        store.get_chunk("a", 0)
+        store.put_document("c", "c.docx", ["z" * 10])
+        self.assertIsNone(store.document("b"))
+        self.assertEqual(len(store), 2)
+        with tempfile.TemporaryDirectory() as tmp:
+            unbounded = ChunkStore(Path(tmp) / "chunks.db", max_bytes=25)
+            for doc_id in "abc":
+                unbounded.put_document(doc_id, "a.docx", ["x" * 10])
+            self.assertEqual(len(unbounded), 3)
+
+    def test_chunk_ids(self):
+        self.assertEqual(chunk_store.parse_chunk_id("ab12-cd-3"), ("ab12-cd", 3))
+        for bad in ("nodash", "-3", "abc-x"):
+            with self.assertRaises(ValueError):
+                chunk_store.parse_chunk_id(bad)
+
+
+class _StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = ChunkStore()
+        self.index = InMemoryIndex()
+        settings = Settings(rag_doc_root=ROOT / "RAG_Source_Doc", chunk_window_max=2)
+        patches = [
+            patch("app.services.chunk_store.get_store", return_value=self.store),
+            patch("app.services.chunk_store.get_settings", return_value=settings),
+            patch("app.main.get_settings", return_value=settings),
+            patch("app.services.chunk_store.vector_store.get_index", return_value=self.index),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+
+
+class ExcerptTests(_StoreTestCase):
+    def test_stored_chunks_are_served_without_parsing(self):
+        self.store.put_document("d", "missing.docx", CHUNKS)
+        with patch("app.services.chunk_store.cpu_pool.run") as run:
+            self.assertEqual(chunk_store.load_excerpt("d", "missing.docx", 1), "Clause two.")
+        run.assert_not_called()
+
+    def test_unknown_documents_are_backfilled_once(self):
+        expected = chunker.chunk_docx(ROOT / "RAG_Source_Doc" / SOURCE, chunker.CHUNK_CHARS)
+        with patch("app.services.chunk_store.cpu_pool.run", return_value=expected) as run:
+            self.assertEqual(chunk_store.load_excerpt("old", SOURCE, 1), expected[1])
+            self.assertEqual(chunk_store.load_excerpt("old", SOURCE, 2), expected[2])
+        self.assertEqual(run.call_count, 1)
+        with self.assertRaises(ValueError):
+            chunk_store.load_excerpt("old", SOURCE, len(expected))
+
+
+class ChunkEndpointTests(_StoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+
+    def test_window_is_clipped_at_document_edges(self):
+        self.store.put_document("d", "a.docx", CHUNKS)
+        body = self.client.get("/api/chunks/d-0", params={"window": 2}).json()
+        self.assertEqual([chunk["chunk_index"] for chunk in body["chunks"]], [0, 1, 2])
+        self.assertEqual((body["source"], body["chunk_count"]), ("a.docx", 4))
+
+    def test_etag_revalidation(self):
+        self.store.put_document("d", "a.docx", CHUNKS)
+        first = self.client.get("/api/chunks/d-1", params={"window": 1})
+        etag = first.headers["ETag"]
+        cached = self.client.get("/api/chunks/d-1", params={"window": 1}, headers={"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+
+        wider = self.client.get("/api/chunks/d-1", params={"window": 2}, headers={"If-None-Match": etag})
+        self.assertEqual(wider.status_code, 200)
+        self.store.put_document("d", "a.docx", ["Revised.", *CHUNKS[1:]])
+        changed = self.client.get("/api/chunks/d-1", params={"window": 1}, headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["chunks"][0]["text"], "Revised.")
+
+    def test_errors(self):
+        self.store.put_document("d", "a.docx", CHUNKS)
+        self.assertEqual(self.client.get("/api/chunks/d-1", params={"window": 3}).status_code, 400)
+        self.assertEqual(self.client.get("/api/chunks/d-9").status_code, 404)
+        self.assertEqual(self.client.get("/api/chunks/unknown-0").status_code, 404)
+
+    def test_documents_missing_from_the_store_are_backfilled_from_vector_metadata(self):
+        metadata = {"doc_id": "old", "chunk_index": 1, "source_filename": SOURCE}
+        self.index.upsert([{"id": "old-1", "values": [1.0, 0.0], "metadata": metadata}])
+        body = self.client.get("/api/chunks/old-1", params={"window": 1}).json()
+        expected = chunker.chunk_docx(ROOT / "RAG_Source_Doc" / SOURCE, chunker.CHUNK_CHARS)
+        self.assertEqual([chunk["text"] for chunk in body["chunks"]], expected[:3])
+        self.assertIsNotNone(self.store.document("old"))
+
+
+class IngestTests(_StoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+
+    def setUp(self):
+        super().setUp()
+        self.doc_index = InMemoryIndex()
+        patches = [
+            patch("app.services.ingest_service.get_settings", return_value=Settings()),
+            patch(
+                "app.services.ingest_service.embedding_service.embed_texts",
+                side_effect=lambda texts: np.eye(len(texts), 8, dtype=np.float32),
+            ),
+            patch("app.services.vector_store.get_index", return_value=self.index),
+            patch("app.services.vector_store.get_doc_index", return_value=self.doc_index),
+            patch("app.services.ingest_service.dedup.get_registry", return_value=DedupRegistry()),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+
+    def _ingest(self, name: str, chunks: list[str]) -> dict:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / name
+            path.touch()
+            with patch("app.services.ingest_service.cpu_pool.run", return_value=chunks):
+                return ingest_service.ingest_docx(path)
+
+    def test_ingest_stores_every_chunk(self):
+        result = self._ingest("lease.docx", CHUNKS)
+        self.assertEqual(chunk_store.load_excerpt(result["doc_id"], "lease.docx", 3), "Clause four.")
+
+    def test_failed_ingest_leaves_no_rows(self):
+        with patch("app.services.ingest_service.embedding_service.embed_texts", side_effect=RuntimeError("down")):
+            with self.assertRaises(RuntimeError):
+                self._ingest("lease.docx", CHUNKS)
+        self.assertEqual(len(self.store), 0)
+
+    def test_delete_keeps_vectors_shared_with_other_documents(self):
+        first = self._ingest("lease.docx", CHUNKS)["doc_id"]
+        second = self._ingest(SOURCE, ["Clause one.", "Renewal terms."])["doc_id"]
+
+        deleted = ingest_service.delete_document(first)
+
+        self.assertEqual((deleted["vectors_deleted"], deleted["vectors_kept"]), (3, 1))
+        remaining = vector_store.fetch_vectors(self.index, [f"{first}-{idx}" for idx in range(4)])
+        self.assertEqual(list(remaining), [f"{first}-0"])
+        shared = remaining[f"{first}-0"]["metadata"]
+        self.assertEqual(
+            (shared["doc_id"], shared["source_filename"], shared["doc_ids"]), (second, SOURCE, [second])
+        )
+        self.assertIsNone(self.store.document(first))
+        self.assertEqual(vector_store.fetch_vectors(self.doc_index, [first, second]).keys(), {second})
+        self.assertIsNone(ingest_service.delete_document(first))
+        self.assertEqual(self.client.get(f"/api/chunks/{first}-0").status_code, 404)
+        self.assertIsNone(self.store.document(first))
+
+    def test_delete_finds_shared_vectors_without_the_registry(self):
+        first = self._ingest("lease.docx", CHUNKS)["doc_id"]
+        second = self._ingest("renewal.docx", ["Clause one.", "Renewal terms."])["doc_id"]
+        self.store.delete_document(second)
+
+        # Another worker, or a restart: neither the registry nor the chunk store knows the duplicates.
+        with patch("app.services.ingest_service.dedup.get_registry", return_value=DedupRegistry()):
+            deleted = ingest_service.delete_document(second)
+
+        self.assertEqual((deleted["vectors_deleted"], deleted["vectors_kept"]), (1, 1))
+        shared = vector_store.fetch_vectors(self.index, [f"{first}-0"])[f"{first}-0"]["metadata"]
+        self.assertEqual(shared["doc_ids"], [first])
+        self.assertEqual([ingest_service.parse_occurrence(raw)["doc_id"] for raw in shared["occurrences"]], [first])
+
+    def test_delete_endpoint_is_admin_only(self):
+        doc_id = self._ingest("lease.docx", CHUNKS)["doc_id"]
+        self.assertEqual(self.client.delete(f"/api/admin/documents/{doc_id}").status_code, 404)
+        settings = Settings(admin_token="s3cret")
+        with patch("app.main.get_settings", return_value=settings), patch(
+            "app.services.profiler.get_settings", return_value=settings
+        ):
+            headers = {"X-Admin-Token": "s3cret"}
+            response = self.client.delete(f"/api/admin/documents/{doc_id}", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["vectors_deleted"], 4)
+            self.assertEqual(self.client.delete(f"/api/admin/documents/{doc_id}", headers=headers).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
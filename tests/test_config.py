@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import unittest
+from pathlib import Path
+
+from app.config import Settings
+
+
+class SettingsTests(unittest.TestCase):
+    def test_defaults_when_environment_is_empty(self):
+        settings = Settings.from_env({})
+
+        self.assertIsNone(settings.openai_api_key)
+        self.assertEqual(settings.openai_model, "gpt-4o-mini")
+        self.assertEqual(settings.vector_store_backend, "pinecone")
+        self.assertEqual(settings.min_relevance_score, 0.35)
+        self.assertIsNone(settings.rag_doc_root)
+
+    def test_parses_and_normalizes_values(self):
+        settings = Settings.from_env(
+            {
+                "OPENAI_MODEL": " gpt-4o ",
+                "EMBEDDING_DIM": "1024",
+                "VECTOR_STORE_BACKEND": "Memory",
+                "MIN_RELEVANCE_SCORE": "0.5",
+                "RAG_DOC_ROOT": "/srv/docs",
+                "WARMUP_ON_STARTUP": "false",
+                "PINECONE_HOST": "",
+            }
+        )
+
+        self.assertEqual(settings.openai_model, "gpt-4o")
+        self.assertEqual(settings.embedding_dim, 1024)
+        self.assertEqual(settings.vector_store_backend, "memory")
+        self.assertEqual(settings.min_relevance_score, 0.5)
+        self.assertEqual(settings.rag_doc_root, Path("/srv/docs"))
+        self.assertFalse(settings.warmup_on_startup)
+        self.assertIsNone(settings.pinecone_host)
+
+    def test_rejects_invalid_values(self):
+        for env in (
+            {"EMBEDDING_DIM": "abc"},
+            {"EMBEDDING_DIM": "0"},
+            {"MIN_RELEVANCE_SCORE": "1.5"},
+            {"VECTOR_STORE_BACKEND": "redis"},
+            {"WARMUP_ON_STARTUP": "maybe"},
+        ):
+            with self.subTest(env=env), self.assertRaises(ValueError):
+                Settings.from_env(env)
+
+
+if __name__ == "__main__":
+    unittest.main()
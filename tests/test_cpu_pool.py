@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from docx import Document
+
+from app.config import Settings
+from app.services import cpu_pool, docx_writer, document_parser
+from app.services.cpu_pool import CPUPoolBusyError
+
+
+def _docx_bytes(paragraphs: list[str]) -> bytes:
+    buffer = BytesIO()
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+class CPUPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.settings = Settings(cpu_pool_workers=1, cpu_pool_max_queue=0, cpu_pool_min_bytes=1024)
+        patcher = patch("app.services.cpu_pool.get_settings", side_effect=lambda: self.settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cpu_pool.shutdown)
+
+    def test_small_inputs_run_inline(self):
+        with patch("app.services.cpu_pool._get_pool") as get_pool:
+            self.assertEqual(cpu_pool.run(len, b"abc", size_hint=3), 3)
+        get_pool.assert_not_called()
+
+    def test_large_inputs_round_trip_through_worker(self):
+        data = _docx_bytes(["First paragraph.", "Second paragraph."])
+        paragraphs = cpu_pool.run(document_parser.extract_paragraphs_from_docx_bytes, data, size_hint=10**6)
+        self.assertEqual(paragraphs, ["First paragraph.", "Second paragraph."])
+
+        patched = cpu_pool.run(docx_writer.patch_docx_paragraphs, data, {0: "Rewritten."}, size_hint=10**6)
+        self.assertEqual(document_parser.extract_paragraphs_from_docx_bytes(patched)[0], "Rewritten.")
+
+    def test_full_pool_rejects_instead_of_queueing(self):
+        cpu_pool.run(len, b"warm", size_hint=10**6)  # start the worker
+        busy = threading.Thread(target=cpu_pool.run, args=(time.sleep, 1.0), kwargs={"size_hint": 10**6})
+        busy.start()
+        time.sleep(0.1)
+        try:
+            with self.assertRaises(CPUPoolBusyError):
+                cpu_pool.run(len, b"x", size_hint=10**6)
+        finally:
+            busy.join()
+
+    def test_default_size_divides_cores_between_web_workers(self):
+        cases = [(8, 1, 4), (8, 4, 2), (8, 8, 1), (4, 16, 1)]
+        for cores, web_workers, expected in cases:
+            self.settings = Settings(web_concurrency=web_workers)
+            with self.subTest(cores=cores, web_workers=web_workers), patch("os.cpu_count", return_value=cores):
+                self.assertEqual(cpu_pool.worker_count(), expected)
+        self.settings = Settings(cpu_pool_workers=3, web_concurrency=8)
+        self.assertEqual(cpu_pool.worker_count(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
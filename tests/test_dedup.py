@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from app.config import Settings
+from app.services import chunker, dedup, doc_qa_service, ingest_service, resilience
+from app.services.dedup import DedupRegistry
+from app.services.memory_index import InMemoryIndex
+
+CLAUSE = (
+    "This Agreement shall be governed by and construed in accordance with the laws of England "
+    "and Wales and the parties submit to the exclusive jurisdiction of the courts of England."
+)
+OTHER = (
+    "The Employee shall be entitled to 25 days paid holiday in each holiday year in addition to "
+    "public holidays, to be taken at times agreed with the Company in advance."
+)
+
+
+def _register(registry: DedupRegistry, vector_id: str, text: str) -> None:
+    registry.add(vector_id, dedup.content_hash(text), dedup.minhash(text), text)
+
+
+def _find(registry: DedupRegistry, text: str):
+    return registry.find(dedup.content_hash(text), dedup.minhash(text), text)
+
+
+class DedupRegistryTests(unittest.TestCase):
+    def test_exact_duplicates_are_found_and_near_ones_are_not_merged_by_default(self):
+        registry = DedupRegistry()
+        _register(registry, "a", CLAUSE)
+
+        variant = "  " + CLAUSE.upper().replace(" the ", "  the ")
+        self.assertEqual(_find(registry, variant), ("a", "exact"))
+        self.assertIsNone(_find(registry, CLAUSE.replace("construed", "interpreted")))
+        self.assertIsNone(_find(registry, OTHER))
+
+    def test_near_duplicates_are_verified_with_exact_jaccard(self):
+        near = CLAUSE.replace("construed", "interpreted")
+        self.assertLess(dedup.jaccard(CLAUSE, near), 0.95)
+
+        strict = DedupRegistry(near=True)
+        _register(strict, "a", CLAUSE)
+        self.assertIsNone(_find(strict, near))
+        self.assertEqual(_find(strict, CLAUSE + " Agreed."), ("a", "near"))
+
+        loose = DedupRegistry(min_similarity=0.8, near=True)
+        _register(loose, "a", CLAUSE)
+        self.assertEqual(_find(loose, near), ("a", "near"))
+
+    def test_hash_matches_are_checked_against_the_stored_text(self):
+        registry = DedupRegistry()
+        # A colliding hash must not merge different text.
+        registry.add("a", dedup.content_hash(CLAUSE), dedup.minhash(OTHER), OTHER)
+        self.assertIsNone(_find(registry, CLAUSE))
+
+    def test_similarity_estimates_jaccard(self):
+        near = CLAUSE.replace("construed", "interpreted")
+        self.assertGreater(dedup.similarity(dedup.minhash(CLAUSE), dedup.minhash(near)), 0.75)
+        self.assertLess(dedup.similarity(dedup.minhash(CLAUSE), dedup.minhash(OTHER)), 0.2)
+
+    def test_registry_persists_to_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "dedup.sqlite")
+            _register(DedupRegistry(path), "a", CLAUSE)
+            reopened = DedupRegistry(path)
+            self.assertEqual(_find(reopened, CLAUSE), ("a", "exact"))
+            self.assertEqual(len(reopened), 1)
+
+
+def _fake_embed(texts):
+    return np.stack([np.eye(8, dtype=np.float32)[hash(text) % 8] for text in texts]).reshape(len(texts), 8)
+
+
+@patch("app.services.ingest_service.embedding_service.embed_texts", side_effect=_fake_embed)
+@patch("app.services.ingest_service.get_settings", return_value=Settings())
+class DedupIngestTests(unittest.TestCase):
+    def setUp(self):
+        self.index = InMemoryIndex()
+        patches = [
+            patch("app.services.ingest_service.vector_store.get_index", return_value=self.index),
+            patch("app.services.ingest_service.vector_store.get_doc_index", return_value=InMemoryIndex()),
+            patch("app.services.ingest_service.dedup.get_registry", return_value=DedupRegistry()),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+    def _ingest(self, name: str, text: str):
+        path = self.root / name
+        path.touch()
+        with patch("app.services.ingest_service.cpu_pool.run", return_value=chunker.chunk_text(text, 200)):
+            return ingest_service.ingest_docx(path)
+
+    def test_shared_clause_is_stored_once_with_occurrences(self, _settings, embed):
+        first = self._ingest("a.docx", CLAUSE)
+        second = self._ingest("b.docx", CLAUSE)
+        third = self._ingest("c.docx", CLAUSE.replace("construed", "interpreted"))
+
+        self.assertEqual(first["vectors_upserted"], 1)
+        self.assertEqual((second["duplicates_exact"], second["vectors_upserted"]), (1, 0))
+        # One changed word is a different clause: stored on its own.
+        self.assertEqual((third["duplicates_near"], third["vectors_upserted"]), (0, 1))
+        embedded = sum(len(call.args[0]) for call in embed.call_args_list)
+        self.assertEqual(embedded, self.index.describe_index_stats()["total_vector_count"])
+
+        stored = self.index.fetch(ids=[f"{first['doc_id']}-0"])["vectors"][f"{first['doc_id']}-0"]
+        self.assertEqual(stored["metadata"]["doc_ids"], [first["doc_id"], second["doc_id"]])
+        sources = [ingest_service.parse_occurrence(raw) for raw in stored["metadata"]["occurrences"]]
+        self.assertEqual([s["source"] for s in sources], ["a.docx", "b.docx"])
+
+    def test_registry_lock_is_not_held_while_embedding(self, _settings, _embed):
+        registry = ingest_service.dedup.get_registry()
+        free: list[bool] = []
+
+        def probe():
+            acquired = registry.lock.acquire(blocking=False)
+            free.append(acquired)
+            if acquired:
+                registry.lock.release()
+
+        def embed(texts):
+            # Probe from another thread: the RLock is re-entrant for this one.
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+            return _fake_embed(texts)
+
+        with patch("app.services.ingest_service.embedding_service.embed_texts", side_effect=embed):
+            self._ingest("a.docx", CLAUSE)
+        self.assertEqual(free, [True])
+
+    def test_concurrent_ingests_of_the_same_text_store_it_once(self, _settings, _embed):
+        registry = ingest_service.dedup.get_registry()
+        started, release = threading.Event(), threading.Event()
+
+        def slow_embed(texts):
+            started.set()
+            release.wait(timeout=5)
+            return _fake_embed(texts)
+
+        results = {}
+
+        def ingest(name):
+            path = self.root / name
+            path.touch()
+            results[name] = ingest_service.ingest_docx(path)
+
+        # Patched once here: patch() inside each thread would unwind out of order.
+        with patch("app.services.ingest_service.embedding_service.embed_texts", side_effect=slow_embed), patch(
+            "app.services.ingest_service.cpu_pool.run", return_value=chunker.chunk_text(CLAUSE, 200)
+        ):
+            first = threading.Thread(target=ingest, args=("a.docx",))
+            first.start()
+            self.assertTrue(started.wait(timeout=5))
+            second = threading.Thread(target=ingest, args=("b.docx",))
+            second.start()
+            # The registry lock is free while the first ingest embeds.
+            with registry.lock:
+                pass
+            release.set()
+            first.join(timeout=5)
+            second.join(timeout=5)
+
+        self.assertEqual((results["b.docx"]["duplicates_exact"], results["b.docx"]["vectors_upserted"]), (1, 0))
+        self.assertEqual(self.index.describe_index_stats()["total_vector_count"], 1)
+        first_id, second_id = results["a.docx"]["doc_id"], results["b.docx"]["doc_id"]
+        stored = self.index.fetch(ids=[f"{first_id}-0"])["vectors"][f"{first_id}-0"]
+        self.assertEqual(stored["metadata"]["doc_ids"], [first_id, second_id])
+
+    def test_waits_for_pending_duplicates_are_bounded_by_the_deadline(self, _settings, _embed):
+        registry = ingest_service.dedup.get_registry()
+        first = self._ingest("a.docx", CLAUSE)["doc_id"]
+        # Re-registering marks the vector pending, as if another ingest were still storing it.
+        _register(registry, f"{first}-0", CLAUSE)
+
+        with patch.object(registry, "wait_settled", wraps=registry.wait_settled) as wait:
+            with resilience.deadline_scope(0.05):
+                self.assertEqual(self._ingest("b.docx", CLAUSE)["duplicates_exact"], 1)
+            self.assertLessEqual(wait.call_args.kwargs["timeout"], 0.05)
+            with resilience.deadline_scope(0), self.assertRaises(resilience.DeadlineExceeded):
+                self._ingest("c.docx", CLAUSE)
+
+    def test_failed_upsert_unregisters_new_chunks(self, _settings, _embed):
+        registry = ingest_service.dedup.get_registry()
+        with patch("app.services.ingest_service.vector_store.upsert_vectors", side_effect=RuntimeError("down")):
+            with self.assertRaises(RuntimeError):
+                self._ingest("a.docx", CLAUSE)
+        self.assertEqual(len(registry), 0)
+
+
+class CitedOccurrenceTests(unittest.TestCase):
+    def test_only_cited_sources_are_expanded(self):
+        sources = [{"id": "v1", "source": "a.docx"}, {"id": "v2", "source": "c.docx"}]
+        occurrences = {"v1": ["d1|0|a.docx", "d2|4|b.docx"], "v2": ["d3|1|c.docx", "d4|2|d.docx"]}
+
+        expanded = doc_qa_service._expand_cited_occurrences("See [SOURCE 1].", sources, occurrences)
+
+        self.assertEqual(expanded[0]["occurrences"][1], {"doc_id": "d2", "chunk_index": 4, "source": "b.docx"})
+        self.assertNotIn("occurrences", expanded[1])
+        self.assertNotIn("occurrences", sources[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
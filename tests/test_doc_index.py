@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from app.config import Settings
+from app.services import chunker, doc_index, doc_qa_service, ingest_service
+from app.services.dedup import DedupRegistry
+from app.services.memory_index import InMemoryIndex, matches_filter
+
+
+def _unit(*values: float) -> np.ndarray:
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class MetadataFilterTests(unittest.TestCase):
+    def test_operators(self):
+        metadata = {"doc_id": "a", "doc_ids": ["a", "b"], "kind": "nda"}
+        self.assertTrue(matches_filter(metadata, {"doc_id": "a"}))
+        self.assertTrue(matches_filter(metadata, {"doc_ids": {"$in": ["b", "z"]}}))
+        self.assertFalse(matches_filter(metadata, {"doc_ids": {"$nin": ["b"]}}))
+        self.assertTrue(matches_filter(metadata, {"$or": [{"doc_id": "z"}, {"kind": {"$ne": "lease"}}]}))
+        self.assertFalse(matches_filter(metadata, {"$and": [{"doc_id": "a"}, {"kind": "lease"}]}))
+        self.assertFalse(matches_filter(metadata, {"missing": {"$in": ["a"]}}))
+        self.assertTrue(matches_filter(metadata, {"missing": {"$ne": "a"}}))
+
+    def test_filtered_query_scores_only_matching_rows(self):
+        index = InMemoryIndex()
+        index.upsert(
+            [
+                {"id": "a-0", "values": _unit(1, 0), "metadata": {"doc_id": "a"}},
+                {"id": "b-0", "values": _unit(1, 0.1), "metadata": {"doc_id": "b"}},
+                {"id": "b-1", "values": _unit(0, 1), "metadata": {"doc_id": "b"}},
+            ]
+        )
+        result = index.query(vector=_unit(1, 0), top_k=5, filter={"doc_id": {"$in": ["b"]}})
+        self.assertEqual([match["id"] for match in result["matches"]], ["b-0", "b-1"])
+        self.assertAlmostEqual(result["matches"][0]["score"], float(_unit(1, 0.1) @ _unit(1, 0)), places=5)
+        self.assertEqual(index.query(vector=_unit(1, 0), filter={"doc_id": "zz"})["matches"], [])
+
+
+def _fake_embed(texts):
+    return np.stack([_unit(1, 0, 0) if "rent" in text else _unit(0, 1, 0) for text in texts])
+
+
+class DocumentVectorTests(unittest.TestCase):
+    def setUp(self):
+        self.index, self.doc_index = InMemoryIndex(), InMemoryIndex()
+        patches = [
+            patch("app.services.ingest_service.get_settings", return_value=Settings()),
+            patch("app.services.ingest_service.embedding_service.embed_texts", side_effect=_fake_embed),
+            patch("app.services.vector_store.get_index", return_value=self.index),
+            patch("app.services.vector_store.get_doc_index", return_value=self.doc_index),
+            patch("app.services.ingest_service.dedup.get_registry", return_value=DedupRegistry()),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+    def _ingest(self, name: str, chunks: list[str]):
+        path = self.root / name
+        path.touch()
+        with patch("app.services.ingest_service.cpu_pool.run", return_value=chunks):
+            return ingest_service.ingest_docx(path)
+
+    def test_ingest_stores_centroids_including_shared_chunks(self):
+        lease = self._ingest("lease.docx", ["The tenant pays rent monthly.", "Notices go to the landlord."])
+        copy = self._ingest("copy.docx", ["Notices go to the landlord."])
+
+        stored = self.doc_index.fetch(ids=[lease["doc_id"], copy["doc_id"]])["vectors"]
+        expected = doc_index.centroid([_unit(1, 0, 0), _unit(0, 1, 0)])
+        np.testing.assert_allclose(stored[lease["doc_id"]]["values"], expected, atol=1e-6)
+        np.testing.assert_allclose(stored[copy["doc_id"]]["values"], _unit(0, 1, 0), atol=1e-6)
+        self.assertEqual(stored[copy["doc_id"]]["metadata"]["source_filename"], "copy.docx")
+
+    def test_rebuild_matches_ingest(self):
+        lease = self._ingest("lease.docx", ["The tenant pays rent monthly.", "Notices go to the landlord."])
+        copy = self._ingest("copy.docx", ["Notices go to the landlord."])
+        ingested = self.doc_index.fetch(ids=[lease["doc_id"], copy["doc_id"]])["vectors"]
+
+        rebuilt_index = InMemoryIndex()
+        self.assertEqual(doc_index.rebuild(self.index, rebuilt_index)["documents"], 2)
+        rebuilt = rebuilt_index.fetch(ids=[lease["doc_id"], copy["doc_id"]])["vectors"]
+        for doc_id, item in ingested.items():
+            np.testing.assert_allclose(rebuilt[doc_id]["values"], item["values"], atol=1e-6)
+            self.assertEqual(rebuilt[doc_id]["metadata"]["source_filename"], item["metadata"]["source_filename"])
+
+    def test_two_stage_query_searches_only_the_top_documents(self):
+        lease = self._ingest("lease.docx", chunker.chunk_text("The tenant pays rent monthly.", 200))
+        self._ingest("nda.docx", ["Confidential information stays secret."])
+
+        result = doc_qa_service._query_chunks(_unit(1, 0.2, 0), top_k=5, top_docs=1)
+        self.assertEqual({match["metadata"]["doc_id"] for match in result["matches"]}, {lease["doc_id"]})
+        flat = doc_qa_service._query_chunks(_unit(1, 0.2, 0), top_k=5, top_docs=0)
+        self.assertEqual(len(flat["matches"]), 2)
+
+    def test_falls_back_to_flat_search_without_document_vectors(self):
+        self.index.upsert([{"id": "x-0", "values": _unit(1, 0, 0), "metadata": {"doc_id": "x"}}])
+        result = doc_qa_service._query_chunks(_unit(1, 0, 0), top_k=5, top_docs=3)
+        self.assertEqual([match["id"] for match in result["matches"]], ["x-0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import unittest
+
+from app.services.doc_qa_service import (
+    PRUNE_BELOW_FLOOR,
+    PRUNE_SCORE_GAP,
+    _select_matches,
+)
+
+
+def _matches(*scores: float) -> list[dict]:
+    return [
+        {"id": f"m{idx}", "score": score, "metadata": {"source_filename": "a.docx", "chunk_index": idx}}
+        for idx, score in enumerate(scores)
+    ]
+
+
+class SelectMatchesTests(unittest.TestCase):
+    def _select(self, matches, top_k=3, max_top_k=6):
+        return _select_matches(
+            matches, top_k=top_k, max_top_k=max_top_k, floor=0.35, max_gap=0.15, cluster_spread=0.05
+        )
+
+    def test_prunes_below_floor(self):
+        kept, pruned, window = self._select(_matches(0.8, 0.7, 0.3, 0.2))
+
+        self.assertEqual([m["id"] for m in kept], ["m0", "m1"])
+        self.assertEqual([(p["id"], p["reason"]) for p in pruned], [("m2", PRUNE_BELOW_FLOOR)])
+        self.assertEqual(window, 3)
+
+    def test_cuts_everything_after_a_large_gap(self):
+        kept, pruned, _ = self._select(_matches(0.9, 0.6, 0.58, 0.5))
+
+        self.assertEqual([m["id"] for m in kept], ["m0"])
+        self.assertEqual([p["reason"] for p in pruned], [PRUNE_SCORE_GAP, PRUNE_SCORE_GAP])
+
+    def test_widens_window_when_scores_cluster(self):
+        kept, pruned, window = self._select(_matches(0.62, 0.61, 0.60, 0.59, 0.58, 0.40, 0.39))
+
+        self.assertEqual(window, 6)
+        self.assertEqual(len(kept), 5)
+        self.assertEqual([p["reason"] for p in pruned], [PRUNE_SCORE_GAP])
+
+    def test_keeps_requested_window_when_scores_spread(self):
+        _, _, window = self._select(_matches(0.9, 0.8, 0.7, 0.69, 0.68))
+        self.assertEqual(window, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
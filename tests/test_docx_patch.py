@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+from zipfile import ZipFile
+
+import requests
+from docx import Document
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import rewrite_service
+from app.services.document_parser import extract_paragraphs_from_docx_bytes
+from app.services.docx_writer import patch_docx_paragraphs
+from app.services.llm_gateway import LLMCallFailedError, LLMResponse
+
+ALLOWED_DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _build_docx_bytes() -> bytes:
+    buffer = BytesIO()
+    doc = Document()
+    doc.add_heading("Termination", level=2)
+    para = doc.add_paragraph("Either party ", style="List Number")
+    para.add_run("may terminate").bold = True
+    para.add_run(" on notice.")
+    doc.add_paragraph("")
+    table = doc.add_table(rows=1, cols=1)
+    table.cell(0, 0).text = "Table text"
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+class PatchDocxTests(unittest.TestCase):
+    def test_paragraph_indices_follow_document_order(self):
+        paragraphs = extract_paragraphs_from_docx_bytes(_build_docx_bytes())
+        self.assertEqual(
+            paragraphs,
+            ["Termination", "Either party may terminate on notice.", "", "Table text"],
+        )
+
+    def test_patch_preserves_formatting_and_other_parts(self):
+        original = _build_docx_bytes()
+        patched = patch_docx_paragraphs(original, {1: "Each party may end this agreement.", 3: "Cell"})
+
+        self.assertEqual(
+            extract_paragraphs_from_docx_bytes(patched),
+            ["Termination", "Each party may end this agreement.", "", "Cell"],
+        )
+        with ZipFile(BytesIO(original)) as before, ZipFile(BytesIO(patched)) as after:
+            self.assertEqual(before.namelist(), after.namelist())
+            for name in before.namelist():
+                if name != "word/document.xml":
+                    self.assertEqual(before.read(name), after.read(name), name)
+
+        doc = Document(BytesIO(patched))
+        self.assertEqual(doc.paragraphs[0].style.name, "Heading 2")
+        self.assertEqual(doc.paragraphs[1].style.name, "List Number")
+        self.assertEqual(len(doc.tables), 1)
+
+
+class RewriteParagraphsTests(unittest.TestCase):
+    def setUp(self):
+        rewrite_service.get_cache().clear()
+
+    @patch("app.services.rewrite_service.generate_text")
+    def test_missing_markers_keep_original_text(self, mock_generate):
+        mock_generate.return_value = LLMResponse(content="[[P2]] Second, rewritten.")
+
+        result = rewrite_service.rewrite_paragraphs("doc-1", ["First.", "", "Second."])
+
+        self.assertEqual(result.paragraphs, ["First.", "", "Second, rewritten."])
+        self.assertEqual(result.unchanged, 1)
+
+    @patch("app.services.rewrite_service.generate_text")
+    def test_failed_llm_call_raises_instead_of_returning_originals(self, mock_generate):
+        mock_generate.side_effect = LLMCallFailedError(requests.ConnectionError("boom"))
+
+        with self.assertRaises(LLMCallFailedError):
+            rewrite_service.rewrite_paragraphs("doc-1", ["First.", "Second."])
+        response = TestClient(app).post(
+            "/api/rewrite",
+            files={"file": ("sample.docx", BytesIO(_build_docx_bytes()), ALLOWED_DOCX_TYPE)},
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+
+    @patch("app.services.rewrite_service.generate_text")
+    def test_long_documents_are_split_into_bounded_calls(self, mock_generate):
+        def rewrite(prompt, **_kwargs):
+            count = prompt.count("[[P")
+            return LLMResponse("\n".join(f"[[P{n}]] Done." for n in range(1, count + 1)))
+
+        mock_generate.side_effect = rewrite
+        paragraphs = [f"{n} " + "x" * 3000 for n in range(10)]
+        result = rewrite_service.rewrite_paragraphs("doc-1", paragraphs)
+
+        self.assertEqual(result.paragraphs, ["Done."] * 10)
+        self.assertEqual(result.unchanged, 0)
+        self.assertGreater(mock_generate.call_count, 1)
+        for call in mock_generate.call_args_list:
+            self.assertLessEqual(call.kwargs["max_tokens"], rewrite_service.MAX_REWRITE_TOKENS)
+            document = call.args[0].split("Document:")[1]
+            self.assertLessEqual(document.count("x"), rewrite_service.REWRITE_BATCH_CHARS)
+
+    @patch("app.services.rewrite_service.generate_text")
+    def test_unchanged_paragraphs_are_served_from_cache(self, mock_generate):
+        mock_generate.return_value = LLMResponse(content="[[P1]] One.\n[[P2]] Two.")
+        first = rewrite_service.rewrite_paragraphs("doc-1", ["one", "two"], goals=["clarity"])
+        self.assertEqual((first.cache_hits, first.cache_misses), (0, 2))
+
+        mock_generate.return_value = LLMResponse(content="[[P1]] Three.")
+        second = rewrite_service.rewrite_paragraphs("doc-1", ["one", "three", "two"], goals=["clarity"])
+
+        self.assertEqual(second.paragraphs, ["One.", "Three.", "Two."])
+        self.assertEqual((second.cache_hits, second.cache_misses), (2, 1))
+        revised_prompt = mock_generate.call_args.args[0]
+        self.assertIn("[[P1]] three", revised_prompt)
+        self.assertNotIn("one", revised_prompt.split("Document:")[1])
+
+        # Different goals must not reuse rewrites made under other goals.
+        third = rewrite_service.rewrite_paragraphs("doc-1", ["one"], goals=["brevity"])
+        self.assertEqual(third.cache_misses, 1)
+
+    @patch("app.services.rewrite_service.generate_text")
+    def test_route_streams_patched_docx(self, mock_generate):
+        mock_generate.return_value = LLMResponse(
+            content="[[P1]] Ending the contract\n[[P2]] Either party may end it on notice.\n[[P3]] Table text"
+        )
+        client = TestClient(app)
+
+        response = client.post(
+            "/api/rewrite",
+            files={"file": ("sample.docx", BytesIO(_build_docx_bytes()), ALLOWED_DOCX_TYPE)},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("rewritten.docx", response.headers["content-disposition"])
+        self.assertEqual(response.headers["x-rewrite-cache-misses"], "3")
+        self.assertEqual(response.headers["x-rewrite-unchanged"], "0")
+        paragraphs = extract_paragraphs_from_docx_bytes(response.content)
+        self.assertEqual(paragraphs[1], "Either party may end it on notice.")
+        self.assertEqual(Document(BytesIO(response.content)).paragraphs[0].style.name, "Heading 2")
+
+
+if __name__ == "__main__":
+    unittest.main()
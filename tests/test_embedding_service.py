@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import base64
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from app.config import Settings
+from app.services import embedding_service
+
+
+def _response(embeddings: list) -> MagicMock:
+    resp = MagicMock()
+    resp.json.return_value = {
+        "data": [{"index": idx, "embedding": emb} for idx, emb in enumerate(embeddings)]
+    }
+    return resp
+
+
+class EmbeddingServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.settings = Settings(openai_api_key="test-key")
+        settings_patcher = patch(
+            "app.services.embedding_service.get_settings", side_effect=lambda: self.settings
+        )
+        settings_patcher.start()
+        self.addCleanup(settings_patcher.stop)
+        session_patcher = patch("app.services.embedding_service.http_client.get_session")
+        self.mock_post = session_patcher.start().return_value.post
+        self.addCleanup(session_patcher.stop)
+
+    def test_returns_float32_matrix_from_base64_and_lists(self):
+        mock_post = self.mock_post
+        encoded = base64.b64encode(np.array([0.6, 0.8], dtype="<f4").tobytes()).decode()
+        mock_post.return_value = _response([encoded, [1.0, 0.0]])
+
+        result = embedding_service.embed_texts(["a", "b"])
+
+        self.assertEqual(result.dtype, np.float32)
+        self.assertEqual(result.shape, (2, 2))
+        np.testing.assert_allclose(result[0], [0.6, 0.8], rtol=1e-6)
+
+    def test_truncation_renormalizes(self):
+        self.settings = Settings(openai_api_key="test-key", embedding_dim=2)
+        mock_post = self.mock_post
+        mock_post.return_value = _response([[0.6, 0.0, 0.8]])
+
+        result = embedding_service.embed_texts(["a"])
+
+        self.assertEqual(result.shape, (1, 2))
+        self.assertAlmostEqual(float(np.linalg.norm(result[0])), 1.0, places=6)
+
+    def test_padding_keeps_values(self):
+        self.settings = Settings(openai_api_key="test-key", embedding_dim=4)
+        mock_post = self.mock_post
+        mock_post.return_value = _response([[0.6, 0.8]])
+
+        result = embedding_service.embed_texts(["a"])
+
+        np.testing.assert_allclose(result[0], [0.6, 0.8, 0.0, 0.0], rtol=1e-6)
+
+    def test_batches_large_inputs(self):
+        mock_post = self.mock_post
+        mock_post.side_effect = [_response([[1.0, 0.0]] * 2), _response([[0.0, 1.0]])]
+
+        result = embedding_service.embed_texts(["a", "b", "c"], batch_size=2)
+
+        self.assertEqual(mock_post.call_count, 2)
+        np.testing.assert_allclose(result[2], [0.0, 1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
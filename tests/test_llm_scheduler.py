@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.main import app
+from app.services import metrics
+from app.services.llm_gateway import LLMResponse
+from app.services.llm_scheduler import LLMScheduler, SchedulerOverloadedError, TokenBucket, threadpool_size
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.005)
+
+
+class LLMSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_interactive_is_admitted_before_queued_batch(self):
+        scheduler = LLMScheduler(max_concurrency=1, class_limits={}, queue_timeout=5)
+        order: list[str] = []
+        release = threading.Event()
+
+        def hold():
+            with scheduler.slot("batch", 10):
+                release.wait(timeout=5)
+
+        def run(priority: str):
+            with scheduler.slot(priority, 10):
+                order.append(priority)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        _wait_for(lambda: metrics.get("llm_scheduler.active") == 1)
+        batch = threading.Thread(target=run, args=("batch",))
+        batch.start()
+        _wait_for(lambda: metrics.get("llm_scheduler.queue_depth") == 1)
+        interactive = threading.Thread(target=run, args=("interactive",))
+        interactive.start()
+        _wait_for(lambda: metrics.get("llm_scheduler.queue_depth") == 2)
+        release.set()
+        for thread in (holder, batch, interactive):
+            thread.join(timeout=5)
+
+        self.assertEqual(order, ["interactive", "batch"])
+
+    def test_class_limit_leaves_room_for_other_classes(self):
+        scheduler = LLMScheduler(max_concurrency=2, class_limits={"batch": 1}, queue_timeout=0.2)
+        with scheduler.slot("batch", 10):
+            with self.assertRaises(SchedulerOverloadedError):
+                with scheduler.slot("batch", 10):
+                    pass
+            with scheduler.slot("interactive", 10):
+                pass
+        self.assertEqual(metrics.get("llm_scheduler.queue_timeouts.batch"), 1)
+
+    def test_full_queue_sheds_with_retry_after(self):
+        scheduler = LLMScheduler(max_concurrency=1, class_limits={}, max_queue_depth=0)
+        with scheduler.slot("interactive", 10):
+            with self.assertRaises(SchedulerOverloadedError) as ctx:
+                with scheduler.slot("interactive", 10):
+                    pass
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(metrics.get("llm_scheduler.shed.interactive"), 1)
+
+    def test_unknown_priority_is_rejected(self):
+        scheduler = LLMScheduler(max_concurrency=1, class_limits={})
+        with self.assertRaises(ValueError):
+            with scheduler.slot("urgent", 10):
+                pass
+
+
+class ThreadpoolSheddingTests(unittest.TestCase):
+    """Queued LLM calls hold request threads; shedding must still be reachable over HTTP."""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_threadpool_is_sized_past_the_queue(self):
+        settings = Settings(llm_max_concurrency=8, llm_max_queue_depth=64)
+        self.assertEqual(threadpool_size(settings), 8 + 64 + 40)
+        self.assertEqual(threadpool_size(Settings(threadpool_size=100)), 100)
+        with self.assertRaises(ValueError):
+            threadpool_size(Settings(llm_max_concurrency=8, llm_max_queue_depth=64, threadpool_size=72))
+
+    def test_requests_past_the_queue_depth_get_503(self):
+        # A queue deeper than anyio's default 40 threads: unsized, it could never fill.
+        depth, extra = 50, 3
+        settings = Settings(
+            openai_api_key="test",
+            warmup_on_startup=False,
+            single_flight_enabled=False,
+            llm_max_concurrency=1,
+            llm_max_queue_depth=depth,
+        )
+        scheduler = LLMScheduler(max_concurrency=1, class_limits={}, max_queue_depth=depth, queue_timeout=30)
+        release = threading.Event()
+
+        def post(*_args):
+            release.wait(timeout=30)
+            return LLMResponse("Answer.")
+
+        patches = [
+            patch("app.main.get_settings", return_value=settings),
+            patch("app.services.llm_gateway.get_settings", return_value=settings),
+            patch("app.services.llm_gateway.get_scheduler", return_value=scheduler),
+            patch("app.services.llm_gateway._post_completion", side_effect=post),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+
+        with TestClient(app) as client, ThreadPoolExecutor(max_workers=1 + depth + extra) as pool:
+            futures = [
+                pool.submit(client.post, "/api/qa", json={"question": f"Question number {n}?"})
+                for n in range(1 + depth + extra)
+            ]
+            _wait_for(lambda: metrics.get("llm_scheduler.shed.interactive") == extra, timeout=10)
+            release.set()
+            responses = [future.result(timeout=30) for future in futures]
+
+        codes = [response.status_code for response in responses]
+        self.assertEqual(codes.count(503), extra)
+        self.assertEqual(codes.count(200), 1 + depth)
+        shed = next(response for response in responses if response.status_code == 503)
+        self.assertGreaterEqual(int(shed.headers["Retry-After"]), 1)
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_wait_time_reflects_refill_rate(self):
+        bucket = TokenBucket(per_minute=60)
+        now = bucket.updated
+        self.assertEqual(bucket.wait_time(60, now), 0.0)
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_time(1, now), 1.0)
+        # Requests larger than the bucket are clamped rather than starving forever.
+        self.assertAlmostEqual(bucket.wait_time(600, now + 30), 30.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
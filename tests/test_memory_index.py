@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from app.services import doc_index, memory_index
+from app.services.memory_index import InMemoryIndex
+
+
+class InMemoryIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = InMemoryIndex()
+        self.index.upsert(
+            vectors=[
+                {"id": "a", "values": [1.0, 0.0, 0.0], "metadata": {"chunk_index": 0}},
+                {"id": "b", "values": [0.6, 0.8, 0.0], "metadata": {"chunk_index": 1}},
+                {"id": "c", "values": [0.0, 0.0, 1.0], "metadata": {"chunk_index": 2}},
+            ]
+        )
+
+    def test_query_orders_by_cosine_similarity(self):
+        result = self.index.query(vector=[1.0, 0.1, 0.0], top_k=2, include_metadata=True)
+        matches = result["matches"]
+
+        self.assertEqual([match["id"] for match in matches], ["a", "b"])
+        self.assertGreater(matches[0]["score"], matches[1]["score"])
+        self.assertEqual(matches[1]["metadata"], {"chunk_index": 1})
+
+    def test_metadata_omitted_unless_requested(self):
+        result = self.index.query(vector=[0.0, 0.0, 1.0], top_k=1)
+        self.assertEqual(result["matches"][0]["id"], "c")
+        self.assertNotIn("metadata", result["matches"][0])
+
+    def test_upsert_replaces_and_delete_removes(self):
+        self.index.upsert(vectors=[{"id": "c", "values": [1.0, 0.0, 0.0], "metadata": {}}])
+        self.index.delete(ids=["a", "b"])
+
+        stats = self.index.describe_index_stats()
+        self.assertEqual(stats["total_vector_count"], 1)
+        result = self.index.query(vector=[1.0, 0.0, 0.0], top_k=3)
+        self.assertAlmostEqual(result["matches"][0]["score"], 1.0)
+
+    def test_int8_quantization_preserves_ranking(self):
+        rng = np.random.default_rng(7)
+        data = rng.standard_normal((50, 32)).astype(np.float32)
+        exact = InMemoryIndex()
+        quantized = InMemoryIndex(quantization="int8")
+        vectors = [{"id": str(i), "values": row, "metadata": {}} for i, row in enumerate(data)]
+        exact.upsert(vectors=vectors)
+        quantized.upsert(vectors=vectors)
+
+        query = data[3] + 0.05 * rng.standard_normal(32).astype(np.float32)
+        exact_top = exact.query(vector=query, top_k=5)["matches"]
+        quantized_top = quantized.query(vector=query, top_k=5)["matches"]
+
+        self.assertEqual(quantized_top[0]["id"], "3")
+        self.assertAlmostEqual(quantized_top[0]["score"], exact_top[0]["score"], places=2)
+        stats = quantized.describe_index_stats()
+        self.assertLess(stats["vector_bytes"], exact.describe_index_stats()["vector_bytes"])
+
+
+
+class DocFilterTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.data = rng.standard_normal((200, 16)).astype(np.float32)
+        self.index = InMemoryIndex()
+        self.index.upsert(
+            vectors=[
+                {"id": f"v{i}", "values": row, "metadata": {"doc_id": f"d{i % 20}", "chunk_index": i // 20}}
+                for i, row in enumerate(self.data)
+            ]
+        )
+
+    def test_doc_filters_use_the_doc_map_without_scanning(self):
+        query = self.data[7]
+        with patch("app.services.memory_index.matches_filter", wraps=memory_index.matches_filter) as checked:
+            matches = self.index.query(vector=query, top_k=30, filter={"doc_id": {"$in": ["d7", "d3"]}})["matches"]
+            single = self.index.query(vector=query, top_k=30, filter={"doc_id": "d7"})["matches"]
+        checked.assert_not_called()
+        self.assertEqual(len(matches), 20)
+        self.assertEqual({match["id"] for match in matches}, {f"v{i}" for i in range(200) if i % 20 in (3, 7)})
+        self.assertEqual(matches[0]["id"], "v7")
+        self.assertEqual({match["id"] for match in single}, {f"v{i}" for i in range(200) if i % 20 == 7})
+
+        # Other clauses are checked against the candidates only.
+        with patch("app.services.memory_index.matches_filter", wraps=memory_index.matches_filter) as checked:
+            narrowed = self.index.query(
+                vector=query, top_k=30, filter={"doc_id": {"$in": ["d7"]}, "chunk_index": {"$in": [0, 1]}}
+            )["matches"]
+        self.assertEqual(checked.call_count, 10)
+        self.assertEqual({match["id"] for match in narrowed}, {"v7", "v27"})
+
+    def test_two_stage_chunk_filter_uses_the_doc_map(self):
+        # Deduplicated rows list every document they occur in under doc_ids.
+        self.index.update(id="v5", set_metadata={"doc_ids": ["d5", "d9"]})
+        with patch("app.services.memory_index.matches_filter", wraps=memory_index.matches_filter) as checked:
+            matches = self.index.query(vector=self.data[9], top_k=50, filter=doc_index.chunk_filter(["d9"]))["matches"]
+        checked.assert_not_called()
+        self.assertEqual({match["id"] for match in matches}, {f"v{i}" for i in range(9, 200, 20)} | {"v5"})
+
+    def test_doc_map_follows_upserts_updates_and_deletes(self):
+        self.index.delete(ids=[f"v{i}" for i in range(0, 200, 20)])  # all of d0, swapping rows around
+        self.index.upsert(vectors=[{"id": "v1", "values": self.data[1], "metadata": {"doc_id": "d0"}}])
+        self.index.update(id="v2", set_metadata={"doc_id": "d0"})
+
+        def ids(doc_id):
+            matches = self.index.query(vector=self.data[1], top_k=50, filter={"doc_id": doc_id})["matches"]
+            return {match["id"] for match in matches}
+
+        self.assertEqual(ids("d0"), {"v1", "v2"})
+        self.assertEqual(ids("d1"), {f"v{i}" for i in range(21, 200, 20)})
+        self.assertEqual(ids("d2"), {f"v{i}" for i in range(22, 200, 20)})
+        self.index.delete(delete_all=True)
+        self.assertEqual(self.index.query(vector=self.data[1], top_k=5, filter={"doc_id": "d1"})["matches"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
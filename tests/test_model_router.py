@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.main import app
+from app.services import llm_gateway, metrics, model_router
+from app.services.doc_qa_service import has_valid_citations
+from app.services.llm_gateway import LLMCallFailedError, LLMResponse
+
+TIERED = Settings(openai_model="small-model", llm_large_model="large-model", router_large_prompt_chars=100)
+
+
+@patch("app.services.model_router.get_settings", return_value=TIERED)
+class ModelRouterTests(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        model_router.reset_health()
+
+    def test_routes_by_task_and_prompt_size(self, _settings):
+        self.assertEqual(model_router.choose("qa", 50).model, "small-model")
+        self.assertEqual(model_router.choose("qa", 500).model, "large-model")
+        self.assertEqual(model_router.choose("rewrite").model, "large-model")
+        self.assertEqual(metrics.get("model_router.qa.small"), 1)
+        self.assertEqual(metrics.get("model_router.reason.prompt_size"), 1)
+
+    def test_failing_model_falls_back_to_healthy_tier(self, _settings):
+        for _ in range(10):
+            model_router.record_outcome("small-model", 0.1, ok=False)
+        route = model_router.choose("qa", 50)
+        self.assertEqual((route.model, route.reason), ("large-model", "error_rate"))
+        self.assertIsNone(route.escalation_model)
+
+    def test_single_model_without_large_tier(self, settings):
+        settings.return_value = Settings(openai_model="only-model")
+        route = model_router.choose("rewrite")
+        self.assertEqual((route.model, route.escalation_model), ("only-model", None))
+
+
+@patch("app.services.model_router.get_settings", return_value=TIERED)
+@patch("app.services.llm_gateway.generate_text")
+class CascadeTests(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        model_router.reset_health()
+
+    def test_accepted_answer_is_not_escalated(self, generate, _settings):
+        generate.return_value = LLMResponse(content="Yes [SOURCE 1].", model="small-model")
+        response = llm_gateway.generate_for_task("doc_qa", "q", accept=lambda a: has_valid_citations(a, 2))
+        self.assertEqual(response.model, "small-model")
+        self.assertEqual(generate.call_count, 1)
+
+    def test_rejected_answer_escalates_once(self, generate, _settings):
+        generate.side_effect = [
+            LLMResponse(content="Yes, see [SOURCE 7].", model="small-model"),
+            LLMResponse(content="Yes [SOURCE 1].", model="large-model"),
+        ]
+        response = llm_gateway.generate_for_task("doc_qa", "q", accept=lambda a: has_valid_citations(a, 2))
+        self.assertEqual(response.model, "large-model")
+        self.assertEqual(generate.call_args.kwargs["model"], "large-model")
+        self.assertEqual(metrics.get("model_router.doc_qa.escalated"), 1)
+
+    def test_failed_call_escalates_and_fails_without_a_larger_model(self, generate, settings):
+        generate.side_effect = [
+            LLMCallFailedError(requests.ConnectionError("reset")),
+            LLMResponse(content="Yes [SOURCE 1].", model="large-model"),
+        ]
+        self.assertEqual(llm_gateway.generate_for_task("doc_qa", "q").model, "large-model")
+
+        settings.return_value = Settings(openai_model="only-model")
+        generate.side_effect = LLMCallFailedError(requests.ConnectionError("reset"))
+        with self.assertRaises(LLMCallFailedError):
+            llm_gateway.generate_for_task("doc_qa", "q")
+
+
+def _http_error(status: int, retry_after: str | None = None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+class FailedCallTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+
+    def setUp(self):
+        metrics.reset()
+        model_router.reset_health()
+        self.upstream = MagicMock()
+        for item in (
+            patch("app.services.llm_gateway.get_api_key", return_value="key"),
+            patch("app.services.llm_gateway.get_upstream", return_value=self.upstream),
+        ):
+            item.start()
+            self.addCleanup(item.stop)
+
+    def test_exhausted_retries_are_not_served_as_answers(self):
+        cases = [
+            (requests.ConnectionError("reset"), 503, "5"),
+            (_http_error(429, retry_after="12"), 503, "12"),
+            (_http_error(400), 502, "5"),
+        ]
+        for error, status, retry_after in cases:
+            with self.subTest(status=status, retry_after=retry_after), patch(
+                "app.services.llm_gateway.model_router.record_outcome"
+            ) as record:
+                self.upstream.call.side_effect = error
+                response = self.client.post("/api/qa", json={"question": "What is consideration?"})
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.headers["Retry-After"], retry_after)
+                self.assertNotIn("answer", response.json())
+                self.assertFalse(record.call_args.args[2])
+
+
+class CitationCheckTests(unittest.TestCase):
+    def test_requires_in_range_citations(self):
+        self.assertTrue(has_valid_citations("A [SOURCE 1] and [source 2].", 2))
+        self.assertFalse(has_valid_citations("No citations here.", 2))
+        self.assertFalse(has_valid_citations("Bad [SOURCE 3].", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.main import app
+from app.services import profiler
+
+
+def _busy_with_secret(stop: threading.Event, secret: str) -> None:
+    while not stop.is_set():
+        _ = secret.upper()
+
+
+class ProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.settings = Settings(
+            admin_token="s3cret", profile_dir=Path(self.tmp.name), profile_interval_ms=1, profile_max_artifacts=2
+        )
+        for target in ("app.services.profiler.get_settings", "app.main.get_settings"):
+            patcher = patch(target, side_effect=lambda: self.settings)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_samples_attached_thread_without_recording_locals(self):
+        profile = profiler.start("req-1")
+        stop = threading.Event()
+
+        def work():
+            with profile.attach():
+                _busy_with_secret(stop, "CONFIDENTIAL CLAUSE TEXT")
+
+        worker = threading.Thread(target=work)
+        worker.start()
+        time.sleep(0.1)
+        stop.set()
+        worker.join()
+        path = profiler.finish(profile)
+
+        folded = path.with_suffix(".folded").read_text(encoding="utf-8")
+        self.assertIn("test_profiler:_busy_with_secret", folded)
+        self.assertNotIn("CONFIDENTIAL", folded)
+        self.assertNotIn("CONFIDENTIAL", path.read_text(encoding="utf-8"))
+
+    def test_unattached_threads_are_not_sampled(self):
+        profile = profiler.start("req-2")
+        time.sleep(0.02)
+        profiler.finish(profile)
+        self.assertEqual(profile.samples, Counter())
+
+    def test_old_artifacts_are_pruned(self):
+        for index in range(4):
+            profiler.finish(profiler.start(f"req-{index}"))
+            time.sleep(0.01)
+        kept = sorted(path.name for path in Path(self.tmp.name).glob("*.svg"))
+        self.assertEqual(kept, ["req-2.svg", "req-3.svg"])
+        self.assertIsNone(profiler.artifact_path("req-0", "folded"))
+
+    def test_flamegraph_escapes_labels(self):
+        svg = profiler.render_flamegraph(Counter({"mod:<lambda>;mod:inner": 3}))
+        self.assertIn("&lt;lambda&gt;", svg)
+        self.assertNotIn("<lambda>", svg)
+
+    def test_admin_token_is_required(self):
+        self.assertTrue(profiler.admin_authorized("s3cret"))
+        self.assertFalse(profiler.admin_authorized("wrong"))
+        self.assertFalse(profiler.admin_authorized(None))
+        self.settings = Settings()
+        self.assertFalse(profiler.admin_authorized("s3cret"))
+
+    def test_flagged_request_is_profiled_and_served(self):
+        client = TestClient(app)
+        response = client.get("/health", headers={"X-Profile": "1", "X-Admin-Token": "s3cret", "X-Request-ID": "abc-1"})
+        self.assertEqual(response.headers["X-Request-ID"], "abc-1")
+        self.assertEqual(response.headers["X-Profile-Id"], "abc-1")
+
+        denied = client.get("/api/admin/profiles/abc-1")
+        self.assertEqual(denied.status_code, 403)
+        served = client.get("/api/admin/profiles/abc-1?format=folded", headers={"X-Admin-Token": "s3cret"})
+        self.assertEqual(served.status_code, 200)
+
+    def test_profile_header_without_token_is_ignored(self):
+        response = TestClient(app).get("/health", headers={"X-Profile": "1", "X-Request-ID": "../etc"})
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertNotEqual(response.headers["X-Request-ID"], "../etc")
+
+    def test_memory_snapshot_endpoint(self):
+        client = TestClient(app)
+        headers = {"X-Admin-Token": "s3cret"}
+        self.addCleanup(profiler.stop_memory_tracing)
+        self.assertEqual(client.post("/api/admin/memory/snapshot", headers=headers).json()["status"], "tracing_started")
+        retained = [bytearray(1024) for _ in range(100)]
+        diff = client.post("/api/admin/memory/snapshot", headers=headers).json()
+        self.assertEqual(diff["status"], "diff")
+        self.assertTrue(all(":" in entry["location"] for entry in diff["top"]))
+        del retained
+        self.assertEqual(client.delete("/api/admin/memory/snapshot", headers=headers).json()["status"], "stopped")
+
+    def test_admin_endpoints_hidden_without_token(self):
+        self.settings = Settings()
+        response = TestClient(app).post("/api/admin/memory/snapshot", headers={"X-Admin-Token": "x"})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
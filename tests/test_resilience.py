@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from app.services import metrics, resilience
+from app.services.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, Upstream
+
+
+def _http_error(status: int, retry_after: str | None = None) -> requests.HTTPError:
+    response = MagicMock(status_code=status, headers={} if retry_after is None else {"Retry-After": retry_after})
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+class DeadlineTests(unittest.TestCase):
+    def test_stage_timeout_is_capped_by_remaining_budget(self):
+        self.assertEqual(resilience.stage_timeout("llm", 15.0), 15.0)
+        with resilience.deadline_scope(2.0):
+            self.assertLessEqual(resilience.stage_timeout("llm", 15.0), 2.0)
+            with resilience.deadline_scope(60.0):
+                # An inner scope never extends the outer deadline.
+                self.assertLessEqual(resilience.remaining(), 2.0)
+        self.assertIsNone(resilience.remaining())
+
+    def test_expired_budget_raises(self):
+        with resilience.deadline_scope(0.0):
+            with self.assertRaises(DeadlineExceeded):
+                resilience.check_deadline("vector_query")
+
+
+@patch("app.services.resilience.time.sleep")
+class UpstreamTests(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.upstream = Upstream("test", timeout_cap=5.0, max_attempts=3)
+
+    def test_retries_transient_errors(self, _sleep):
+        fn = MagicMock(side_effect=[_http_error(503), requests.ConnectionError("reset"), "ok"])
+        self.assertEqual(self.upstream.call(fn), "ok")
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(metrics.get("upstream.test.retries"), 2)
+
+    def test_client_errors_are_not_retried(self, _sleep):
+        fn = MagicMock(side_effect=_http_error(400))
+        with self.assertRaises(requests.HTTPError):
+            self.upstream.call(fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_gives_up_after_max_attempts(self, _sleep):
+        fn = MagicMock(side_effect=_http_error(429))
+        with self.assertRaises(requests.HTTPError):
+            self.upstream.call(fn)
+        self.assertEqual(fn.call_count, 3)
+
+    def test_retry_after_within_the_cap_is_honoured(self, sleep):
+        fn = MagicMock(side_effect=[_http_error(429, retry_after="1.5"), "ok"])
+        self.assertEqual(self.upstream.call(fn), "ok")
+        sleep.assert_called_once_with(1.5)
+
+    def test_huge_retry_after_surfaces_the_error_without_sleeping(self, sleep):
+        error = _http_error(429, retry_after="86400")
+        fn = MagicMock(side_effect=error)
+        with self.assertRaises(requests.HTTPError) as raised:
+            self.upstream.call(fn)
+        self.assertIs(raised.exception, error)
+        self.assertEqual(fn.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_negative_retry_after_falls_back_to_backoff(self, sleep):
+        fn = MagicMock(side_effect=[_http_error(503, retry_after="-5"), "ok"])
+        self.assertEqual(self.upstream.call(fn), "ok")
+        delay = sleep.call_args.args[0]
+        self.assertTrue(0.0 <= delay <= self.upstream.backoff_cap)
+        self.assertIsNone(resilience.retry_after_hint(_http_error(503, retry_after="-5")))
+
+    def test_timeout_passed_to_call_respects_deadline(self, _sleep):
+        fn = MagicMock(return_value="ok")
+        with resilience.deadline_scope(1.0):
+            self.upstream.call(fn)
+        self.assertLessEqual(fn.call_args.args[0], 1.0)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_opens_after_threshold_and_recovers_after_probe(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=0.05)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()  # half-open probe
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()  # only one probe at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+
+class HedgingTests(unittest.TestCase):
+    def test_hedge_fires_after_p95_and_first_success_wins(self):
+        metrics.reset()
+        upstream = Upstream("hedge", timeout_cap=5.0, hedge=True)
+        for _ in range(20):
+            upstream.latency.record(0.01)
+        release = threading.Event()
+        calls = 0
+
+        def fn(timeout: float) -> str:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                release.wait(timeout=2)
+                return "slow"
+            return "fast"
+
+        try:
+            self.assertEqual(upstream.call(fn), "fast")
+        finally:
+            release.set()
+        self.assertEqual(metrics.get("upstream.hedge.hedge_wins"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from app.config import Settings
+from app.services import doc_qa_service, retrieval_cache, vector_store
+from app.services.llm_gateway import LLMResponse
+from app.services.memory_index import InMemoryIndex
+from app.services.retrieval_cache import RetrievalCache
+
+
+class RetrievalCacheTests(unittest.TestCase):
+    def _use(self, cache: RetrievalCache) -> None:
+        patcher = patch("app.services.retrieval_cache.get_cache", return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lru_eviction(self):
+        cache = RetrievalCache(max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, 0, {"key": key})
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), {"key": "c"})
+        self.assertEqual(len(cache), 2)
+
+    def test_hits_are_copies_and_writes_invalidate(self):
+        self._use(RetrievalCache(max_entries=10))
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"sources": [{"id": "v1"}]}
+
+        first = retrieval_cache.cached("doc_qa", ("q", 5), compute)
+        second = retrieval_cache.cached("doc_qa", ("q", 5), compute)
+        second["sources"].clear()
+        self.assertEqual(retrieval_cache.cached("doc_qa", ("q", 5), compute), first)
+        self.assertEqual(len(calls), 1)
+
+        vector_store.upsert_vectors(InMemoryIndex(), [{"id": "x", "values": [1.0, 0.0], "metadata": {}}])
+        retrieval_cache.cached("doc_qa", ("q", 5), compute)
+        self.assertEqual(len(calls), 2)
+
+    def test_uncacheable_results_are_recomputed(self):
+        self._use(RetrievalCache(max_entries=10))
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"partial": True}
+
+        for _ in range(2):
+            retrieval_cache.cached("doc_qa", ("q",), compute, cacheable=lambda result: not result.get("partial"))
+        self.assertEqual(len(calls), 2)
+
+    def test_shared_tier_and_version_cross_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "cache.db")
+            worker_a, worker_b = RetrievalCache(10, path), RetrievalCache(10, path)
+            worker_a.put("k", worker_a.version(), [1, 2])
+            self.assertEqual(worker_b.get("k"), [1, 2])
+
+            worker_b.bump()
+            self.assertEqual(worker_a.version(), 1)
+            self.assertIsNone(RetrievalCache(10, path).get("k"))
+
+    def test_shared_tier_is_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "cache.db")
+            cache = RetrievalCache(1, path, max_db_entries=3)
+            for index in range(5):
+                cache.put(f"k{index}", 0, index)
+            fresh = RetrievalCache(1, path)
+            self.assertIsNone(fresh.get("k1"))
+            self.assertEqual(fresh.get("k4"), 4)
+
+
+class GetCacheTests(unittest.TestCase):
+    def _cache(self, **overrides):
+        retrieval_cache.get_cache.cache_clear()
+        self.addCleanup(retrieval_cache.get_cache.cache_clear)
+        with patch("app.services.retrieval_cache.get_settings", return_value=Settings(**overrides)):
+            return retrieval_cache.get_cache()
+
+    def test_shared_index_needs_a_shared_version(self):
+        self.assertIsNone(self._cache(vector_store_backend="pinecone"))
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = self._cache(vector_store_backend="pinecone", retrieval_cache_db=str(Path(tmp) / "c.db"))
+            self.assertIsNotNone(cache)
+            cache._conn.close()
+
+    def test_memory_backend_caches_per_process(self):
+        self.assertIsNotNone(self._cache(vector_store_backend="memory"))
+        self.assertIsNone(self._cache(vector_store_backend="memory", retrieval_cache_size=0))
+
+
+class DocQACacheTests(unittest.TestCase):
+    def setUp(self):
+        self.index = InMemoryIndex()
+        self.index.upsert(
+            [{"id": "d-0", "values": [1.0, 0.0], "metadata": {"source_filename": "a.docx", "chunk_index": 0}}]
+        )
+        settings = Settings(openai_api_key="test", single_flight_enabled=False)
+        self.embed = patch(
+            "app.services.doc_qa_service.embedding_service.embed_texts",
+            side_effect=lambda texts: np.ones((len(texts), 2), dtype=np.float32),
+        )
+        patches = [
+            patch("app.services.doc_qa_service.get_settings", return_value=settings),
+            patch("app.services.retrieval_cache.get_cache", return_value=RetrievalCache(10)),
+            patch("app.services.doc_qa_service.vector_store.get_index", return_value=self.index),
+            patch("app.services.doc_qa_service.chunk_store.load_excerpt", return_value="Clause text."),
+            patch("app.services.doc_qa_service.generate_for_task", return_value=LLMResponse("Yes [SOURCE 1].")),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+
+    def test_repeated_question_skips_embedding_until_the_index_changes(self):
+        with self.embed as embed:
+            first = doc_qa_service.answer_question("Is there a clause?")
+            second = doc_qa_service.answer_question("  is there a CLAUSE? ")
+            self.assertEqual(embed.call_count, 1)
+            self.assertEqual(first["sources"], second["sources"])
+
+            metadata = {"source_filename": "a.docx", "chunk_index": 1}
+            vector_store.upsert_vectors(self.index, [{"id": "d-1", "values": [0.0, 1.0], "metadata": metadata}])
+            doc_qa_service.answer_question("Is there a clause?")
+            self.assertEqual(embed.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from app.config import Settings
+from app.services import chunker, doc_qa_service
+from manual_retrieval_eval import (
+    DEFAULT_GOLDEN,
+    Config,
+    cached_embedder,
+    cheapest,
+    chunk_spans,
+    covers,
+    evaluate,
+    load_documents,
+    load_golden,
+    stub_embedder,
+)
+
+ROOT = Path(__file__).resolve().parents[1]
+TEXT = "one two three four five six seven eight nine ten eleven twelve"
+
+
+class ChunkOverlapTests(unittest.TestCase):
+    def test_no_overlap_is_unchanged(self):
+        self.assertEqual(
+            chunker.chunk_text(TEXT, 20),
+            ["one two three four", "five six seven eight", "nine ten eleven", "twelve"],
+        )
+
+    def test_chunks_repeat_the_previous_tail_within_bounds(self):
+        chunks = chunker.chunk_text(TEXT, 20, overlap=8)
+        self.assertEqual(chunks[:2], ["one two three four", "four five six seven"])
+        self.assertTrue(all(len(chunk) <= 20 for chunk in chunks))
+        self.assertTrue(chunks[-1].endswith("twelve"))
+        # An overlap as large as the chunk still makes progress.
+        self.assertTrue(chunker.chunk_text(TEXT, 20, overlap=100)[-1].endswith("twelve"))
+
+
+class RetrievalEvalTests(unittest.TestCase):
+    def setUp(self):
+        self.documents = load_documents(ROOT / "RAG_Source_Doc")
+        self.questions = load_golden(DEFAULT_GOLDEN, self.documents)
+
+    def test_golden_spans_resolve_against_the_corpus(self):
+        self.assertEqual(len(self.questions), 15)
+        for item in self.questions:
+            for document, start, end in item["targets"]:
+                self.assertLess(start, end)
+                self.assertIn(document, self.documents)
+
+    def test_relevance_is_judged_by_span_coverage(self):
+        text = self.documents["Employment_Law_Test_Document (1).docx"]
+        spans = chunk_spans(text, chunker.chunk_text(text, 200, overlap=50))
+        target = self.questions[0]["targets"][0]
+        hits = [span for span in spans if covers(("Employment_Law_Test_Document (1).docx", *span), target)]
+        self.assertTrue(hits)
+        self.assertFalse(covers(("Property_Conveyancing_Test_Document (1).docx", *hits[0]), target))
+
+    def test_sweep_is_deterministic_and_reports_cost(self):
+        configs = [Config(800, 50, 3, 0.1), Config(200, 0, 3, 0.1)]
+        embed = stub_embedder(256)
+        rows = evaluate(self.documents, self.questions, configs, embed, Settings())
+        again = evaluate(self.documents, self.questions, configs, embed, Settings())
+
+        strip = lambda row: {k: v for k, v in row.items() if not k.startswith("latency")}
+        self.assertEqual([strip(row) for row in rows], [strip(row) for row in again])
+        wide, narrow = rows
+        self.assertGreater(narrow["vectors_stored"], wide["vectors_stored"])
+        self.assertGreaterEqual(wide["recall_at_k"], narrow["recall_at_k"])
+        self.assertTrue(0.0 <= wide["mrr"] <= 1.0)
+        self.assertGreater(wide["prompt_tokens_mean"], 0)
+        self.assertIs(cheapest(rows, 0.0), min(rows, key=lambda row: row["prompt_tokens_mean"]))
+        self.assertIsNone(cheapest(rows, 1.1))
+
+    def test_questions_go_through_the_production_retrieval(self):
+        configs = [Config(800, 0, 3, 0.1)]
+        with patch.object(doc_qa_service, "retrieve_sources", wraps=doc_qa_service.retrieve_sources) as retrieve:
+            rows = evaluate(self.documents, self.questions, configs, stub_embedder(256), Settings())
+        self.assertEqual(retrieve.call_count, len(self.questions))
+        hierarchical = evaluate(
+            self.documents, self.questions, configs, stub_embedder(256), Settings(hierarchical_top_docs=1)
+        )
+        self.assertLessEqual(hierarchical[0]["sources_mean"], rows[0]["sources_mean"])
+
+    def test_cached_embeddings_replay_without_the_embedder(self):
+        texts = ["first clause", "second clause", "first clause"]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "vectors.npz"
+            recorded = cached_embedder(path, stub_embedder(16))(texts)
+            replayed = cached_embedder(path)(texts)
+            np.testing.assert_array_equal(recorded, replayed)
+            with self.assertRaises(ValueError):
+                cached_embedder(path)(["unseen clause"])
+
+
+if __name__ == "__main__":
+    unittest.main()
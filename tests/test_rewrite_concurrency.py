@@ -7,8 +7,10 @@ from unittest.mock import patch
 from docx import Document
 from fastapi.testclient import TestClient
 
+from app.config import Settings
 from app.main import app
 from app.services import rewrite_service
+from app.services.llm_gateway import LLMResponse
 from app.services.services import lock_service
 
 ALLOWED_DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
@@ -28,23 +30,30 @@ class RewriteConcurrencyTests(unittest.TestCase):
     def setUpClass(cls):
         cls.client = TestClient(app)
 
-    def tearDown(self):
-        lock_service.release("rewrite:demo-doc-1")
-        lock_service.release("rewrite:doc-456")
+    def setUp(self):
+        self.data = _build_docx_bytes()
+        self.lock_key = rewrite_service.lock_key(rewrite_service.document_id_for(self.data), [], None)
+        self.other_key = rewrite_service.lock_key("doc-456", [], None)
+
+    def _hold(self, key: str) -> str:
+        token = lock_service.acquire(key, ttl_seconds=60)
+        self.assertIsNotNone(token)
+        self.addCleanup(lock_service.release, key, token)
+        return token
 
     @patch("app.services.rewrite_service.generate_text")
     def test_route_returns_409_when_rewrite_is_already_running(
         self,
         mock_generate,
     ):
-        self.assertTrue(lock_service.acquire("rewrite:demo-doc-1", ttl_seconds=60))
+        self._hold(self.lock_key)
 
         response = self.client.post(
             "/api/rewrite",
             files={
                 "file": (
                     "sample.docx",
-                    BytesIO(_build_docx_bytes()),
+                    BytesIO(self.data),
                     ALLOWED_DOCX_TYPE,
                 )
             },
@@ -57,6 +66,21 @@ class RewriteConcurrencyTests(unittest.TestCase):
         )
         mock_generate.assert_not_called()
 
+    @patch("app.services.rewrite_service.generate_text", return_value=LLMResponse("[[P1]] Rewritten."))
+    def test_different_documents_do_not_share_a_lock(self, _mock_generate):
+        other = Document()
+        other.add_paragraph("A different document.")
+        buffer = BytesIO()
+        other.save(buffer)
+        self._hold(self.lock_key)
+
+        response = self.client.post(
+            "/api/rewrite",
+            files={"file": ("other.docx", BytesIO(buffer.getvalue()), ALLOWED_DOCX_TYPE)},
+        )
+
+        self.assertEqual(response.status_code, 200)
+
     @patch("app.services.rewrite_service.generate_text", side_effect=RuntimeError("boom"))
     def test_service_releases_lock_when_llm_call_fails(self, _mock_generate):
         with self.assertRaises(RuntimeError):
@@ -65,4 +89,34 @@ class RewriteConcurrencyTests(unittest.TestCase):
                 text="Rewrite this text.",
             )
 
-        self.assertTrue(lock_service.acquire("rewrite:doc-456", ttl_seconds=60))
+        self._hold(self.other_key)
+
+    @patch("app.services.rewrite_service.generate_text", return_value=LLMResponse("[[P1]] Rewritten."))
+    def test_same_document_with_other_goals_does_not_conflict(self, _mock_generate):
+        self._hold(self.lock_key)
+
+        response = self.client.post(
+            "/api/rewrite",
+            files={"file": ("sample.docx", BytesIO(self.data), ALLOWED_DOCX_TYPE)},
+            data={"goals": "plain english"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_lock_outlives_the_rewrite_deadline(self):
+        settings = Settings(rewrite_deadline_seconds=300)
+        with patch("app.services.rewrite_service.get_settings", return_value=settings), patch(
+            "app.services.rewrite_service.lock_service.acquire", wraps=lock_service.acquire
+        ) as acquire, patch("app.services.rewrite_service.generate_text", return_value=LLMResponse("Done.")):
+            rewrite_service.rewrite_document(document_id="doc-456", text="Rewrite this text.")
+        self.assertGreater(acquire.call_args.kwargs["ttl_seconds"], 300)
+
+    def test_stale_release_does_not_drop_a_newer_holder(self):
+        with patch("app.services.services.lock_service.time.time", return_value=1000.0):
+            stale = lock_service.acquire(self.other_key, ttl_seconds=1)
+        # The first holder's lock expired, so a second caller takes it over.
+        current = self._hold(self.other_key)
+        lock_service.release(self.other_key, stale)
+        self.assertIsNone(lock_service.acquire(self.other_key, ttl_seconds=60))
+        lock_service.release(self.other_key, current)
+        self._hold(self.other_key)
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import sqlite3
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from docx import Document
+
+from app.config import Settings
+from app.services import doc_qa_service, session_store
+from app.services.llm_gateway import LLMResponse
+from app.services.session_store import SessionNotFoundError, SessionStore
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _vectors(count: int, dim: int = 8) -> np.ndarray:
+    return np.random.default_rng(count).random((count, dim), dtype=np.float32)
+
+
+class SessionStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+
+    def _store(self, **overrides) -> SessionStore:
+        options = {"ttl_seconds": 60.0, "max_sessions": 3, "max_bytes": 10**6, **overrides}
+        return SessionStore(clock=self.clock, **options)
+
+    def test_get_returns_session_and_refreshes_ttl(self):
+        store = self._store()
+        session = store.add("a.docx", ["one", "two"], _vectors(2))
+        self.clock.now = 50
+        self.assertIs(store.get(session.session_id), session)
+        self.clock.now = 100
+        self.assertIs(store.get(session.session_id), session)
+        self.clock.now = 161
+        with self.assertRaises(SessionNotFoundError):
+            store.get(session.session_id)
+
+    def test_least_recently_used_session_is_evicted_past_the_count_cap(self):
+        store = self._store(max_sessions=2)
+        first = store.add("a.docx", ["a"], _vectors(1))
+        second = store.add("b.docx", ["b"], _vectors(1))
+        store.get(first.session_id)
+        store.add("c.docx", ["c"], _vectors(1))
+        store.get(first.session_id)
+        with self.assertRaises(SessionNotFoundError):
+            store.get(second.session_id)
+
+    def test_memory_cap_evicts_oldest_and_rejects_oversized_documents(self):
+        probe = self._store().add("a.docx", ["x" * 100], _vectors(4))
+        store = self._store(max_bytes=probe.nbytes * 2)
+        first = store.add("a.docx", ["x" * 100], _vectors(4))
+        store.add("b.docx", ["x" * 100], _vectors(4))
+        store.add("c.docx", ["x" * 100], _vectors(4))
+        self.assertEqual(len(store), 2)
+        with self.assertRaises(SessionNotFoundError):
+            store.get(first.session_id)
+        with self.assertRaises(ValueError):
+            store.add("big.docx", ["x" * 100] * 20, _vectors(20))
+
+    def test_delete(self):
+        store = self._store()
+        session = store.add("a.docx", ["a"], _vectors(1))
+        self.assertTrue(store.delete(session.session_id))
+        self.assertFalse(store.delete(session.session_id))
+
+
+class SharedSessionStoreTests(unittest.TestCase):
+    """Two stores on one file stand in for two gunicorn workers."""
+
+    def setUp(self):
+        self.clock = _Clock()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "sessions.db"
+
+    def _worker(self, **overrides) -> SessionStore:
+        options = {"ttl_seconds": 60.0, "max_sessions": 3, "max_bytes": 10**6, **overrides}
+        return SessionStore(clock=self.clock, db_path=self.path, **options)
+
+    def test_session_created_in_one_worker_is_served_by_another(self):
+        first, second = self._worker(), self._worker()
+        vectors = _vectors(3)
+        session = first.add("a.docx", ["one", "two", "three"], vectors)
+        loaded = second.get(session.session_id)
+        self.assertEqual((loaded.filename, loaded.chunks), ("a.docx", ["one", "two", "three"]))
+        expected = session.index.query(vector=vectors[1], top_k=3)["matches"]
+        actual = loaded.index.query(vector=vectors[1], top_k=3)["matches"]
+        self.assertEqual([match["id"] for match in actual], [match["id"] for match in expected])
+        self.assertEqual(len(second), 1)
+
+    def test_use_in_any_worker_refreshes_the_ttl(self):
+        first, second = self._worker(), self._worker()
+        session = first.add("a.docx", ["a"], _vectors(1))
+        self.clock.now = 50
+        second.get(session.session_id)
+        self.clock.now = 100
+        self.assertIs(first.get(session.session_id), session)
+        self.clock.now = 161
+        with self.assertRaises(SessionNotFoundError):
+            second.get(session.session_id)
+
+    def test_caps_and_deletes_apply_across_workers(self):
+        first, second = self._worker(max_sessions=2), self._worker(max_sessions=2)
+        oldest = first.add("a.docx", ["a"], _vectors(1))
+        self.clock.now = 1
+        kept = second.add("b.docx", ["b"], _vectors(1))
+        self.clock.now = 2
+        second.add("c.docx", ["c"], _vectors(1))
+        with self.assertRaises(SessionNotFoundError):
+            first.get(oldest.session_id)
+        self.assertTrue(second.delete(kept.session_id))
+        with self.assertRaises(SessionNotFoundError):
+            first.get(kept.session_id)
+
+    def _stored_ids(self) -> set[str]:
+        with sqlite3.connect(self.path) as conn:
+            return {row[0] for row in conn.execute("SELECT session_id FROM sessions")}
+
+    def test_expired_document_text_is_purged_without_new_uploads(self):
+        worker = self._worker()
+        abandoned = worker.add("a.docx", ["secret clause"], _vectors(1))
+        self.clock.now = 30
+        active = worker.add("b.docx", ["b"], _vectors(1))
+        self.clock.now = 61
+        worker.get(active.session_id)
+        self.assertEqual(self._stored_ids(), {active.session_id})
+
+        self.clock.now = 200
+        self.assertEqual(self._worker().purge_expired(), 1)
+        self.assertEqual(self._stored_ids(), set())
+
+
+class SessionDocQATests(unittest.TestCase):
+    def setUp(self):
+        self.settings = Settings(openai_api_key="test", single_flight_enabled=False)
+        for target in (
+            "app.services.session_store.get_settings",
+            "app.services.doc_qa_service.get_settings",
+        ):
+            patcher = patch(target, side_effect=lambda: self.settings)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        session_store.get_store.cache_clear()
+        self.addCleanup(session_store.get_store.cache_clear)
+
+    @staticmethod
+    def _embed(texts):
+        # Deterministic one-hot-ish vectors: texts mentioning "notice" point one way.
+        return np.array([[1.0, 0.0] if "notice" in text.lower() else [0.0, 1.0] for text in texts], dtype=np.float32)
+
+    def test_questions_are_answered_from_the_session_only(self):
+        buffer = BytesIO()
+        doc = Document()
+        doc.add_paragraph("Termination requires ninety days written notice. " * 3)
+        doc.add_paragraph("Payment is due within thirty days of invoice. " * 3)
+        doc.save(buffer)
+
+        with patch("app.services.embedding_service.embed_texts", side_effect=self._embed), patch(
+            "app.services.doc_qa_service.vector_store.get_index"
+        ) as shared_index, patch(
+            "app.services.doc_qa_service.generate_for_task", return_value=LLMResponse("Ninety days [SOURCE 1].")
+        ):
+            session = session_store.create_session("contract.docx", buffer.getvalue())
+            result = doc_qa_service.answer_question("How much notice?", session_id=session.session_id)
+
+        shared_index.assert_not_called()
+        self.assertEqual(result["answer"], "Ninety days [SOURCE 1].")
+        self.assertEqual(result["sources"][0]["source"], "contract.docx")
+        self.assertIn("notice", result["sources"][0]["excerpt"])
+
+    def test_unknown_session_raises(self):
+        with self.assertRaises(SessionNotFoundError):
+            doc_qa_service.answer_question("How much notice?", session_id="missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
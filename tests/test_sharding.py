@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from app.config import Settings
+from app.services import chunker, ingest_service, resilience
+from app.services.dedup import DedupRegistry
+from app.services.memory_index import InMemoryIndex
+from app.services.sharding import ShardedIndex
+
+
+def _vectors(count: int, dim: int = 16, seed: int = 7) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def _payload(vectors: np.ndarray, docs: int = 6) -> list[dict]:
+    return [
+        {"id": f"d{row % docs}-{row}", "values": vector, "metadata": {"doc_id": f"d{row % docs}"}}
+        for row, vector in enumerate(vectors)
+    ]
+
+
+class _SlowIndex(InMemoryIndex):
+    def __init__(self, release: threading.Event) -> None:
+        super().__init__()
+        self.release = release
+
+    def query(self, *args, **kwargs):
+        self.release.wait(2)
+        return super().query(*args, **kwargs)
+
+
+class _BrokenIndex(InMemoryIndex):
+    def query(self, *args, **kwargs):
+        raise ConnectionError("shard down")
+
+
+class ShardedIndexTests(unittest.TestCase):
+    def _sharded(self, **shards) -> ShardedIndex:
+        shards = shards or {name: InMemoryIndex() for name in ("a", "b", "c")}
+        return ShardedIndex(shards, timeout_seconds=0.2)
+
+    def test_merged_top_k_matches_a_single_index(self):
+        vectors = _vectors(120)
+        single, sharded = InMemoryIndex(), self._sharded()
+        single.upsert(_payload(vectors))
+        sharded.upsert(_payload(vectors))
+        query = _vectors(1, seed=99)[0]
+
+        expected = single.query(vector=query, top_k=10)["matches"]
+        merged = sharded.query(vector=query, top_k=10)
+        self.assertEqual([m["id"] for m in merged["matches"]], [m["id"] for m in expected])
+        self.assertNotIn("partial", merged)
+
+    def test_documents_stay_on_one_shard_and_explicit_shards_win(self):
+        sharded = self._sharded()
+        sharded.upsert(_payload(_vectors(30)))
+        for doc in range(6):
+            owners = {
+                name
+                for name, shard in sharded.shards.items()
+                for page in shard.list()
+                for vector_id in page
+                if vector_id.startswith(f"d{doc}-")
+            }
+            self.assertEqual(len(owners), 1)
+
+        sharded.upsert([{"id": "pinned", "values": _vectors(1)[0], "metadata": {"doc_id": "x", "shard": "b"}}])
+        self.assertIn("pinned", sharded.shards["b"].fetch(ids=["pinned"])["vectors"])
+        with self.assertRaises(ValueError):
+            sharded.shard_for({"shard": "zz"})
+
+    def test_slow_and_failing_shards_give_flagged_partial_results(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        sharded = self._sharded(fast=InMemoryIndex(), slow=_SlowIndex(release), broken=_BrokenIndex())
+        sharded.shards["fast"].upsert(_payload(_vectors(5)))
+
+        result = sharded.query(vector=_vectors(1, seed=3)[0], top_k=3)
+        self.assertEqual(len(result["matches"]), 3)
+        self.assertTrue(result["partial"])
+        self.assertEqual(result["missing_shards"], ["broken", "slow"])
+
+    def test_request_deadline_bounds_the_fan_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        sharded = ShardedIndex({"slow": _SlowIndex(release)}, timeout_seconds=5)
+        with resilience.deadline_scope(0.05), self.assertRaises(resilience.DeadlineExceeded):
+            sharded.query(vector=_vectors(1)[0], top_k=3)
+
+    def test_queries_skip_shards_that_cannot_match(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        sharded = self._sharded(eu=InMemoryIndex(), us=InMemoryIndex(), slow=_SlowIndex(release))
+        sharded.upsert([{"id": "eu-0", "values": _vectors(1)[0], "metadata": {"doc_id": "e", "shard": "eu"}}])
+        sharded.upsert([{"id": "us-0", "values": _vectors(1)[0], "metadata": {"doc_id": "u", "shard": "us"}}])
+        query = _vectors(1, seed=3)[0]
+
+        by_filter = sharded.query(vector=query, top_k=3, filter={"shard": {"$in": ["eu"]}})
+        self.assertEqual([match["id"] for match in by_filter["matches"]], ["eu-0"])
+        self.assertNotIn("partial", by_filter)
+        by_name = sharded.query(vector=query, top_k=3, shards=["us"])
+        self.assertEqual([match["id"] for match in by_name["matches"]], ["us-0"])
+        self.assertEqual(sharded.query(vector=query, top_k=3, shards=["us"], filter={"shard": "eu"})["matches"], [])
+        with self.assertRaises(ValueError):
+            sharded.query(vector=query, top_k=3, shards=["zz"])
+
+    def test_id_operations_reach_the_owning_shard(self):
+        sharded = self._sharded()
+        sharded.upsert(_payload(_vectors(12)))
+        sharded.update(id="d1-1", set_metadata={"tag": "x"})
+        self.assertEqual(sharded.fetch(ids=["d1-1"])["vectors"]["d1-1"]["metadata"]["tag"], "x")
+        sharded.delete(ids=["d1-1"])
+        self.assertEqual(sharded.fetch(ids=["d1-1"])["vectors"], {})
+        self.assertEqual(sharded.describe_index_stats()["total_vector_count"], 11)
+        self.assertEqual(sum(len(page) for page in sharded.list(limit=5)), 11)
+
+
+CLAUSE = "This Agreement shall be governed by and construed in accordance with the laws of Delaware."
+
+
+def _fake_embed(texts):
+    return np.stack([np.eye(8, dtype=np.float32)[hash(text) % 8] for text in texts]).reshape(len(texts), 8)
+
+
+class ShardedIngestTests(unittest.TestCase):
+    def setUp(self):
+        self.index = ShardedIndex({"eu": InMemoryIndex(), "us": InMemoryIndex()})
+        settings = Settings(vector_shards=(("eu", None), ("us", None)))
+        patches = [
+            patch("app.services.ingest_service.get_settings", return_value=settings),
+            patch("app.services.ingest_service.embedding_service.embed_texts", side_effect=_fake_embed),
+            patch("app.services.ingest_service.vector_store.get_index", return_value=self.index),
+            patch("app.services.ingest_service.vector_store.get_doc_index", return_value=InMemoryIndex()),
+            patch("app.services.ingest_service.dedup.get_registry", return_value=DedupRegistry()),
+        ]
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+    def _ingest(self, name: str, shard: str | None):
+        path = self.root / name
+        path.touch()
+        with patch("app.services.ingest_service.cpu_pool.run", return_value=chunker.chunk_text(CLAUSE, 200)):
+            return ingest_service.ingest_docx(path, shard=shard)
+
+    def test_pinned_documents_are_not_deduplicated_across_shards(self):
+        eu = self._ingest("eu.docx", "eu")
+        eu_again = self._ingest("eu2.docx", "eu")
+        us = self._ingest("us.docx", "us")
+
+        self.assertEqual(eu["vectors_upserted"], 1)
+        self.assertEqual(eu_again["vectors_upserted"], 0)
+        self.assertEqual(us["vectors_upserted"], 1)
+        self.assertEqual(self.index.shards["eu"].describe_index_stats()["total_vector_count"], 1)
+        self.assertEqual(self.index.shards["us"].describe_index_stats()["total_vector_count"], 1)
+
+    def test_unknown_shard_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self._ingest("x.docx", "apac")
+
+
+if __name__ == "__main__":
+    unittest.main()
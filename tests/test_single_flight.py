@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import metrics, resilience
+from app.services.single_flight import SingleFlight, make_key, normalize_text
+
+
+class SingleFlightTests(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.flights: SingleFlight[int] = SingleFlight("test")
+
+    def test_concurrent_duplicates_share_one_execution(self):
+        calls = 0
+        started = threading.Event()
+        release = threading.Event()
+
+        def work() -> int:
+            nonlocal calls
+            calls += 1
+            started.set()
+            release.wait(timeout=5)
+            return 42
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            leader = pool.submit(self.flights.do, "k", work)
+            started.wait(timeout=5)
+            followers = [pool.submit(self.flights.do, "k", work) for _ in range(4)]
+            # Let followers reach the wait before the leader finishes.
+            deadline = time.time() + 5
+            while metrics.get("single_flight.test.coalesced") < 4 and time.time() < deadline:
+                time.sleep(0.01)
+            release.set()
+            results = [leader.result()] + [f.result() for f in followers]
+
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(calls, 1)
+        self.assertEqual(metrics.get("single_flight.test.executed"), 1)
+        self.assertEqual(metrics.get("single_flight.test.coalesced"), 4)
+
+    def test_errors_propagate_and_key_is_released(self):
+        def boom() -> int:
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            self.flights.do("k", boom)
+        self.assertEqual(self.flights.in_flight(), 0)
+        self.assertEqual(self.flights.do("k", lambda: 7), 7)
+
+    def test_followers_stop_waiting_at_their_own_deadline(self):
+        started = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def work() -> int:
+            started.set()
+            release.wait(timeout=5)
+            return 42
+
+        def follow() -> int:
+            with resilience.deadline_scope(0.05):
+                return self.flights.do("k", work)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(self.flights.do, "k", work)
+            started.wait(timeout=5)
+            began = time.monotonic()
+            with self.assertRaises(resilience.DeadlineExceeded):
+                pool.submit(follow).result(timeout=5)
+            self.assertLess(time.monotonic() - began, 1.0)
+            release.set()
+            self.assertEqual(leader.result(), 42)
+        self.assertEqual(metrics.get("single_flight.test.wait_timeouts"), 1)
+
+    def test_key_normalization(self):
+        self.assertEqual(
+            make_key(normalize_text("What is  the Notice period?"), 5),
+            make_key(normalize_text("what is the notice period?"), 5),
+        )
+        self.assertNotEqual(make_key("q", 5), make_key("q", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from app.services import vector_snapshot
+from app.services.memory_index import InMemoryIndex
+
+
+class VectorSnapshotTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.data = rng.standard_normal((25, 8)).astype(np.float32)
+        self.source = InMemoryIndex()
+        self.source.upsert(
+            vectors=[
+                {"id": f"doc-{i}", "values": row, "metadata": {"chunk_index": i, "doc_id": "doc"}}
+                for i, row in enumerate(self.data)
+            ]
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "snap"
+
+    def test_round_trip_preserves_ids_metadata_and_ranking(self):
+        manifest = vector_snapshot.export_snapshot(self.path, index=self.source, batch_size=7)
+        self.assertEqual((manifest["count"], manifest["dimension"]), (25, 8))
+        self.assertEqual((self.path / "vectors.f32").stat().st_size, 25 * 8 * 4)
+
+        restored = InMemoryIndex()
+        result = vector_snapshot.import_snapshot(self.path, index=restored, batch_size=4, workers=3)
+        self.assertEqual(result["vectors_upserted"], 25)
+
+        query = self.data[11]
+        expected = self.source.query(vector=query, top_k=5, include_metadata=True)["matches"]
+        actual = restored.query(vector=query, top_k=5, include_metadata=True)["matches"]
+        self.assertEqual([m["id"] for m in actual], [m["id"] for m in expected])
+        self.assertEqual(actual[0]["metadata"], {"chunk_index": 11, "doc_id": "doc"})
+
+    def test_int8_snapshot_is_smaller_and_restores(self):
+        vector_snapshot.export_snapshot(self.path, index=self.source, dtype="int8")
+        self.assertEqual((self.path / "vectors.i8").stat().st_size, 25 * 8)
+
+        restored = InMemoryIndex()
+        vector_snapshot.import_snapshot(self.path, index=restored)
+        top = restored.query(vector=self.data[4], top_k=1)["matches"][0]
+        self.assertEqual(top["id"], "doc-4")
+
+    def test_corrupted_file_fails_checksum(self):
+        vector_snapshot.export_snapshot(self.path, index=self.source)
+        with (self.path / "metadata.jsonl").open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps({"id": "extra", "metadata": {}}) + "\n")
+        with self.assertRaises(ValueError):
+            vector_snapshot.import_snapshot(self.path, index=InMemoryIndex())
+
+
+if __name__ == "__main__":
+    unittest.main()